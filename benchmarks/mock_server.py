@@ -0,0 +1,175 @@
+"""
+Local stand-in of the cartociudad, cadastre and census web services
+
+It replays the recorded responses of ``benchmarks/responses`` for the geocoder, reverseGeocode, route,
+Consulta_RCCOOR and INE WMS endpoints, with configurable latency and error injection. The clients of the package are
+pointed to it with ``MockClient`` and ``MockAsyncClient``, which rewrite the host of every requested URL.
+"""
+
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from pycartociudad.aio import AsyncClient
+from pycartociudad.client import Client
+
+RESPONSES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "responses")
+
+# endpoint name, last segment of its path, file of its recorded response and content type
+ENDPOINTS = (
+    ("geocode", "findJsonp", "geocoder.jsonp", "application/javascript;charset=UTF-8"),
+    ("reverse_geocode", "reverseGeocode", "reverse_geocode.json", "application/json;charset=UTF-8"),
+    ("route", "route", "route.json", "application/json;charset=UTF-8"),
+    ("cadastre", "Consulta_RCCOOR", "cadastre.xml", "text/xml; charset=utf-8"),
+    ("census", "WMSServer", "census.xml", "text/xml"),
+)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """HTTP server answering every connection in its own thread"""
+
+    daemon_threads = True
+
+
+class MockServer:
+    """Threaded HTTP server replaying the recorded responses on a local port.
+
+    Parameters
+    ----------
+    latency: float
+        Seconds every response is delayed (default 0)
+
+    jitter: float
+        Maximum random seconds added to the latency (default 0)
+
+    error_rate: float
+        Fraction of the requests answered with ``error_status`` instead of the recorded response (default 0)
+
+    error_status: int
+        HTTP status of the injected errors (default 503)
+
+    port: int
+        Local port to listen on. Default value is 0, any free port.
+
+    responses_dir: str
+        Directory with the recorded responses (default ``benchmarks/responses``)
+
+    seed: int (optional)
+        Seed of the latency jitter and the error injection, for reproducible runs
+    """
+
+    def __init__(self, latency: float = 0, jitter: float = 0, error_rate: float = 0, error_status: int = 503,
+                 port: int = 0, responses_dir: str = RESPONSES_DIR, seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = {name: 0 for name, *_ in ENDPOINTS}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._responses = {}
+        for name, segment, filename, content_type in ENDPOINTS:
+            with open(os.path.join(responses_dir, filename), "rb") as f:
+                self._responses[segment] = (name, f.read(), content_type)
+
+        self._server = _ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the server, e.g. http://127.0.0.1:8123"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        """Starts serving in a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the listening socket"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        """Resets the request counters"""
+        with self._lock:
+            self.requests = {name: 0 for name in self.requests}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _answer(self, path: str):
+        """Returns the (status, body, content type) of a request path"""
+        segment = path.rsplit("/", 1)[-1]
+        if segment not in self._responses:
+            return 404, b"Not found", "text/plain"
+        name, body, content_type = self._responses[segment]
+        with self._lock:
+            self.requests[name] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter) if self.jitter else self.latency
+            failed = self.error_rate and self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return self.error_status, b"<html>Service unavailable</html>", "text/html"
+        return 200, body, content_type
+
+
+def _handler(server: MockServer):
+    """Builds the request handler class of a server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive, so the connection pools of the clients are exercised as with the real services
+        protocol_version = "HTTP/1.1"
+        # headers and body are written separately; don't let Nagle delay the body until the headers are acked
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            status, body, content_type = server._answer(urllib.parse.urlsplit(self.path).path)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _redirect(url: str, base_url: str) -> str:
+    """Replaces the scheme and host of a URL by the ones of the base URL"""
+    parts = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit(urllib.parse.urlsplit(base_url)[:2] + parts[2:])
+
+
+class MockClient(Client):
+    """Client sending every request to a mock server instead of the real services"""
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def get(self, url: str, params=None, timeout=None, deadline: float = None):
+        return super().get(_redirect(url, self.base_url), params, timeout, deadline)
+
+
+class MockAsyncClient(AsyncClient):
+    """Async client sending every request to a mock server instead of the real services"""
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    async def get(self, url: str, params=None, timeout=None, deadline: float = None):
+        return await super().get(_redirect(url, self.base_url), params, timeout, deadline)
@@ -0,0 +1,304 @@
+"""
+Offline benchmarks of the public functions against the local mock server
+
+Measures the throughput, the p50/p99 latency and the peak memory of every public function in single-call, batch and
+async modes. The results can be saved as JSON and compared with a previous run, failing when any scenario regresses
+more than a tolerance, so regressions show up in CI::
+
+    python -m benchmarks.run --json baseline.json
+    python -m benchmarks.run --baseline baseline.json --tolerance 0.25
+
+The latency and the errors of the mock server are configurable to benchmark the retries and the concurrency under
+slow or failing services, e.g. ``--latency 0.05 --jitter 0.05 --error-rate 0.01``.
+
+The cold import time of the package is measured too, in fresh interpreters, so the startup of command line tools
+and serverless functions doesn't regress.
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+import pycartociudad as pycc
+from benchmarks.mock_server import MockAsyncClient, MockClient, MockServer
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+# metrics compared with the baseline, and whether higher values are better
+COMPARED_METRICS = (("throughput", True), ("p50_ms", False), ("p99_ms", False), ("peak_kib", False),
+                    ("modules", False))
+
+# statements whose cold import time is measured, by scenario name
+IMPORTS = {
+    "pycartociudad": "import pycartociudad",
+    "geocode": "from pycartociudad import geocode",
+    "get_location_info": "from pycartociudad import get_location_info",
+}
+
+# script run in a fresh interpreter, printing the seconds of an import and the number of modules it loaded
+_IMPORT_SCRIPT = """
+import sys, time
+before = len(sys.modules)
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start, len(sys.modules) - before)
+"""
+
+
+def _address(i: int) -> str:
+    return f"calle miguel servet {i}, zaragoza"
+
+
+def _point(i: int):
+    return 40.4 + (i % 1000) * 1e-4, -3.7 - (i // 1000) * 1e-4
+
+
+def _timed_calls(func: Callable, calls: int) -> List[float]:
+    """Calls ``func(i)`` sequentially, returning the seconds of every call or None for the failed ones"""
+    latencies = []
+    for i in range(calls):
+        start = time.perf_counter()
+        try:
+            func(i)
+        except Exception:
+            latencies.append(None)
+            continue
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _timed_results(results, start: float) -> List[float]:
+    """Returns the seconds from the start of a batch to each of its results, or None for the failed ones"""
+    return [None if isinstance(result, Exception) else time.perf_counter() - start for _, result in results]
+
+
+def _single(name: str, func: Callable):
+    def run(server, calls, workers):
+        client = MockClient(server.url)
+        try:
+            return _timed_calls(lambda i: func(i, client), calls)
+        finally:
+            client.close()
+    return name, "single", run
+
+
+def _batch(name: str, func: Callable):
+    def run(server, calls, workers):
+        client = MockClient(server.url, pool_maxsize=workers)
+        try:
+            return func(calls, workers, client)
+        finally:
+            client.close()
+    return name, "batch", run
+
+
+def _async(name: str, func: Callable):
+    def run(server, calls, workers):
+        async def timed(i, client):
+            start = time.perf_counter()
+            try:
+                await func(i, client)
+            except Exception:
+                return None
+            return time.perf_counter() - start
+
+        async def main():
+            async with MockAsyncClient(server.url, max_concurrency=workers, limit_per_host=workers) as client:
+                return await asyncio.gather(*(timed(i, client) for i in range(calls)))
+
+        return asyncio.run(main())
+    return name, "async", run
+
+
+def _geocode_many(calls, workers, client):
+    start = time.perf_counter()
+    addresses = [_address(i) for i in range(calls)]
+    return _timed_results(pycc.geocode_many(addresses, max_workers=workers, client=client), start)
+
+
+def _reverse_geocode_many(calls, workers, client):
+    # a dense trace, a point every meter, as reverse geocoded from vehicle telemetry
+    start = time.perf_counter()
+    points = [(40.4 + i / 111_320, -3.7) for i in range(calls)]
+    return _timed_results(pycc.reverse_geocode_many(points, max_workers=workers, client=client), start)
+
+
+def _get_location_info_many(calls, workers, client):
+    start = time.perf_counter()
+    points = [_point(i) for i in range(calls)]
+    return _timed_results(pycc.get_location_info_many(points, max_workers=workers, client=client), start)
+
+
+def _route_matrix(calls, workers, client):
+    # a square matrix with about as many legs as calls; only the whole matrix is timed
+    size = max(1, int(calls ** 0.5))
+    points = [_point(i) for i in range(size)]
+    start = time.perf_counter()
+    pycc.route_matrix(points, points, vehicle=True, max_workers=workers, client=client)
+    return [time.perf_counter() - start]
+
+
+def scenarios() -> list:
+    """Returns the (name, mode, run) of every benchmark whose dependencies are installed"""
+    from pycartociudad import aio
+
+    result = [
+        _single("geocode", lambda i, client: pycc.geocode(_address(i), client=client)),
+        _single("reverse_geocode", lambda i, client: pycc.reverse_geocode(*_point(i), client=client)),
+        _single("route_between_two_points",
+                lambda i, client: pycc.route_between_two_points(40.4473, -3.7044, *_point(i), vehicle=True,
+                                                                client=client)),
+        _single("get_location_info", lambda i, client: pycc.get_location_info(*_point(i), client=client)),
+        _batch("geocode_many", _geocode_many),
+        _batch("reverse_geocode_many", _reverse_geocode_many),
+        _batch("get_location_info_many", _get_location_info_many),
+    ]
+    if numpy is not None:
+        result.append(_batch("route_matrix", _route_matrix))
+    if aiohttp is not None:
+        result.extend([
+            _async("geocode", lambda i, client: aio.geocode(_address(i), client=client)),
+            _async("reverse_geocode", lambda i, client: aio.reverse_geocode(*_point(i), client=client)),
+            _async("route_between_two_points",
+                   lambda i, client: aio.route_between_two_points(40.4473, -3.7044, *_point(i), vehicle=True,
+                                                                  client=client)),
+            _async("get_location_info", lambda i, client: aio.get_location_info(*_point(i), client=client)),
+        ])
+    return result
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of the values, or None if there are none"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def measure(server: MockServer, run: Callable, calls: int, workers: int) -> dict:
+    """Runs a benchmark twice: timed, and then under ``tracemalloc`` to get its peak memory"""
+    server.reset()
+    start = time.perf_counter()
+    latencies = run(server, calls, workers)
+    seconds = time.perf_counter() - start
+    requests = sum(server.requests.values())
+
+    tracemalloc.start()
+    try:
+        run(server, calls, workers)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    succeeded = [latency for latency in latencies if latency is not None]
+    p50, p99 = percentile(succeeded, 0.5), percentile(succeeded, 0.99)
+    return {
+        "calls": calls,
+        "errors": len(latencies) - len(succeeded),
+        "requests": requests,
+        "seconds": seconds,
+        "throughput": calls / seconds if seconds else None,
+        "p50_ms": p50 * 1000 if p50 is not None else None,
+        "p99_ms": p99 * 1000 if p99 is not None else None,
+        "peak_kib": peak / 1024,
+    }
+
+
+def measure_import(statement: str, repeat: int) -> dict:
+    """Measures the cold import time of a statement, running it ``repeat`` times in fresh interpreters"""
+    seconds, modules = [], 0
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_SCRIPT.format(statement=statement)], check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+        seconds.append(float(output[0]))
+        modules = int(output[1])
+    return {
+        "calls": repeat,
+        "p50_ms": percentile(seconds, 0.5) * 1000,
+        "p99_ms": percentile(seconds, 0.99) * 1000,
+        "modules": modules,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns the description of the metrics worse than the baseline by more than the tolerance"""
+    regressions = []
+    for key, metrics in results.items():
+        for metric, higher_is_better in COMPARED_METRICS:
+            value, reference = metrics.get(metric), baseline.get(key, {}).get(metric)
+            if value is None or not reference:
+                continue
+            change = value / reference - 1
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{key} {metric}: {reference:.2f} -> {value:.2f} ({change:+.0%})")
+    return regressions
+
+
+def _format(value, spec: str) -> str:
+    return "-" if value is None else format(value, spec)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200, help="calls of every scenario (default 200)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrency of the batch and async modes")
+    parser.add_argument("--latency", type=float, default=0, help="seconds of latency of the mock server")
+    parser.add_argument("--jitter", type=float, default=0, help="maximum random seconds added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with a 503")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the jitter and the error injection")
+    parser.add_argument("--imports", type=int, default=10,
+                        help="fresh interpreters measuring the import time of the package (default 10)")
+    parser.add_argument("--only", help="run only the scenarios whose name contains this text")
+    parser.add_argument("--json", help="file to save the results to")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="maximum relative regression against the baseline (default 0.25)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'scenario':<34}{'calls/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>11}{'errors':>8}")
+    for name, statement in IMPORTS.items() if args.imports > 0 else ():
+        key = f"{name}[import]"
+        if args.only and args.only not in key:
+            continue
+        metrics = results[key] = measure_import(statement, args.imports)
+        print(f"{key:<34}{'-':>10}{metrics['p50_ms']:10.2f}{metrics['p99_ms']:10.2f}{'-':>11}{'-':>8}"
+              f"  ({metrics['modules']} modules)")
+    with MockServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed) as server:
+        for name, mode, run in scenarios():
+            key = f"{name}[{mode}]"
+            if args.only and args.only not in key:
+                continue
+            metrics = results[key] = measure(server, run, args.calls, args.workers)
+            print(f"{key:<34}{_format(metrics['throughput'], '10.1f')}{_format(metrics['p50_ms'], '10.2f')}"
+                  f"{_format(metrics['p99_ms'], '10.2f')}{_format(metrics['peak_kib'], '11.1f')}"
+                  f"{metrics['errors']:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
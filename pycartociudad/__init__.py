@@ -4,8 +4,62 @@ __author__ = """PyLadies Madrid"""
 __email__ = "madrid@pyladies.com"
 __version__ = '0.1.0'
 
-# Explicit import of the public functions
-from .geocode import geocode
-from .reverse_geocode import reverse_geocode
-from .get_location_info import get_location_info
-from .route_between_two_points import route_between_two_points
+import importlib
+import sys
+import types
+
+# Public names and the submodules defining them. They are imported on first access (PEP 562), so importing the
+# package doesn't load requests, xml, numpy and the rest of the heavy dependencies until they are needed.
+_EXPORTS = {
+    "geocode": "geocode", "geocode_many": "geocode",
+    "reverse_geocode": "reverse_geocode", "reverse_geocode_many": "reverse_geocode",
+    "get_location_info": "get_location_info", "get_location_info_many": "get_location_info",
+    "route_between_two_points": "route_between_two_points",
+    "route_matrix": "route_matrix",
+    "normalize_address": "normalize",
+    "Client": "client", "deadline": "client", "get_default_client": "client", "set_default_client": "client",
+    "QuantizedLRUCache": "cache", "SQLiteCache": "cache", "TieredCache": "cache",
+    "CensusIndex": "census_index",
+    "LocalGeocoder": "local_geocoder",
+    "LocalRouter": "local_router",
+    "Throttle": "throttle",
+    "Cassette": "transport", "RecordingTransport": "transport", "ReplayTransport": "transport",
+    "RequestsTransport": "transport", "Transport": "transport",
+    "CartociudadError": "exceptions", "DeadlineExceeded": "exceptions", "ReplayMissError": "exceptions",
+    "RouteNotFoundError": "exceptions", "ServiceError": "exceptions",
+    "GeocodeResult": "results", "LocationInfo": "results", "RouteResult": "results",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name: str):
+    """Imports the public names on first access"""
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+class _Package(types.ModuleType):
+    """Package module keeping the public functions named as their submodules (``geocode``, ``route_matrix``, ...)
+    when the import system binds those submodules to the package."""
+
+    def __setattr__(self, name, value):
+        if isinstance(value, types.ModuleType) and _EXPORTS.get(name) == name:
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
+
+if sys.version_info < (3, 7):  # pragma: no cover
+    # module __getattr__ is not supported, so every public name is imported eagerly
+    for _name in __all__:
+        __getattr__(_name)
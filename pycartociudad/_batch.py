@@ -0,0 +1,161 @@
+"""
+Bounded-concurrency execution of a function over a stream of items, shared by the batch functions
+"""
+
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Iterable, Iterator, Tuple
+
+from pycartociudad.client import _deadline_at
+from pycartociudad.exceptions import DeadlineExceeded
+
+# marks the end of the input items
+_END = object()
+
+
+def _remaining(end: float) -> float:
+    """Returns the seconds left until ``end``, or None if there is no end"""
+    return None if end is None else max(0, end - time.monotonic())
+
+
+def _outcome(future, end: float = None):
+    """Returns the result of a future, or the raised exception instance. If it isn't finished by ``end``, returns a
+    ``DeadlineExceeded`` instance."""
+    try:
+        return future.result(timeout=_remaining(end))
+    except FutureTimeoutError:
+        return DeadlineExceeded("Time budget exhausted")
+    except Exception as err:
+        return err
+
+
+def imap_unique(func: Callable, items: Iterable, key: Callable = None, max_workers: int = 8,
+                ordered: bool = True, window: int = None, dedupe: bool = True,
+                time_budget: float = None) -> Iterator[Tuple[object, object]]:
+    """Applies ``func`` to every item using a pool of threads, calling it once per unique key.
+
+    Items are pulled lazily from ``items``, so at most ``window`` of them are held at any time
+    (besides one result per unique key, needed for the deduplication of the whole stream).
+
+    Parameters
+    ----------
+    func: callable
+        Function called with a single item
+
+    items: iterable
+        Items to process. Any iterable is allowed, including generators.
+
+    key: callable (optional)
+        Function returning the deduplication key of an item. Default value is None, which uses the item itself.
+
+    max_workers: int
+        Maximum number of concurrent calls to ``func`` (default 8)
+
+    ordered: bool
+        If True (default), results are yielded in the same order as the items. Otherwise they are
+        yielded as soon as they are ready.
+
+    window: int (optional)
+        Maximum number of items pulled but not yet yielded. Default value is ``4 * max_workers``.
+
+    dedupe: bool
+        If True (default), every unique key is processed once in the whole stream, keeping its result in
+        memory until the end. If False, only the items with the same key pulled at the same time share the
+        call, and memory stays constant however long the stream is.
+
+    time_budget: float (optional)
+        Maximum seconds for the whole stream. The requests performed by ``func`` are bounded by the time left, and
+        the items not processed in time get a ``DeadlineExceeded`` result. Default value is None, no limit.
+
+    Returns
+    -------
+    results: a generator of (item, result) tuples, where result is the exception instance if ``func`` raised one
+    """
+    key = key or (lambda item: item)
+    window = window or 4 * max_workers
+    end = time.monotonic() + time_budget if time_budget is not None else None
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {}
+    # number of pulled items not yet yielded by key, to forget their result when not deduping the whole stream
+    pending = {}
+
+    def run(item):
+        if end is None:
+            return func(item)
+        if time.monotonic() >= end:
+            raise DeadlineExceeded("Time budget exhausted")
+        with _deadline_at(end):
+            return func(item)
+
+    def submit(item):
+        item_key = key(item)
+        future = futures.get(item_key)
+        if future is None:
+            future = executor.submit(run, item)
+            futures[item_key] = future
+        if not dedupe:
+            pending[item_key] = pending.get(item_key, 0) + 1
+        return future
+
+    def release(item):
+        if not dedupe:
+            item_key = key(item)
+            pending[item_key] -= 1
+            if not pending[item_key]:
+                del pending[item_key]
+                del futures[item_key]
+
+    iterator = iter(items)
+    try:
+        if ordered:
+            queue = deque()
+            while True:
+                while len(queue) < window:
+                    item = next(iterator, _END)
+                    if item is _END:
+                        break
+                    queue.append((item, submit(item)))
+                if not queue:
+                    break
+                item, future = queue.popleft()
+                release(item)
+                yield item, _outcome(future, end)
+        else:
+            waiting = {}
+            outstanding = 0
+            exhausted = False
+            while True:
+                ready = []
+                while not exhausted and outstanding < window:
+                    item = next(iterator, _END)
+                    if item is _END:
+                        exhausted = True
+                        break
+                    future = submit(item)
+                    if future.done():
+                        ready.append((item, future))
+                    else:
+                        waiting.setdefault(future, []).append(item)
+                    outstanding += 1
+                for item, future in ready:
+                    outstanding -= 1
+                    release(item)
+                    yield item, _outcome(future)
+                if not waiting:
+                    if exhausted:
+                        break
+                    continue
+                done, _ = wait(waiting, timeout=_remaining(end), return_when=FIRST_COMPLETED)
+                # when the time budget runs out, every pending item is done
+                for future in done or list(waiting):
+                    for item in waiting.pop(future):
+                        outstanding -= 1
+                        release(item)
+                        yield item, _outcome(future, end)
+    finally:
+        # the generator may be closed before consuming every item
+        for future in list(futures.values()):
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,71 @@
+"""
+Decoding of the raw response bodies of the web services, shared by the sync and asyncio functions
+
+The JSON bodies are parsed straight from the response bytes with ``orjson`` when it is installed
+(``pip install pycartociudad[fast]``), or with the standard library otherwise. JSONP wrappers are stripped with a
+memoryview slice, so the body is never copied before parsing.
+"""
+
+import json
+import time
+import xml.etree.ElementTree as ET
+from typing import Union
+
+from pycartociudad import instrumentation
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# prefix of the JSONP responses of the geocoder
+JSONP_PREFIX = b"callback("
+
+# bytes allowed after the closing parenthesis of the JSONP wrapper
+_JSONP_TRAILING = b" \t\r\n;"
+
+
+def loads(content: Union[bytes, memoryview, str], endpoint: str = None):
+    """Parses a JSON document from its UTF-8 bytes (or a memoryview of them).
+
+    Raises ``json.JSONDecodeError`` if it is invalid, whichever the backend. The decoding time is reported to the
+    instrumentation hooks if an endpoint is given.
+    """
+    if endpoint is not None and instrumentation.enabled():
+        return _timed(loads, content, endpoint)
+    if orjson is not None:
+        return orjson.loads(content)
+    if isinstance(content, memoryview):
+        content = str(content, "utf-8")
+    return json.loads(content)
+
+
+def loads_jsonp(content: bytes, endpoint: str = None):
+    """Parses a JSONP document, e.g. ``callback({...})``, from its UTF-8 bytes. Plain JSON is parsed as is."""
+    if endpoint is not None and instrumentation.enabled():
+        return _timed(loads_jsonp, content, endpoint)
+    start, end = 0, len(content)
+    if content.startswith(JSONP_PREFIX):
+        start = len(JSONP_PREFIX)
+        while end > start and content[end - 1] in _JSONP_TRAILING:
+            end -= 1
+        if content[end - 1:end] == b")":
+            end -= 1
+    return loads(memoryview(content)[start:end])
+
+
+def parse_xml(content: bytes, endpoint: str = None) -> ET.Element:
+    """Parses an XML document from its bytes, using the encoding of its declaration"""
+    if endpoint is not None and instrumentation.enabled():
+        return _timed(parse_xml, content, endpoint)
+    return ET.fromstring(content)
+
+
+def _timed(decode, content: bytes, endpoint: str):
+    """Decodes a document, reporting the time it took to the instrumentation hooks"""
+    start = time.monotonic()
+    try:
+        return decode(content)
+    finally:
+        instrumentation.emit(instrumentation.Event(instrumentation.DECODE, endpoint, size=len(content),
+                                                   duration=time.monotonic() - start))
@@ -0,0 +1,54 @@
+"""
+Grid index of points, used to reuse the answers of nearby points in the batch functions
+"""
+
+import math
+from typing import Hashable, Tuple
+
+from pycartociudad.cache import METERS_PER_DEGREE
+
+
+class PointGrid:
+    """Index of points in square cells of ``radius`` meters, finding the closest indexed point within that radius of
+    a query in constant time. Distances use the equirectangular approximation, accurate at these scales.
+
+    Parameters
+    ----------
+    radius: float
+        Search radius in meters; it must be positive
+    """
+
+    def __init__(self, radius: float):
+        if not radius > 0:
+            raise ValueError("The radius must be positive")
+        self.radius = radius
+        self._step = radius / METERS_PER_DEGREE
+        self._cells = {}
+
+    def __len__(self) -> int:
+        return sum(len(points) for points in self._cells.values())
+
+    def _cell(self, row: int, longitude: float) -> Tuple[int, int]:
+        """Returns the cell of a longitude in a row. The cells of every row are as wide in meters as they are high."""
+        scale = max(math.cos(math.radians((row + 0.5) * self._step)), 1e-6)
+        return row, math.floor(longitude * scale / self._step)
+
+    def nearest(self, latitude: float, longitude: float) -> Hashable:
+        """Returns the key of the closest indexed point within the radius, or None if there is none"""
+        row = math.floor(latitude / self._step)
+        scale = math.cos(math.radians(latitude)) * METERS_PER_DEGREE
+        best, best_distance = None, self.radius ** 2
+        for neighbour_row in (row - 1, row, row + 1):
+            neighbour_row, column = self._cell(neighbour_row, longitude)
+            for neighbour_column in (column - 1, column, column + 1):
+                for point_latitude, point_longitude, key in self._cells.get((neighbour_row, neighbour_column), ()):
+                    distance = (((point_latitude - latitude) * METERS_PER_DEGREE) ** 2
+                                + ((point_longitude - longitude) * scale) ** 2)
+                    if distance <= best_distance:
+                        best, best_distance = key, distance
+        return best
+
+    def add(self, latitude: float, longitude: float, key: Hashable):
+        """Indexes a point under a key"""
+        cell = self._cell(math.floor(latitude / self._step), longitude)
+        self._cells.setdefault(cell, []).append((latitude, longitude, key))
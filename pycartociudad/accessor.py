@@ -0,0 +1,243 @@
+"""
+``DataFrame.cartociudad`` accessor to geocode, reverse geocode and enrich whole pandas columns
+
+Importing this module registers the accessor. Every distinct value (or point) of the columns is requested once,
+concurrently, and the output columns are built directly as typed arrays: float64 coordinates, nullable integers and
+categorical administrative units. The portal numbers are kept as returned, as some aren't numbers (e.g. "12B").
+Requires ``pandas`` (``pip install pycartociudad[pandas]``).
+"""
+
+from typing import Callable, List, Sequence
+
+import numpy as np
+
+from pycartociudad._batch import imap_unique
+from pycartociudad.client import Client, get_default_client
+from pycartociudad.geocode import geocode
+from pycartociudad.normalize import normalize_address
+from pycartociudad.get_location_info import (
+    CADASTRE_SOURCE, CENSUS_SOURCE, GEOCODING_SOURCE, _check_sources, get_location_info_many
+)
+from pycartociudad.results import GEOCODE_FIELDS
+from pycartociudad.reverse_geocode import reverse_geocode
+
+try:
+    import pandas as pd
+except ImportError:  # pragma: no cover
+    raise ImportError("pandas is required for the DataFrame accessor: pip install pycartociudad[pandas]") from None
+
+# output dtype of the fields; the rest are object columns
+FLOAT_FIELDS = frozenset(["lat", "lng"])
+# the portal numbers are not cast, as some of them aren't numbers (e.g. "12B" or "S/N")
+INTEGER_FIELDS = frozenset(["state", "priority"])
+CATEGORICAL_FIELDS = frozenset(["province", "comunidadAutonoma", "muni", "type", "postalCode", "poblacion", "tip_via",
+                                "stateMsg", "countryCode", "census_section", "district_code"])
+
+# column with the error of the rows whose lookup failed
+ERROR_FIELD = "error"
+
+
+@pd.api.extensions.register_dataframe_accessor("cartociudad")
+class CartociudadAccessor:
+    """Accessor available as ``DataFrame.cartociudad`` once ``pycartociudad.accessor`` is imported.
+
+    Every method returns a new DataFrame with the same index, one column per requested field plus an ``error``
+    column, ready to be joined to the original one (e.g. ``df.join(df.cartociudad.geocode("address"))``).
+    """
+
+    def __init__(self, df: "pd.DataFrame"):
+        self._df = df
+
+    def geocode(self, column: str, fields: List[str] = None, prefix: str = "", max_workers: int = 8,
+                client: Client = None) -> "pd.DataFrame":
+        """Geocodes the addresses of a column. Every distinct normalized address is only requested once.
+
+        Parameters
+        ----------
+        column: str
+            Column with the full addresses
+
+        fields: list of str (optional)
+            Fields of the ``geocode`` results to output. Default value is None, all the fields.
+
+        prefix: str
+            Prefix of the output columns (default "")
+
+        max_workers: int
+            Maximum number of concurrent requests (default 8)
+
+        client: Client (optional)
+            HTTP client used to perform the requests. Default value is None and will use the shared default client.
+
+        Returns
+        -------
+        geolocations: a DataFrame with the fields of the geocoding of every row. The rows without address or whose
+        geocoding failed are null.
+        """
+        client = client or get_default_client()
+        codes, addresses = _factorize_addresses(self._df[column])
+
+        def lookup(i):
+            return geocode(addresses[i], client=client)
+
+        results = _lookup_unique(lookup, len(addresses), max_workers)
+        return _build_frame(results, codes, self._df.index, fields or list(GEOCODE_FIELDS), prefix)
+
+    def reverse_geocode(self, lat_column: str = "lat", lon_column: str = "lon", cadastral: bool = False,
+                        fields: List[str] = None, prefix: str = "", max_workers: int = 8,
+                        client: Client = None) -> "pd.DataFrame":
+        """Reverse geocodes the points of two columns.
+
+        Parameters
+        ----------
+        lat_column, lon_column: str
+            Columns with the latitudes and longitudes in geographical coordinates (default "lat" and "lon")
+
+        cadastral: bool
+            Set to True to perform a cadastral reverse geocoding (default False)
+
+        fields, prefix, max_workers, client:
+            As in ``geocode``
+
+        Returns
+        -------
+        addresses: a DataFrame with the fields of the reverse geocoding of every row. The rows without coordinates
+        or whose reverse geocoding failed are null.
+        """
+        client = client or get_default_client()
+        codes, points = _factorize_points(self._df[lat_column], self._df[lon_column])
+
+        def lookup(i):
+            return reverse_geocode(points[i, 0], points[i, 1], cadastral=cadastral, client=client)
+
+        results = _lookup_unique(lookup, len(points), max_workers)
+        return _build_frame(results, codes, self._df.index, fields or list(GEOCODE_FIELDS), prefix)
+
+    def location_info(self, lat_column: str = "lat", lon_column: str = "lon", sources: List[str] = None,
+                      fields: List[str] = None, prefix: str = "", max_workers: int = 8,
+                      client: Client = None) -> "pd.DataFrame":
+        """Retrieves the location info of the points of two columns.
+
+        Parameters
+        ----------
+        lat_column, lon_column: str
+            Columns with the latitudes and longitudes in geographical coordinates (default "lat" and "lon")
+
+        sources: list of str
+            Sources to retrieve the data from. Allowed values are ["cadastre", "census", "geocoding"].
+            Default value is None and will retrieve the data from all the sources.
+
+        fields, prefix, max_workers, client:
+            As in ``geocode``. The default fields are the ones of the selected sources.
+
+        Returns
+        -------
+        location_information: a DataFrame with the fields of the location info of every row. The fields of the
+        failed sources are null and their errors are reported in the error column.
+        """
+        sources = _check_sources(sources)
+        client = client or get_default_client()
+        codes, points = _factorize_points(self._df[lat_column], self._df[lon_column])
+
+        infos = get_location_info_many(((lat, lon) for lat, lon in points), sources=sources,
+                                       max_workers=max_workers, client=client)
+        results = [info for _, info in infos]
+
+        if fields is None:
+            fields = []
+            if CADASTRE_SOURCE in sources:
+                fields.append("cadastral_ref")
+            if CENSUS_SOURCE in sources:
+                fields.extend(["census_section", "district_code"])
+            if GEOCODING_SOURCE in sources:
+                fields.extend(GEOCODE_FIELDS)
+        return _build_frame(results, codes, self._df.index, fields, prefix)
+
+
+def _factorize_addresses(addresses: "pd.Series"):
+    """Returns the index of the distinct normalized address of every row (-1 if it has no address) and an address of
+    every distinct normalized address"""
+    column = addresses.to_numpy(dtype=object)
+    keys = addresses.map(lambda address: normalize_address(address) or None, na_action="ignore")
+    codes, _ = pd.factorize(keys, sort=False)
+    distinct, first = np.unique(codes, return_index=True)
+    return codes, column[first[distinct >= 0]]
+
+
+def _factorize_points(latitudes: "pd.Series", longitudes: "pd.Series"):
+    """Returns the index of the distinct point of every row (-1 if it has null coordinates) and the distinct
+    points as a (N, 2) array"""
+    lats = pd.to_numeric(latitudes, errors="coerce").to_numpy(dtype=np.float64)
+    lons = pd.to_numeric(longitudes, errors="coerce").to_numpy(dtype=np.float64)
+    valid = ~(np.isnan(lats) | np.isnan(lons))
+    points, inverse = np.unique(np.column_stack([lats[valid], lons[valid]]), axis=0, return_inverse=True)
+    codes = np.full(len(lats), -1, dtype=np.intp)
+    codes[valid] = inverse.reshape(-1)
+    return codes, points
+
+
+def _lookup_unique(lookup: Callable, count: int, max_workers: int) -> list:
+    """Calls ``lookup`` concurrently with the index of every distinct value, returning the results in order"""
+    results = [None] * count
+    for i, result in imap_unique(lookup, range(count), max_workers=max_workers, ordered=False, dedupe=False):
+        results[i] = result
+    return results
+
+
+def _build_frame(results: list, codes: np.ndarray, index: "pd.Index", fields: Sequence[str],
+                 prefix: str) -> "pd.DataFrame":
+    """Builds the output columns from the results of the distinct values and the distinct value of every row.
+
+    The arrays of the distinct values get an extra null element at the end, which is picked by the -1 codes of the
+    rows without value.
+    """
+    errors = _object_array([_error_message(result) for result in results])
+    results = [result if isinstance(result, dict) else {} for result in results]
+
+    columns = {}
+    for field in fields:
+        values = [result.get(field) for result in results]
+        if field in FLOAT_FIELDS:
+            column = np.array([_to_float(value) for value in values] + [np.nan], dtype=np.float64)[codes]
+        elif field in INTEGER_FIELDS:
+            column = pd.array([_to_int(value) for value in values] + [None], dtype="Int64").take(codes)
+        elif field in CATEGORICAL_FIELDS:
+            category_codes, categories = pd.factorize(_object_array(values))
+            column = pd.Categorical.from_codes(category_codes[codes], categories=categories)
+        else:
+            # explicit object dtype, so pandas doesn't infer string columns turning the None into NaN
+            column = pd.Series(_object_array(values)[codes], index=index, dtype=object)
+        columns[f"{prefix}{field}"] = column
+    columns[f"{prefix}{ERROR_FIELD}"] = pd.Series(errors[codes], index=index, dtype=object)
+
+    return pd.DataFrame(columns, index=index)
+
+
+def _object_array(values: list) -> np.ndarray:
+    """Builds a 1-D object array of the values plus a trailing None, even if the values are sequences"""
+    array = np.empty(len(values) + 1, dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _error_message(result) -> str:
+    """Returns the error of a failed lookup, or of the failed sources of a location info, or None"""
+    if isinstance(result, Exception):
+        return repr(result)
+    errors = result.get("errors") if result else None
+    return "; ".join(f"{source}: {error!r}" for source, error in errors.items()) if errors else None
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,666 @@
+"""
+Asyncio versions of the pycartociudad functions
+
+They run on a shared ``AsyncClient`` which limits the number of requests in flight with a semaphore, so
+thousands of calls can be awaited concurrently from a single event loop. Requires ``aiohttp``
+(``pip install pycartociudad[aio]``).
+"""
+
+import asyncio
+import datetime
+import threading
+import time
+import types
+import urllib.parse
+from collections import deque
+from typing import Dict, List, Union
+
+import requests
+
+from pycartociudad.client import (
+    DEFAULT_TIMEOUT, LATENCY_WINDOW, MIN_HEDGE_SAMPLES, RETRY_STATUSES, _bounded_timeout, backoff_delay
+)
+from pycartociudad import instrumentation
+from pycartociudad.exceptions import DeadlineExceeded
+from pycartociudad.geocode import _build_url as _geocode_url, _parse_response as _parse_geocode
+from pycartociudad.get_location_info import (
+    CADASTRE_SOURCE, CADASTRE_URL, CENSUS_SOURCE, CENSUS_URL, _census_params, _check_sources, _merge_sources,
+    _parse_cadastral_reference, _parse_census_info
+)
+from pycartociudad.normalize import normalize_address
+from pycartociudad.reverse_geocode import (
+    REVERSE_GEOCODE_URL, _build_params as _reverse_geocode_params, _handle_response as _handle_reverse_geocode
+)
+from pycartociudad.route_between_two_points import (
+    _add_arrays as _add_route_arrays, _build_url as _route_url, _handle_response as _handle_route
+)
+from pycartociudad.results import GeocodeResult, LocationInfo, RouteResult
+from pycartociudad.singleflight import AsyncSingleFlight
+from pycartociudad.transport import Cassette, _cassette, request_key
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+# errors of an attempt that are retried: timeouts, connection errors and the aiohttp client errors, which are not
+# all OSError subclasses (e.g. ServerDisconnectedError, when the server closes a kept-alive connection)
+_RETRIED_ERRORS = (asyncio.TimeoutError, OSError) + ((aiohttp.ClientError,) if aiohttp is not None else ())
+
+
+class Response:
+    """Fully read HTTP response, with the subset of the ``requests.Response`` interface used by the parsers"""
+
+    __slots__ = ("status_code", "content", "url", "encoding", "headers", "elapsed", "connect_time")
+
+    def __init__(self, status_code: int, content: bytes, url: str, encoding: str = None, headers=None,
+                 elapsed: datetime.timedelta = None, connect_time: float = None):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.encoding = encoding
+        self.headers = headers or {}
+        # time to the response headers, as in requests, and seconds to open the connection (0 if it was reused)
+        self.elapsed = elapsed
+        self.connect_time = connect_time
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def raise_for_status(self):
+        """Raises a ``requests.exceptions.HTTPError`` for 4xx and 5xx statuses, like ``requests`` does"""
+        if 400 <= self.status_code < 600:
+            kind = "Client" if self.status_code < 500 else "Server"
+            raise requests.exceptions.HTTPError(f"{self.status_code} {kind} Error for url: {self.url}", response=self)
+
+
+class AsyncTransport:
+    """Interface of the asynchronous transports, the asyncio counterpart of ``pycartociudad.transport.Transport``."""
+
+    async def send(self, url: str, params=None, timeout=None) -> Response:
+        """Performs a single GET request and reads its whole body.
+
+        Parameters
+        ----------
+        url: str
+            Request URL
+
+        params: dict or str (optional)
+            Query string parameters
+
+        timeout: float or tuple (optional)
+            Timeout of the request, either a total value or a (connect, read) tuple
+
+        Returns
+        -------
+        response: the fully read ``Response``. Connection errors and timeouts are raised as ``OSError`` or
+        ``asyncio.TimeoutError``.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        """Releases the resources of the transport"""
+
+    def use_default(self, transport: "AsyncTransport"):
+        """Receives the default transport of the client the transport is given to. See
+        ``pycartociudad.transport.Transport.use_default``."""
+
+
+class AiohttpTransport(AsyncTransport):
+    """Transport sending the requests through an ``aiohttp.ClientSession``, created on first use in every event loop.
+
+    Parameters
+    ----------
+    max_connections: int
+        Maximum number of open connections (default 100)
+
+    limit_per_host: int
+        Maximum number of open connections per upstream host (default 20)
+
+    compression: bool
+        If True (default), ask the services for gzip/deflate compressed responses
+    """
+
+    def __init__(self, max_connections: int = 100, limit_per_host: int = 20, compression: bool = True):
+        self.max_connections = max_connections
+        self.limit_per_host = limit_per_host
+        self.compression = compression
+        self._loop = None
+        self._session = None
+
+    async def send(self, url: str, params=None, timeout=None) -> Response:
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for the asyncio API: pip install pycartociudad[aio]")
+
+        loop = asyncio.get_event_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # sessions can't be shared between event loops
+            connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.limit_per_host)
+            headers = {"Accept-Encoding": "gzip, deflate" if self.compression else "identity"}
+            self._session = aiohttp.ClientSession(connector=connector, headers=headers,
+                                                  trace_configs=[_connection_timing()])
+            self._loop = loop
+
+        if isinstance(timeout, tuple):
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        else:
+            client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+        timing = types.SimpleNamespace(connect_time=0.0)
+        start = time.monotonic()
+        async with self._session.get(url, params=params, timeout=client_timeout,
+                                     trace_request_ctx=timing) as response:
+            elapsed = datetime.timedelta(seconds=time.monotonic() - start)
+            content = await response.read()
+            return Response(response.status, content, str(response.url), response.charset, response.headers,
+                            elapsed, timing.connect_time)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def _connection_timing() -> "aiohttp.TraceConfig":
+    """Builds the trace config recording the time to open new connections in the ``trace_request_ctx`` of the
+    requests"""
+
+    async def on_start(session, context, params):
+        context.connect_start = time.monotonic()
+
+    async def on_end(session, context, params):
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx.connect_time = time.monotonic() - context.connect_start
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(on_start)
+    trace_config.on_connection_create_end.append(on_end)
+    return trace_config
+
+
+class AsyncReplayTransport(AsyncTransport):
+    """Transport answering every request from a cassette, without network. See
+    ``pycartociudad.transport.ReplayTransport``.
+
+    Parameters
+    ----------
+    cassette: str or Cassette
+        Cassette, or path of the cassette file, with the recorded answers
+    """
+
+    def __init__(self, cassette: Union[str, Cassette]):
+        self.cassette = _cassette(cassette)
+
+    async def send(self, url: str, params=None, timeout=None) -> Response:
+        status, headers, content = self.cassette.play(url, params)
+        return Response(status, content, request_key(url, params), headers=headers)
+
+
+class AsyncRecordingTransport(AsyncTransport):
+    """Transport recording to a cassette every answer of another transport. See
+    ``pycartociudad.transport.RecordingTransport``.
+
+    Parameters
+    ----------
+    cassette: str or Cassette
+        Cassette, or path of the cassette file, to record the answers to
+
+    transport: AsyncTransport (optional)
+        Transport performing the requests. Default value is None, the default transport of the client it is given to
+        (or a new ``AiohttpTransport`` if it is used on its own).
+    """
+
+    def __init__(self, cassette: Union[str, Cassette], transport: AsyncTransport = None):
+        self.cassette = _cassette(cassette)
+        self.transport = transport
+
+    def use_default(self, transport: AsyncTransport):
+        if self.transport is None:
+            self.transport = transport
+
+    async def send(self, url: str, params=None, timeout=None) -> Response:
+        if self.transport is None:
+            self.transport = AiohttpTransport()
+        response = await self.transport.send(url, params, timeout)
+        self.cassette.record(url, params, response.status_code, response.headers, response.content)
+        return response
+
+    async def close(self):
+        if self.transport is not None:
+            await self.transport.close()
+
+
+class AsyncClient:
+    """Asynchronous HTTP client used to reach the cartociudad, cadastre and census services.
+
+    Parameters
+    ----------
+    max_concurrency: int
+        Maximum number of requests in flight at the same time (default 100)
+
+    limit_per_host: int
+        Maximum number of open connections per upstream host (default 20)
+
+    timeout: float or tuple
+        Default timeout in seconds for every request, either a total value or a
+        (connect, read) tuple (default (5, 30))
+
+    compression: bool
+        If True (default), ask the services for gzip/deflate compressed responses
+
+    census_index: CensusIndex (optional)
+        Local index of census sections used by ``get_census_info`` before querying the census service.
+        Default value is None, every point is queried to the service.
+
+    local_geocoder: LocalGeocoder (optional)
+        Local index of streets and portals used by ``geocode`` before querying the geocoding service, which is only
+        queried for the addresses whose street is not found, and by ``reverse_geocode`` for the points with a portal
+        within 100 meters. Default value is None, every address and point is queried.
+
+    local_router: LocalRouter (optional)
+        Local graph of the road network used by ``route_between_two_points`` and ``route_matrix`` before querying
+        the routing service, which is only queried for the routes with an end outside the graph or without a route
+        in it. Default value is None, every route is queried.
+
+    throttle: Throttle (optional)
+        Per-host rate and adaptive concurrency limiter, which can be shared with other clients.
+        Default value is None, requests are only limited by ``max_concurrency``.
+
+    retries, backoff, max_backoff, deadline, hedge, hedge_quantile:
+        Retry, deadline and hedging settings, as in ``pycartociudad.Client``
+
+    coalesce: bool
+        If True, concurrent identical calls share a single upstream request and its result (default False)
+
+    transport: AsyncTransport (optional)
+        Transport performing the requests, e.g. an ``AsyncReplayTransport`` answering from a cassette file.
+        Default value is None, an ``AiohttpTransport`` with the connection limits of the client.
+    """
+
+    def __init__(self, max_concurrency: int = 100, limit_per_host: int = 20, timeout=DEFAULT_TIMEOUT,
+                 compression: bool = True, census_index=None, local_geocoder=None, local_router=None,
+                 throttle=None, retries: int = 2, backoff: float = 0.2, max_backoff: float = 10,
+                 deadline: float = None, hedge: bool = False, hedge_quantile: float = 0.95, coalesce: bool = False,
+                 transport: AsyncTransport = None):
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.compression = compression
+        self.census_index = census_index
+        self.local_geocoder = local_geocoder
+        self.local_router = local_router
+        self.throttle = throttle
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.flights = AsyncSingleFlight() if coalesce else None
+        self.transport = transport or AiohttpTransport(max_concurrency, limit_per_host, compression)
+        if transport is not None and hasattr(transport, "use_default"):
+            transport.use_default(AiohttpTransport(max_concurrency, limit_per_host, compression))
+        self._latencies = {}
+        self._loop = None
+        self._semaphore = None
+
+    async def get(self, url: str, params=None, timeout=None, deadline: float = None) -> Response:
+        """Performs a GET request, waiting for a free slot if ``max_concurrency`` requests are in flight.
+        Failed and overloaded requests are retried as in ``pycartociudad.Client.get``.
+
+        Parameters
+        ----------
+        url: str
+            Request URL
+
+        params: dict or str (optional)
+            Query string parameters
+
+        timeout: float or tuple (optional)
+            Timeout of every attempt. Default value is the client timeout.
+
+        deadline: float (optional)
+            Maximum seconds for the whole call, retries included. Default value is the client deadline.
+
+        Returns
+        -------
+        response: the fully read ``Response``
+        """
+        timeout = timeout or self.timeout
+        deadline = deadline or self.deadline
+        deadline_at = time.monotonic() + deadline if deadline is not None else None
+        host = urllib.parse.urlsplit(url).netloc
+
+        attempt = 0
+        while True:
+            attempt_timeout = _bounded_timeout(timeout, deadline_at)
+            start = time.monotonic()
+            try:
+                response = await self._hedged_send(host, url, params, attempt_timeout)
+            except _RETRIED_ERRORS as err:
+                if instrumentation.enabled():
+                    instrumentation.emit(instrumentation.request_event(url, host, attempt, start, error=err))
+                if attempt >= self.retries:
+                    raise
+                error, response, retry_after = err, None, None
+            else:
+                if instrumentation.enabled():
+                    instrumentation.emit(instrumentation.request_event(url, host, attempt, start, response))
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                error, retry_after = None, response.headers.get("Retry-After")
+
+            delay = backoff_delay(attempt, self.backoff, self.max_backoff, retry_after)
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                if response is not None:
+                    return response
+                raise DeadlineExceeded(f"Deadline exceeded requesting {url}") from error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _hedged_send(self, host: str, url: str, params, timeout) -> Response:
+        """Sends a request. If hedging is enabled and it takes longer than the usual latency of the host, sends a
+        duplicate and returns the first answer."""
+        hedge_after = self._hedge_after(host) if self.hedge else None
+        if hedge_after is None:
+            return await self._send(host, url, params, timeout)
+
+        tasks = [asyncio.ensure_future(self._send(host, url, params, timeout))]
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            tasks.append(asyncio.ensure_future(self._send(host, url, params, timeout)))
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        task = done.pop()
+        if task.exception() is not None and len(tasks) > 1:
+            # the other request may still succeed
+            task = tasks[1] if task is tasks[0] else tasks[0]
+            return await task
+        for other in tasks:
+            if other is not task:
+                other.cancel()
+        return task.result()
+
+    async def _send(self, host: str, url: str, params, timeout) -> Response:
+        """Sends a single request through the throttle and the concurrency semaphore, recording its latency"""
+        # the host slot is taken before the global one, so a throttled host doesn't hold back the others
+        token = await self.throttle.acquire_async(host) if self.throttle is not None else None
+        start = time.monotonic()
+        response, failed = None, False
+        try:
+            async with self._bind_loop():
+                response = await self._request(url, params, timeout)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # the slot is freed however the request ends; the cancelled ones (timeouts of the caller, hedge losers,
+            # deadlines) are not reported as failures of the host
+            if token is not None:
+                if response is not None:
+                    self.throttle.release(token, response.status_code, response.headers.get("Retry-After"))
+                else:
+                    self.throttle.release(token, cancelled=not failed)
+        if self.hedge and response.status_code < 400:
+            self._latencies.setdefault(host, deque(maxlen=LATENCY_WINDOW)).append(time.monotonic() - start)
+        return response
+
+    def _hedge_after(self, host: str) -> float:
+        """Returns the ``hedge_quantile`` of the recent latencies of a host, or None if there are too few of them"""
+        latencies = sorted(self._latencies.get(host, ()))
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(self.hedge_quantile * len(latencies)))]
+
+    def _bind_loop(self) -> asyncio.Semaphore:
+        """Returns the concurrency semaphore, creating it if the running loop changed"""
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _request(self, url: str, params, timeout) -> Response:
+        return await self.transport.send(url, params, timeout)
+
+    async def close(self):
+        """Closes all the pooled connections"""
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+_default_async_client = None
+_default_async_client_lock = threading.Lock()
+
+
+def get_default_async_client() -> AsyncClient:
+    """Returns the async client shared by all the coroutines that don't receive an explicit one"""
+    global _default_async_client
+    if _default_async_client is None:
+        with _default_async_client_lock:
+            if _default_async_client is None:
+                _default_async_client = AsyncClient()
+    return _default_async_client
+
+
+def set_default_async_client(client: AsyncClient):
+    """Replaces the async client shared by all the coroutines that don't receive an explicit one.
+
+    Parameters
+    ----------
+    client: AsyncClient
+        The new default client. If None, a new one with the default settings will be created on next use.
+    """
+    global _default_async_client
+    with _default_async_client_lock:
+        _default_async_client = client
+
+
+async def geocode(full_address: str, client: AsyncClient = None, typed: bool = False) -> dict:
+    """Coroutine version of ``pycartociudad.geocode``. See its documentation for the details.
+
+    Parameters
+    ----------
+    full_address: str
+        Full address to be geolocated; e.g., "calle miguel servet 5, zaragoza"
+
+    client: AsyncClient (optional)
+        Async HTTP client used to perform the request. Default value is None and will use the shared default client.
+
+    typed: bool
+        If True, returns a compact result object instead of a dict (default False)
+    """
+    if not full_address:
+        return GeocodeResult() if typed else {}
+
+    client = client or get_default_async_client()
+    if client.local_geocoder is not None:
+        result = client.local_geocoder.lookup(full_address)
+        if result:
+            return GeocodeResult(result) if typed else result
+
+    async def request():
+        r = await client.get(_geocode_url(full_address))
+        return _parse_geocode(r)
+
+    # different spellings of the same address share their in-flight request, as in the sync function
+    result = await _coalesced(client, 'geocode', normalize_address(full_address), request)
+    return GeocodeResult(result) if typed else result
+
+
+async def reverse_geocode(latitude: float, longitude: float, cadastral: bool = False, error: str = 'raise',
+                          client: AsyncClient = None, typed: bool = False) -> dict:
+    """Coroutine version of ``pycartociudad.reverse_geocode``. See its documentation for the details.
+
+    Parameters
+    ----------
+    latitude: float
+        Point latitude in geographical coordinates (e.g., 40.473219)
+
+    longitude: float
+        Point longitude in geographical coordinates (e.g., -3.7227241)
+
+    cadastral: bool (optional) (default: False)
+        Set to True if performing cadastral address reverse geocoding
+
+    client: AsyncClient (optional)
+        Async HTTP client used to perform the request. Default value is None and will use the shared default client.
+
+    typed: bool
+        If True, returns a compact result object instead of a dict (default False)
+    """
+    client = client or get_default_async_client()
+    if client.local_geocoder is not None and not cadastral:
+        result = client.local_geocoder.reverse_lookup(latitude, longitude)
+        if result:
+            return GeocodeResult(result) if typed else result
+
+    async def request():
+        r = await client.get(REVERSE_GEOCODE_URL, params=_reverse_geocode_params(latitude, longitude, cadastral))
+        return _handle_reverse_geocode(r, error)
+
+    # ignored errors always give an empty result, not worth coalescing
+    if error == 'ignore':
+        result = await request()
+    else:
+        query = {'lat': latitude, 'lon': longitude, 'cadastral': cadastral}
+        result = await _coalesced(client, 'reverse_geocode', query, request)
+    return GeocodeResult(result) if typed else result
+
+
+async def route_between_two_points(lat_init: float, lon_init: float, lat_dest: float, lon_dest: float,
+                                   vehicle: bool = False, error: str = 'raise', client: AsyncClient = None,
+                                   typed: bool = False, arrays: bool = False) -> dict:
+    """Coroutine version of ``pycartociudad.route_between_two_points``. See its documentation for the details.
+
+    Parameters
+    ----------
+    lat_init, lon_init: float
+        Initial point latitude and longitude in geographical coordinates
+
+    lat_dest, lon_dest: float
+        Final point latitude and longitude in geographical coordinates
+
+    vehicle: bool
+        If True, uses vehicle, if False walking
+
+    client: AsyncClient (optional)
+        Async HTTP client used to perform the request. Default value is None and will use the shared default client.
+
+    typed: bool
+        If True, returns a compact result object instead of a dict (default False)
+
+    arrays: bool
+        If True, adds the decoded geometry and instruction distances as NumPy arrays (default False)
+    """
+    client = client or get_default_async_client()
+    if client.local_router is not None:
+        result = client.local_router.route(lat_init, lon_init, lat_dest, lon_dest, vehicle=vehicle, arrays=arrays)
+        if result:
+            return RouteResult(result) if typed else result
+
+    async def request():
+        r = await client.get(_route_url(lat_init, lon_init, lat_dest, lon_dest, vehicle))
+        return _handle_route(r, error, parse_instructions=not arrays)
+
+    # ignored errors always give an empty result, not worth coalescing
+    if error == 'ignore':
+        result = await request()
+    else:
+        query = {'orig': f'{lat_init},{lon_init}', 'dest': f'{lat_dest},{lon_dest}', 'vehicle': vehicle}
+        result = await _coalesced(client, 'route_raw' if arrays else 'route', query, request)
+    if arrays:
+        result = _add_route_arrays(result)
+    return RouteResult(result) if typed else result
+
+
+async def get_cadastral_reference(latitude: float, longitude: float, srs: str = "EPSG:4326",
+                                  client: AsyncClient = None):
+    """Coroutine version of ``pycartociudad.get_location_info.get_cadastral_reference``"""
+    client = client or get_default_async_client()
+    params = {"SRS": srs, "Coordenada_X": longitude, "Coordenada_Y": latitude}
+    response = await client.get(CADASTRE_URL, params)
+
+    return _parse_cadastral_reference(response)
+
+
+async def get_census_info(latitude: float, longitude: float, client: AsyncClient = None) -> dict:
+    """Coroutine version of ``pycartociudad.get_location_info.get_census_info``"""
+    client = client or get_default_async_client()
+    if client.census_index is not None:
+        census_data = client.census_index.lookup(latitude, longitude)
+        if census_data:
+            return census_data
+
+    response = await client.get(CENSUS_URL, _census_params(latitude, longitude))
+
+    return _parse_census_info(response)
+
+
+async def get_location_info(latitude: float, longitude: float, sources: List[str] = None,
+                            client: AsyncClient = None, timeout: Union[float, Dict[str, float]] = None,
+                            typed: bool = False) -> dict:
+    """Coroutine version of ``pycartociudad.get_location_info``. The selected sources are queried concurrently.
+
+    Parameters
+    ----------
+    latitude: float
+        Point latitude in geographical coordinates (e.g., 40.473219)
+
+    longitude: float
+        Point longitude in geographical coordinates (e.g., -3.7227241)
+
+    sources: list of str
+        List of sources to retrieve the data from. Allowed values are ["cadastre", "census", "geocoding"].
+        Default value is None and will retrieve the data from all the sources.
+
+    client: AsyncClient (optional)
+        Async HTTP client used to perform the requests. Default value is None and will use the shared default client.
+
+    timeout: float or dict (optional)
+        Maximum seconds to wait for each source, either a single value or a dict by source. Default value is None,
+        waits until the client timeout.
+
+    typed: bool
+        If True, returns a compact ``LocationInfo`` instead of a dict (default False)
+    """
+    sources = _check_sources(sources)
+    client = client or get_default_async_client()
+
+    async def query_source(source):
+        if source == CADASTRE_SOURCE:
+            return {"cadastral_ref": await get_cadastral_reference(latitude, longitude, client=client)}
+        if source == CENSUS_SOURCE:
+            census_data = await get_census_info(latitude, longitude, client=client)
+            return {"census_section": census_data.get("census_section"),
+                    "district_code": census_data.get("district_code")}
+        return await reverse_geocode(latitude, longitude, client=client) or {}
+
+    async def query_source_in_time(source):
+        source_timeout = timeout.get(source) if isinstance(timeout, dict) else timeout
+        try:
+            return await asyncio.wait_for(query_source(source), source_timeout)
+        except asyncio.TimeoutError:
+            return TimeoutError(f"{source} source didn't answer in time")
+        except Exception as err:
+            return err
+
+    async def request():
+        partials = await asyncio.gather(*[query_source_in_time(source) for source in sources])
+        return _merge_sources(sources, dict(zip(sources, partials)))
+
+    query = {"lat": latitude, "lon": longitude, "sources": ",".join(sorted(sources))}
+    result = await _coalesced(client, "location_info", query, request)
+    return LocationInfo(result) if typed else result
+
+
+async def _coalesced(client: AsyncClient, endpoint: str, query: Union[str, dict], compute):
+    """Awaits a request, sharing it with the identical ones in flight if the client coalesces them"""
+    if client.flights is None:
+        return await compute()
+    return await client.flights.do(endpoint, query, compute)
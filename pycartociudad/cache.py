@@ -0,0 +1,323 @@
+"""
+Caches of the responses of the cartociudad services
+"""
+
+import copy
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Union
+
+from pycartociudad import instrumentation
+
+# meters per degree of latitude
+METERS_PER_DEGREE = 111_320
+
+
+def normalize_query(query: Union[str, dict]) -> str:
+    """Builds the cache key of a query: case and whitespace are folded and parameters are sorted.
+
+    Parameters
+    ----------
+    query: str or dict
+        Free text query (e.g. an address) or dict of request parameters
+
+    Returns
+    -------
+    key: the normalized query string
+    """
+    if isinstance(query, dict):
+        return "&".join(f"{name}={normalize_query(str(value))}" for name, value in sorted(query.items()))
+    return " ".join(str(query).lower().split())
+
+
+def lookup(cache, endpoint: str, query: Union[str, dict]):
+    """Returns the cached result of a query, or None if it is not cached or there is no cache, reporting the lookup
+    to the instrumentation hooks"""
+    if cache is None:
+        return None
+    result = cache.get(endpoint, query)
+    if instrumentation.enabled():
+        instrumentation.emit(instrumentation.Event(instrumentation.CACHE, endpoint, hit=result is not None))
+    return result
+
+
+def cached(cache, endpoint: str, query: Union[str, dict], compute: Callable, keep: Callable = None, flights=None):
+    """Returns the cached result of a query, or computes it and stores it in the cache.
+
+    Parameters
+    ----------
+    cache: SQLiteCache (or any object with the same ``get``/``set`` methods)
+        The cache to use. If None, the result is always computed.
+
+    endpoint: str
+        Name of the queried endpoint (e.g. "geocode")
+
+    query: str or dict
+        Query sent to the endpoint
+
+    compute: callable
+        Function without arguments performing the request. It is only called on cache misses.
+
+    keep: callable (optional)
+        Function receiving a computed result and returning whether it should be stored. Default value is None,
+        every result is stored.
+
+    flights: SingleFlight (optional)
+        Group of in-flight calls. If given, concurrent misses of the same query share a single computation.
+        Default value is None, every miss is computed.
+
+    Returns
+    -------
+    result: the cached or computed result
+    """
+    result = lookup(cache, endpoint, query)
+    if result is not None:
+        return result
+
+    def compute_and_store():
+        result = compute()
+        if cache is not None and (keep is None or keep(result)):
+            cache.set(endpoint, query, result)
+        return result
+
+    if flights is None:
+        return compute_and_store()
+    return flights.do(endpoint, query, compute_and_store)
+
+
+class SQLiteCache:
+    """Persistent cache of results stored in a SQLite database in WAL mode.
+
+    Entries are keyed on the endpoint plus the normalized query, expire after ``ttl`` seconds and, when there are
+    more than ``max_entries``, the least recently used ones are evicted. Several threads and processes can share the
+    same database file.
+
+    Parameters
+    ----------
+    path: str
+        Path of the database file. It is created if it doesn't exist.
+
+    ttl: float (optional)
+        Time to live of the entries in seconds. Default value is None, entries never expire.
+
+    max_entries: int
+        Maximum number of entries kept (default 1,000,000)
+
+    busy_timeout: float
+        Seconds to wait for the lock held by another process writing to the database (default 30)
+    """
+
+    def __init__(self, path: str, ttl: float = None, max_entries: int = 1_000_000, busy_timeout: float = 30):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.busy_timeout = busy_timeout
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " endpoint TEXT NOT NULL, query TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL, accessed_at REAL NOT NULL, PRIMARY KEY (endpoint, query))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of the current thread, opening it on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, endpoint: str, query: Union[str, dict]):
+        """Returns the cached result of a query, or None if it is not cached or expired"""
+        key = normalize_query(query)
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value FROM cache WHERE endpoint = ? AND query = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (endpoint, key, now)
+        ).fetchone()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        connection.execute("UPDATE cache SET accessed_at = ? WHERE endpoint = ? AND query = ?", (now, endpoint, key))
+        return json.loads(row[0])
+
+    def set(self, endpoint: str, query: Union[str, dict], value):
+        """Stores the result of a query. The value must be JSON serializable."""
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (endpoint, query, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (endpoint, normalize_query(query), json.dumps(value), expires_at, now)
+        )
+
+        # counting the entries is not free, so the size bound is checked every 1% of max_entries writes
+        with self._lock:
+            self._writes += 1
+            check = self._writes % max(1, self.max_entries // 100) == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Removes the expired entries and the least recently used ones above ``max_entries``"""
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            excess = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+
+    def clear(self):
+        """Removes every entry"""
+        self._connection().execute("DELETE FROM cache")
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters of this process, and the number of entries stored"""
+        size = self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+    def close(self):
+        """Closes the connection of the current thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class QuantizedLRUCache:
+    """In-memory LRU cache of coordinate lookups. Coordinates are snapped to a grid, so the queries of nearby points
+    (e.g. consecutive points of a GPS trace) share the same entry.
+
+    Parameters
+    ----------
+    grid_size: float
+        Side of the grid cells in meters (default 5)
+
+    max_entries: int
+        Maximum number of entries kept; the least recently used ones are discarded (default 100,000)
+
+    endpoints: iterable of str
+        Endpoints whose results are cached. Default value is ("reverse_geocode", "location_info").
+
+    The results are copied when stored and on every hit, as the SQLite cache deserializes them, so a caller modifying
+    its result doesn't change the entry of the later hits.
+    """
+
+    def __init__(self, grid_size: float = 5, max_entries: int = 100_000,
+                 endpoints: Iterable[str] = ("reverse_geocode", "location_info")):
+        self.grid_size = grid_size
+        self.max_entries = max_entries
+        self.endpoints = frozenset(endpoints)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, endpoint: str, query: Union[str, dict]):
+        """Builds the key of a query, replacing its lat and lon by the indices of their grid cell"""
+        if not isinstance(query, dict) or "lat" not in query or "lon" not in query:
+            return endpoint, normalize_query(query)
+
+        try:
+            latitude, longitude = float(query["lat"]), float(query["lon"])
+        except (TypeError, ValueError):
+            return endpoint, normalize_query(query)
+
+        lat_step = self.grid_size / METERS_PER_DEGREE
+        lat_cell = round(latitude / lat_step)
+        lon_step = lat_step / max(math.cos(math.radians(lat_cell * lat_step)), 1e-6)
+        lon_cell = round(longitude / lon_step)
+        others = {name: value for name, value in query.items() if name not in ("lat", "lon")}
+        return endpoint, lat_cell, lon_cell, normalize_query(others)
+
+    def get(self, endpoint: str, query: Union[str, dict]):
+        """Returns the cached result of a query, or None if it is not cached"""
+        if endpoint not in self.endpoints:
+            return None
+
+        key = self._key(endpoint, query)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.copy(value)
+
+    def set(self, endpoint: str, query: Union[str, dict], value):
+        """Stores the result of a query"""
+        if endpoint not in self.endpoints:
+            return
+
+        key = self._key(endpoint, query)
+        value = copy.copy(value)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters, and the number of entries stored"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class TieredCache:
+    """Chain of caches, looked up in order. A hit in a later cache is copied to the earlier ones.
+
+    Parameters
+    ----------
+    caches: caches
+        Caches from the fastest to the slowest; e.g. ``TieredCache(QuantizedLRUCache(), SQLiteCache(path))``
+    """
+
+    def __init__(self, *caches):
+        self.caches = caches
+
+    def get(self, endpoint: str, query: Union[str, dict]):
+        """Returns the cached result of a query from the first cache holding it, or None"""
+        for i, cache in enumerate(self.caches):
+            value = cache.get(endpoint, query)
+            if value is not None:
+                for faster_cache in self.caches[:i]:
+                    faster_cache.set(endpoint, query, value)
+                return value
+        return None
+
+    def set(self, endpoint: str, query: Union[str, dict], value):
+        """Stores the result of a query in every cache"""
+        for cache in self.caches:
+            cache.set(endpoint, query, value)
+
+    def stats(self) -> list:
+        """Returns the stats of every cache"""
+        return [cache.stats() for cache in self.caches]
@@ -0,0 +1,261 @@
+"""
+Offline lookup of census sections and districts in a local file of polygons
+
+The polygons are loaded once into an STR-packed R-tree, so every point is resolved locally with a
+point-in-polygon test against the few candidate sections whose bounding box contains it.
+"""
+
+import json
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# maximum number of children of the tree nodes
+NODE_CAPACITY = 16
+
+
+class _Node:
+    """Node of the STR tree: a bounding box and either child nodes or section indices (leaves)"""
+
+    __slots__ = ("bbox", "children", "items")
+
+    def __init__(self, bbox, children=None, items=None):
+        self.bbox = bbox
+        self.children = children
+        self.items = items
+
+
+def _union(bboxes: List[Tuple[float, float, float, float]]) -> Tuple[float, float, float, float]:
+    return (min(bbox[0] for bbox in bboxes), min(bbox[1] for bbox in bboxes),
+            max(bbox[2] for bbox in bboxes), max(bbox[3] for bbox in bboxes))
+
+
+def _str_pack(entries: List[tuple], capacity: int) -> List[list]:
+    """Groups (bbox, value) entries in tiles of ``capacity`` elements with the Sort-Tile-Recursive algorithm"""
+    entries = sorted(entries, key=lambda entry: entry[0][0] + entry[0][2])
+    n_tiles = -(-len(entries) // capacity)
+    n_slices = max(1, round(n_tiles ** 0.5))
+    slice_size = -(-len(entries) // n_slices)
+
+    groups = []
+    for start in range(0, len(entries), slice_size):
+        vertical_slice = sorted(entries[start:start + slice_size], key=lambda entry: entry[0][1] + entry[0][3])
+        groups.extend(vertical_slice[i:i + capacity] for i in range(0, len(vertical_slice), capacity))
+    return groups
+
+
+def _contains(xs: Sequence[float], ys: Sequence[float], x: float, y: float) -> bool:
+    """Even-odd ray casting test of a point against a closed ring"""
+    inside = False
+    j = len(xs) - 1
+    for i in range(len(xs)):
+        if (ys[i] > y) != (ys[j] > y) and x < (xs[j] - xs[i]) * (y - ys[i]) / (ys[j] - ys[i]) + xs[i]:
+            inside = not inside
+        j = i
+    return inside
+
+
+class CensusIndex:
+    """Spatial index of census section polygons, in geographical coordinates.
+
+    Parameters
+    ----------
+    sections: list of (census_section, district_code, rings)
+        Census sections, where rings is the list of rings (outer rings and holes) of the section polygons, each
+        one a list of (longitude, latitude) points
+    """
+
+    def __init__(self, sections: List[Tuple[str, str, List[List[Tuple[float, float]]]]]):
+        self.codes = []
+        self.rings = []
+        self.bboxes = []
+        for census_section, district_code, rings in sections:
+            rings = [([point[0] for point in ring], [point[1] for point in ring]) for ring in rings if ring]
+            if not rings:
+                continue
+            self.codes.append((census_section, district_code))
+            self.rings.append(rings)
+            self.bboxes.append((min(min(xs) for xs, _ in rings), min(min(ys) for _, ys in rings),
+                                max(max(xs) for xs, _ in rings), max(max(ys) for _, ys in rings)))
+
+        self._root = self._build_tree()
+        self._array_rings = None
+
+    def _build_tree(self) -> _Node:
+        nodes = [_Node(bbox, items=[i]) for i, bbox in enumerate(self.bboxes)]
+        if not nodes:
+            return None
+
+        leaves = True
+        while len(nodes) > 1 or leaves:
+            groups = _str_pack([(node.bbox, node) for node in nodes], NODE_CAPACITY)
+            if leaves:
+                nodes = [_Node(_union([node.bbox for _, node in group]),
+                               items=[node.items[0] for _, node in group]) for group in groups]
+                leaves = False
+            else:
+                nodes = [_Node(_union([node.bbox for _, node in group]),
+                               children=[node for _, node in group]) for group in groups]
+        return nodes[0]
+
+    @classmethod
+    def from_file(cls, path: str, section_field: str = "CUSEC", district_field: str = "CUDIS") -> "CensusIndex":
+        """Loads the census sections from a GeoJSON file or a Shapefile. Shapefiles require ``pyshp``.
+
+        The coordinates must be geographical (e.g. EPSG:4326 or EPSG:4258). The INE files are distributed in UTM,
+        so they must be reprojected first; e.g. ``ogr2ogr -t_srs EPSG:4326 sections.geojson SECC_CE_2020.shp``.
+
+        Parameters
+        ----------
+        path: str
+            Path of the .geojson/.json file or the .shp file
+
+        section_field: str
+            Property with the census section code (default "CUSEC")
+
+        district_field: str
+            Property with the district code (default "CUDIS"). If missing, the district code is taken from the first
+            seven digits of the section code.
+
+        Returns
+        -------
+        index: the ``CensusIndex`` of the sections
+        """
+        if path.lower().endswith(".shp"):
+            import shapefile
+
+            with shapefile.Reader(path) as reader:
+                features = [(record.record.as_dict(), record.shape.__geo_interface__)
+                            for record in reader.iterShapeRecords()]
+        else:
+            with open(path, encoding="utf-8") as file:
+                features = [(feature.get("properties") or {}, feature.get("geometry") or {})
+                            for feature in json.load(file)["features"]]
+
+        sections = []
+        for properties, geometry in features:
+            census_section = properties.get(section_field)
+            if census_section is None:
+                continue
+            census_section = str(census_section)
+            district_code = properties.get(district_field)
+            district_code = str(district_code) if district_code is not None else census_section[:7]
+
+            if geometry.get("type") == "Polygon":
+                rings = geometry["coordinates"]
+            elif geometry.get("type") == "MultiPolygon":
+                rings = [ring for polygon in geometry["coordinates"] for ring in polygon]
+            else:
+                continue
+            sections.append((census_section, district_code, rings))
+
+        return cls(sections)
+
+    def lookup(self, latitude: float, longitude: float) -> Dict[str, str]:
+        """Returns the census section and district codes of a point.
+
+        Parameters
+        ----------
+        latitude: float
+            Point latitude in geographical coordinates (e.g., 40.473219)
+
+        longitude: float
+            Point longitude in geographical coordinates (e.g., -3.7227241)
+
+        Returns
+        -------
+        census_information: a dict with census_section and district_code, or an empty dict if the point is
+        outside every section
+        """
+        x, y = float(longitude), float(latitude)
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            if not (node.bbox[0] <= x <= node.bbox[2] and node.bbox[1] <= y <= node.bbox[3]):
+                continue
+            if node.children is not None:
+                stack.extend(node.children)
+                continue
+            for i in node.items:
+                bbox = self.bboxes[i]
+                if not (bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]):
+                    continue
+                if sum(_contains(xs, ys, x, y) for xs, ys in self.rings[i]) % 2:
+                    census_section, district_code = self.codes[i]
+                    return {"census_section": census_section, "district_code": district_code}
+        return {}
+
+    def lookup_many(self, latitudes: Sequence[float], longitudes: Sequence[float]) -> Dict[str, "np.ndarray"]:
+        """Vectorized lookup of the census section and district codes of many points. Requires numpy.
+
+        The points are split down the tree with array masks, so every polygon is only tested against the
+        points inside its bounding box.
+
+        Parameters
+        ----------
+        latitudes: sequence of float
+            Points latitudes in geographical coordinates
+
+        longitudes: sequence of float
+            Points longitudes in geographical coordinates
+
+        Returns
+        -------
+        census_information: a dict with two object arrays, census_section and district_code, with None for the
+        points outside every section
+        """
+        if np is None:
+            raise ImportError("numpy is required for the vectorized lookup: pip install pycartociudad[numpy]")
+
+        xs = np.asarray(longitudes, dtype=np.float64)
+        ys = np.asarray(latitudes, dtype=np.float64)
+        found = np.full(len(xs), -1, dtype=np.int64)
+        if self._array_rings is None:
+            self._array_rings = [[(np.asarray(ring_xs), np.asarray(ring_ys)) for ring_xs, ring_ys in rings]
+                                 for rings in self.rings]
+
+        stack = [(self._root, np.arange(len(xs)))] if self._root is not None and len(xs) else []
+        while stack:
+            node, candidates = stack.pop()
+            for bbox, child in self._node_entries(node):
+                cx, cy = xs[candidates], ys[candidates]
+                inside = candidates[(cx >= bbox[0]) & (cx <= bbox[2]) & (cy >= bbox[1]) & (cy <= bbox[3])]
+                inside = inside[found[inside] < 0]
+                if not len(inside):
+                    continue
+                if isinstance(child, _Node):
+                    stack.append((child, inside))
+                else:
+                    crossings = np.zeros(len(inside), dtype=bool)
+                    for ring_xs, ring_ys in self._array_rings[child]:
+                        crossings ^= _contains_many(ring_xs, ring_ys, xs[inside], ys[inside])
+                    found[inside[crossings]] = child
+
+        # the last element, selected by the -1 of the points not found, is None
+        census_sections = np.array([code[0] for code in self.codes] + [None], dtype=object)
+        district_codes = np.array([code[1] for code in self.codes] + [None], dtype=object)
+        return {"census_section": census_sections[found], "district_code": district_codes[found]}
+
+    def _node_entries(self, node: _Node):
+        """Returns the (bbox, child) entries of a node, where child is a node or a section index"""
+        if node.children is not None:
+            return [(child.bbox, child) for child in node.children]
+        return [(self.bboxes[i], i) for i in node.items]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def _contains_many(ring_xs: "np.ndarray", ring_ys: "np.ndarray", xs: "np.ndarray", ys: "np.ndarray") -> "np.ndarray":
+    """Vectorized even-odd ray casting test of many points against a closed ring"""
+    inside = np.zeros(len(xs), dtype=bool)
+    previous_xs, previous_ys = np.roll(ring_xs, 1), np.roll(ring_ys, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for xi, yi, xj, yj in zip(ring_xs, ring_ys, previous_xs, previous_ys):
+            crosses = (yi > ys) != (yj > ys)
+            crosses &= xs < (xj - xi) * (ys - yi) / (yj - yi) + xi
+            inside ^= crosses
+    return inside
@@ -0,0 +1,246 @@
+"""
+Command line interface to geocode and reverse geocode CSV and NDJSON files
+
+The input file is streamed in constant memory and the enriched rows are written as soon as they are ready. The
+progress is periodically committed to a checkpoint file, so a killed job restarts from the last committed row.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Callable, Iterator, List, Tuple
+
+from pycartociudad._batch import imap_unique
+from pycartociudad.client import Client
+from pycartociudad.geocode import geocode
+from pycartociudad.normalize import normalize_address
+from pycartociudad.reverse_geocode import reverse_geocode
+
+# fields of the results added to every row
+GEOCODE_FIELDS = ["id", "province", "comunidadAutonoma", "muni", "type", "address", "postalCode", "poblacion",
+                  "tip_via", "lat", "lng", "portalNumber", "state", "stateMsg", "countryCode"]
+REVERSE_GEOCODE_FIELDS = GEOCODE_FIELDS + ["refCatastral"]
+
+CSV_FORMAT = "csv"
+NDJSON_FORMAT = "ndjson"
+
+
+def _read_rows(file, input_format: str, fieldnames: List[str]) -> Iterator[Tuple[dict, int]]:
+    """Yields the rows of a file opened in text mode, with the file position after each row"""
+    def lines():
+        while True:
+            line = file.readline()
+            if not line:
+                return
+            yield line
+
+    if input_format == CSV_FORMAT:
+        for values in csv.reader(lines()):
+            yield dict(zip(fieldnames, values)), file.tell()
+    else:
+        for line in lines():
+            if line.strip():
+                yield json.loads(line), file.tell()
+
+
+def _read_checkpoint(path: str) -> dict:
+    """Returns the last committed checkpoint, or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_checkpoint(path: str, checkpoint: dict):
+    """Commits a checkpoint atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def process_file(input_path: str, output_path: str, lookup: Callable, query: Callable, fields: List[str],
+                 input_format: str = None, max_workers: int = 8, checkpoint_path: str = None,
+                 checkpoint_every: int = 1000, prefix: str = "cc_", restart: bool = False,
+                 key: Callable = None) -> int:
+    """Enriches every row of a CSV or NDJSON file with the result of a lookup.
+
+    Parameters
+    ----------
+    input_path: str
+        Path of the input file
+
+    output_path: str
+        Path of the output file, written in the same format as the input
+
+    lookup: callable
+        Function receiving a query and returning the result dict (e.g. a geocoding)
+
+    query: callable
+        Function receiving a row dict and returning the query of the lookup. Rows with the same query pulled at the
+        same time share the lookup.
+
+    fields: list of str
+        Fields of the lookup result added to the rows, prefixed with ``prefix``. An extra ``error`` field holds the
+        error of the failed lookups.
+
+    input_format: str (optional)
+        "csv" or "ndjson". Default value is None, guessed from the input file extension.
+
+    max_workers: int
+        Maximum number of concurrent lookups (default 8)
+
+    checkpoint_path: str (optional)
+        Path of the checkpoint file. Default value is the output path plus ".checkpoint".
+
+    checkpoint_every: int
+        Number of rows between checkpoints, at least 1 (default 1000)
+
+    prefix: str
+        Prefix of the added fields (default "cc_")
+
+    restart: bool
+        If True, ignores any previous checkpoint and starts from the first row (default False)
+
+    key: callable (optional)
+        Function receiving a query and returning its deduplication key (e.g. ``normalize_address``). Default value
+        is None, the query itself.
+
+    Returns
+    -------
+    rows: number of rows processed by this run
+    """
+    if checkpoint_every < 1:
+        raise ValueError(f"checkpoint_every must be at least 1, not {checkpoint_every}")
+    input_format = input_format or (CSV_FORMAT if input_path.lower().endswith(".csv") else NDJSON_FORMAT)
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+    checkpoint = None if restart or not os.path.exists(output_path) else _read_checkpoint(checkpoint_path)
+    output_fields = [f"{prefix}{field}" for field in fields + ["error"]]
+    dedupe_key = key or (lambda value: value)
+
+    with open(input_path, newline="", encoding="utf-8") as input_file:
+        fieldnames = next(csv.reader([input_file.readline()])) if input_format == CSV_FORMAT else []
+
+        if checkpoint:
+            # drop the rows written after the last checkpoint and continue after the last committed row
+            input_file.seek(checkpoint["input_offset"])
+            output_file = open(output_path, "r+", newline="", encoding="utf-8")
+            output_file.seek(checkpoint["output_offset"])
+            output_file.truncate()
+        else:
+            checkpoint = {"input_offset": input_file.tell(), "output_offset": 0, "rows": 0}
+            output_file = open(output_path, "w", newline="", encoding="utf-8")
+
+        with output_file:
+            writer = None
+            if input_format == CSV_FORMAT:
+                writer = csv.DictWriter(output_file, fieldnames + output_fields, extrasaction="ignore")
+                if not checkpoint["output_offset"]:
+                    writer.writeheader()
+
+            def lookup_row(item):
+                return lookup(query(item[0]))
+
+            rows = imap_unique(lookup_row, _read_rows(input_file, input_format, fieldnames),
+                               key=lambda item: dedupe_key(query(item[0])), max_workers=max_workers, dedupe=False)
+            processed = 0
+            for (row, input_offset), result in rows:
+                if isinstance(result, Exception):
+                    row[f"{prefix}error"] = repr(result)
+                else:
+                    for field in fields:
+                        row[f"{prefix}{field}"] = (result or {}).get(field)
+
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    output_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+                processed += 1
+                checkpoint["input_offset"] = input_offset
+                checkpoint["rows"] += 1
+                if processed % checkpoint_every == 0:
+                    output_file.flush()
+                    os.fsync(output_file.fileno())
+                    checkpoint["output_offset"] = output_file.tell()
+                    _write_checkpoint(checkpoint_path, checkpoint)
+
+    # the job is complete, there is nothing to resume
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return processed
+
+
+def _positive_int(value: str) -> int:
+    """Parses a command line integer that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, not {number}")
+    return number
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="pycartociudad", description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    geocode_parser = commands.add_parser("geocode", help="geocode the addresses of a column")
+    geocode_parser.add_argument("--column", required=True, help="column (or NDJSON key) with the full addresses")
+
+    reverse_parser = commands.add_parser("reverse", help="reverse geocode the coordinates of two columns")
+    reverse_parser.add_argument("--lat-column", default="lat", help="column with the latitudes (default lat)")
+    reverse_parser.add_argument("--lon-column", default="lon", help="column with the longitudes (default lon)")
+    reverse_parser.add_argument("--cadastral", action="store_true", help="perform a cadastral reverse geocoding")
+
+    for command_parser in (geocode_parser, reverse_parser):
+        command_parser.add_argument("input", help="input CSV or NDJSON file")
+        command_parser.add_argument("output", help="output file, written in the same format as the input")
+        command_parser.add_argument("--format", choices=[CSV_FORMAT, NDJSON_FORMAT],
+                                    help="input format (default: guessed from the extension)")
+        command_parser.add_argument("--workers", type=int, default=8, help="concurrent requests (default 8)")
+        command_parser.add_argument("--checkpoint", help="checkpoint file (default: output file + .checkpoint)")
+        command_parser.add_argument("--checkpoint-every", type=_positive_int, default=1000,
+                                    help="rows between checkpoints (default 1000)")
+        command_parser.add_argument("--prefix", default="cc_", help="prefix of the added columns (default cc_)")
+        command_parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    """Entry point of the ``pycartociudad`` command"""
+    args = _build_parser().parse_args(argv)
+    client = Client(pool_maxsize=args.workers)
+
+    if args.command == "geocode":
+        def lookup(address):
+            return geocode(address, client=client)
+
+        def query(row):
+            return row.get(args.column)
+
+        fields, key = GEOCODE_FIELDS, normalize_address
+    else:
+        def lookup(point):
+            return reverse_geocode(point[0], point[1], cadastral=args.cadastral, client=client)
+
+        def query(row):
+            return row.get(args.lat_column), row.get(args.lon_column)
+
+        fields, key = REVERSE_GEOCODE_FIELDS, None
+
+    with client:
+        rows = process_file(args.input, args.output, lookup, query, fields, input_format=args.format,
+                            max_workers=args.workers, checkpoint_path=args.checkpoint,
+                            checkpoint_every=args.checkpoint_every, prefix=args.prefix, restart=args.restart, key=key)
+    print(f"{rows} rows written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+HTTP client shared by all the calls to the cartociudad, cadastre and census web services
+"""
+
+import contextlib
+import random
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from pycartociudad import instrumentation
+from pycartociudad.exceptions import DeadlineExceeded
+from pycartociudad.singleflight import SingleFlight
+from pycartociudad.transport import RequestsTransport, TimingAdapter, Transport
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+
+# statuses worth retrying, as the same request may succeed later
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# number of recent latencies per host kept to compute the hedging threshold, and minimum to start hedging
+LATENCY_WINDOW = 200
+MIN_HEDGE_SAMPLES = 20
+
+
+class Client:
+    """Pooled HTTP client used to reach the cartociudad, cadastre and census services.
+
+    It keeps a keep-alive connection pool per upstream host, so consecutive calls reuse the
+    already opened TCP/TLS connections instead of performing a new handshake on every request.
+
+    Parameters
+    ----------
+    pool_connections: int
+        Number of upstream hosts whose connection pool is kept alive (default 10)
+
+    pool_maxsize: int
+        Maximum number of connections kept alive per upstream host (default 10). Set it to, at
+        least, the number of threads sharing the client.
+
+    timeout: float or tuple
+        Default timeout in seconds for every request, either a single value or a
+        (connect, read) tuple (default (5, 30))
+
+    compression: bool
+        If True (default), ask the services for gzip/deflate compressed responses
+
+    session: requests.Session (optional)
+        Session to use instead of creating a new one
+
+    cache: SQLiteCache, QuantizedLRUCache or TieredCache (optional)
+        Cache of the geocoding, reverse geocoding, location info and routing results. Default value is None, no cache.
+
+    census_index: CensusIndex (optional)
+        Local index of census sections used by ``get_census_info`` before querying the census service.
+        Default value is None, every point is queried to the service.
+
+    local_geocoder: LocalGeocoder (optional)
+        Local index of streets and portals used by ``geocode`` before querying the geocoding service, which is only
+        queried for the addresses whose street is not found, and by ``reverse_geocode`` for the points with a portal
+        within 100 meters. Default value is None, every address and point is queried.
+
+    local_router: LocalRouter (optional)
+        Local graph of the road network used by ``route_between_two_points`` and ``route_matrix`` before querying
+        the routing service, which is only queried for the routes with an end outside the graph or without a route
+        in it. Default value is None, every route is queried.
+
+    throttle: Throttle (optional)
+        Per-host rate and adaptive concurrency limiter, which can be shared with other clients.
+        Default value is None, requests are not paced.
+
+    retries: int
+        Maximum number of retries of a request after a connection error, a timeout or a 429/5xx answer (default 2)
+
+    backoff: float
+        Base delay in seconds of the exponential backoff between retries (default 0.2). The actual delay is random,
+        up to ``backoff * 2 ** attempt`` seconds, or the ``Retry-After`` of the answer if it is longer.
+
+    max_backoff: float
+        Maximum delay in seconds between retries (default 10)
+
+    deadline: float (optional)
+        Maximum seconds of every call, retries included. Default value is None, calls are only bounded by the
+        timeout and the number of retries.
+
+    hedge: bool
+        If True, a request taking longer than the ``hedge_quantile`` of the recent latencies of its host is sent
+        again, and the first answer is used (default False)
+
+    hedge_quantile: float
+        Quantile of the latencies used as hedging threshold (default 0.95)
+
+    coalesce: bool
+        If True, concurrent identical geocoding, reverse geocoding, location info and routing calls share a single
+        upstream request and its result (default False)
+
+    transport: Transport (optional)
+        Transport performing the requests, e.g. a ``ReplayTransport`` answering from a cassette file. Default value
+        is None, a ``RequestsTransport`` on the pooled session.
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10, timeout=DEFAULT_TIMEOUT,
+                 compression: bool = True, session: requests.Session = None, cache=None, census_index=None,
+                 local_geocoder=None, local_router=None, throttle=None, retries: int = 2, backoff: float = 0.2,
+                 max_backoff: float = 10, deadline: float = None, hedge: bool = False, hedge_quantile: float = 0.95,
+                 coalesce: bool = False, transport: Transport = None):
+        self.timeout = timeout
+        self.cache = cache
+        self.census_index = census_index
+        self.local_geocoder = local_geocoder
+        self.local_router = local_router
+        self.throttle = throttle
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.flights = SingleFlight() if coalesce else None
+        self.session = session or requests.Session()
+        self._pool_maxsize = pool_maxsize
+        self._latencies = {}
+        self._hedge_executor = None
+        self._lock = threading.Lock()
+
+        adapter = TimingAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["Accept-Encoding"] = "gzip, deflate" if compression else "identity"
+        self.transport = transport or RequestsTransport(self.session)
+        if transport is not None and hasattr(transport, "use_default"):
+            transport.use_default(RequestsTransport(self.session))
+
+    def get(self, url: str, params=None, timeout=None, deadline: float = None) -> requests.Response:
+        """Performs a GET request through the connection pool.
+
+        Connection errors, timeouts and overloaded answers (429 and 5xx) are retried after a jittered exponential
+        backoff, and the request is hedged if the client has ``hedge`` enabled.
+
+        Parameters
+        ----------
+        url: str
+            Request URL
+
+        params: dict or str (optional)
+            Query string parameters
+
+        timeout: float or tuple (optional)
+            Timeout of every attempt. Default value is the client timeout.
+
+        deadline: float (optional)
+            Maximum seconds for the whole call, retries included. Default value is the client deadline.
+
+        Returns
+        -------
+        response: the ``requests.Response`` of the request. It is the last answer if every attempt was overloaded.
+        """
+        timeout = timeout or self.timeout
+        deadline = deadline or self.deadline
+        deadline_at = _current_deadline(time.monotonic() + deadline if deadline is not None else None)
+        host = urllib.parse.urlsplit(url).netloc
+
+        attempt = 0
+        while True:
+            attempt_timeout = _bounded_timeout(timeout, deadline_at)
+            start = time.monotonic()
+            try:
+                response = self._hedged_send(host, url, params, attempt_timeout)
+            except requests.exceptions.RequestException as err:
+                if instrumentation.enabled():
+                    instrumentation.emit(instrumentation.request_event(url, host, attempt, start, error=err))
+                if attempt >= self.retries:
+                    raise
+                error, response, retry_after = err, None, None
+            else:
+                if instrumentation.enabled():
+                    instrumentation.emit(instrumentation.request_event(url, host, attempt, start, response))
+                if response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                error, retry_after = None, response.headers.get("Retry-After")
+
+            delay = backoff_delay(attempt, self.backoff, self.max_backoff, retry_after)
+            if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+                if response is not None:
+                    return response
+                raise DeadlineExceeded(f"Deadline exceeded requesting {url}") from error
+            time.sleep(delay)
+            attempt += 1
+
+    def _hedged_send(self, host: str, url: str, params, timeout) -> requests.Response:
+        """Sends a request. If hedging is enabled and it takes longer than the usual latency of the host, sends a
+        duplicate and returns the first answer."""
+        hedge_after = self._hedge_after(host) if self.hedge else None
+        if hedge_after is None:
+            return self._send(host, url, params, timeout)
+
+        executor = self._get_hedge_executor()
+        futures = [executor.submit(self._send, host, url, params, timeout)]
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            futures.append(executor.submit(self._send, host, url, params, timeout))
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        future = done.pop()
+        if future.exception() is not None and len(futures) > 1:
+            # the other request may still succeed
+            other = futures[1] if future is futures[0] else futures[0]
+            return other.result()
+        return future.result()
+
+    def _send(self, host: str, url: str, params, timeout) -> requests.Response:
+        """Sends a single request through the throttle, recording its latency"""
+        token = self.throttle.acquire(host) if self.throttle is not None else None
+        start = time.monotonic()
+        response, failed = None, False
+        try:
+            response = self.transport.send(url, params, timeout)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # the slot is freed however the request ends; the interrupted ones are not reported as failures
+            if token is not None:
+                if response is not None:
+                    self.throttle.release(token, response.status_code, response.headers.get("Retry-After"))
+                else:
+                    self.throttle.release(token, cancelled=not failed)
+        if self.hedge and response.status_code < 400:
+            with self._lock:
+                self._latencies.setdefault(host, deque(maxlen=LATENCY_WINDOW)).append(time.monotonic() - start)
+        return response
+
+    def _hedge_after(self, host: str) -> float:
+        """Returns the ``hedge_quantile`` of the recent latencies of a host, or None if there are too few of them"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(host, ()))
+        if len(latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(self.hedge_quantile * len(latencies)))]
+
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        if self._hedge_executor is None:
+            with self._lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(max_workers=2 * self._pool_maxsize,
+                                                              thread_name_prefix="pycartociudad-hedge")
+        return self._hedge_executor
+
+    def close(self):
+        """Closes all the pooled connections"""
+        self.transport.close()
+        self.session.close()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def backoff_delay(attempt: int, backoff: float, max_backoff: float, retry_after: str = None) -> float:
+    """Returns the delay before a retry: a random "full jitter" delay of up to ``backoff * 2 ** attempt`` seconds,
+    or the Retry-After of the answer if it is a longer number of seconds"""
+    delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+    try:
+        return max(delay, min(max_backoff, float(retry_after))) if retry_after else delay
+    except ValueError:
+        return delay
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def deadline(seconds: float):
+    """Bounds the total time of the requests performed by the current thread inside the block, retries included.
+    Requests that can't finish in time raise ``DeadlineExceeded``.
+
+    Parameters
+    ----------
+    seconds: float
+        Time budget of the block
+    """
+    with _deadline_at(time.monotonic() + seconds):
+        yield
+
+
+@contextlib.contextmanager
+def _deadline_at(deadline_at: float):
+    """Sets the deadline (a ``time.monotonic`` value) of the current thread inside the block"""
+    previous = getattr(_local, "deadline_at", None)
+    _local.deadline_at = _current_deadline(deadline_at)
+    try:
+        yield
+    finally:
+        _local.deadline_at = previous
+
+
+def _current_deadline(deadline_at: float = None) -> float:
+    """Returns the earliest of a deadline and the one of the current thread, or None if there is none"""
+    thread_deadline_at = getattr(_local, "deadline_at", None)
+    if thread_deadline_at is None or deadline_at is None:
+        return deadline_at if thread_deadline_at is None else thread_deadline_at
+    return min(deadline_at, thread_deadline_at)
+
+
+def _bounded_timeout(timeout, deadline_at: float):
+    """Caps a request timeout to the time left until the deadline. Raises ``DeadlineExceeded`` if none is left."""
+    if deadline_at is None:
+        return timeout
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded")
+    if isinstance(timeout, tuple):
+        return tuple(remaining if value is None else min(value, remaining) for value in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> Client:
+    """Returns the client shared by all the calls that don't receive an explicit one. It is created on first use."""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = Client()
+    return _default_client
+
+
+def set_default_client(client: Client):
+    """Replaces the client shared by all the calls that don't receive an explicit one.
+
+    Parameters
+    ----------
+    client: Client
+        The new default client. If None, a new one with the default settings will be created on next use.
+    """
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
@@ -0,0 +1,23 @@
+"""
+Exceptions raised by the pycartociudad functions
+"""
+
+
+class CartociudadError(Exception):
+    """Base class of the errors raised by the pycartociudad functions"""
+
+
+class ServiceError(CartociudadError):
+    """A web service answered with an HTTP error or a response that can't be parsed"""
+
+
+class RouteNotFoundError(CartociudadError):
+    """The routing service didn't find a route between the points"""
+
+
+class DeadlineExceeded(CartociudadError, TimeoutError):
+    """The deadline of a call, or the time budget of a batch, ran out before it finished"""
+
+
+class ReplayMissError(CartociudadError, LookupError):
+    """A replay transport received a request that isn't recorded in its cassette"""
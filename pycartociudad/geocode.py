@@ -2,12 +2,19 @@
 
 Geolocation of Spanish addresses via Cartociudad API calls
 """
-import requests
 import urllib
-import json
+from typing import Iterable, Iterator, Tuple
+from pycartociudad._batch import imap_unique
+from pycartociudad._decode import loads_jsonp
+from pycartociudad.cache import cached
+from pycartociudad.client import Client, get_default_client
+from pycartociudad.normalize import normalize_address
+from pycartociudad.results import GeocodeResult
 
+GEOCODER_URL = 'http://www.cartociudad.es/geocoder/api/geocoder/findJsonp'
 
-def geocode(full_address: str):
+
+def geocode(full_address: str, client: Client = None, typed: bool = False):
     """This function performs the geocoding of an address. It returns
     the details of the closest address in Spain.
 
@@ -18,6 +25,13 @@ def geocode(full_address: str):
         geolocated; e.g., "calle miguel servet 5, zaragoza".
         Adding the country may cause problems.
 
+    client : Client (optional)
+        HTTP client used to perform the request. Default value is None
+        and will use the shared default client.
+
+    typed : bool (optional) (default: False)
+        If True, returns a compact ``GeocodeResult`` instead of a dict
+
     Returns
     -------
     geolocation
@@ -39,21 +53,87 @@ def geocode(full_address: str):
     """
     # check & parse parameter
     if not full_address:
-        return {}
-    
+        return GeocodeResult() if typed else {}
+
+    # build url
+    url = _build_url(full_address)
+
+    # perform request, unless the street is in the local index of the client
+    client = client or get_default_client()
+    if client.local_geocoder is not None:
+        result = client.local_geocoder.lookup(full_address)
+        if result:
+            return GeocodeResult(result) if typed else result
+
+    def request():
+        return _parse_response(client.get(url))
+
+    # different spellings of the same address share their cache entry and in-flight request
+    result = cached(client.cache, 'geocode', normalize_address(full_address), request, flights=client.flights)
+    return GeocodeResult(result) if typed else result
+
+
+def _build_url(full_address) -> str:
+    """Builds the geocoder request url of an address"""
     if not isinstance(full_address, str):
         full_address = str(full_address)
 
     full_address = urllib.parse.quote(full_address)
 
-    # build url
-    url = f'http://www.cartociudad.es/geocoder/api/geocoder/findJsonp?q={full_address}'
+    return f'{GEOCODER_URL}?q={full_address}'
 
-    # perform request
-    r = requests.get(url)
 
-    # format output
-    result = r.text.replace('callback(', '')[:-1]
-    result = json.loads(result)
+def _parse_response(r) -> dict:
+    """Formats the JSONP geocoder response as a dict"""
+    result = loads_jsonp(r.content, 'geocode')
 
     return result or {}
+
+
+def geocode_many(addresses: Iterable[str], max_workers: int = 8, ordered: bool = True,
+                 client: Client = None, time_budget: float = None, typed: bool = False) -> Iterator[Tuple[str, dict]]:
+    """Geocodes many addresses concurrently. Duplicated addresses, including
+    different spellings of the same one (see ``normalize_address``), are
+    only requested once.
+
+    Parameters
+    ----------
+    addresses : iterable of str
+        Addresses to be geolocated. Any iterable is allowed, including
+        generators, and it is consumed lazily.
+
+    max_workers : int
+        Maximum number of concurrent requests (default 8). The pool size of
+        the client should be at least this value.
+
+    ordered : bool
+        If True (default), results are yielded in the same order as the
+        addresses. Otherwise, they are yielded as soon as they are ready.
+
+    client : Client (optional)
+        HTTP client used to perform the requests. Default value is None
+        and will use the shared default client.
+
+    time_budget : float (optional)
+        Maximum seconds for the whole batch. The addresses not geocoded in
+        time get a ``DeadlineExceeded`` result. Default value is None, no
+        limit.
+
+    typed : bool
+        If True, the geolocations are compact ``GeocodeResult`` objects
+        instead of dicts (default False)
+
+    Returns
+    -------
+    results
+        A generator of (address, geolocation) tuples, where geolocation is
+        the ``geocode`` result of the address, or the exception raised
+        while geocoding it. A failing address doesn't stop the batch.
+    """
+    client = client or get_default_client()
+
+    def geocode_one(address):
+        return geocode(address, client=client, typed=typed)
+
+    return imap_unique(geocode_one, addresses, key=normalize_address, max_workers=max_workers, ordered=ordered,
+                       time_budget=time_budget)
@@ -2,14 +2,37 @@
 Get extra information of a location using official spanish web map services
 """
 
-from typing import List
-import requests
-import xml.etree.ElementTree as ET
-from pycartociudad import reverse_geocode
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+from pycartociudad.reverse_geocode import reverse_geocode
+from pycartociudad._batch import imap_unique
+from pycartociudad._decode import parse_xml
+from pycartociudad.cache import cached, lookup
+from pycartociudad.client import Client, _current_deadline, _deadline_at, get_default_client
+from pycartociudad.results import LocationInfo
 
+CADASTRE_SOURCE = "cadastre"
+CENSUS_SOURCE = "census"
+GEOCODING_SOURCE = "geocoding"
+ALL_SOURCES = [CADASTRE_SOURCE, CENSUS_SOURCE, GEOCODING_SOURCE]
 
-def get_location_info(latitude: float, longitude: float, sources: List[str] = None):
+# fields of a source that failed
+_EMPTY_FIELDS = {
+    CADASTRE_SOURCE: {"cadastral_ref": None},
+    CENSUS_SOURCE: {"census_section": None, "district_code": None},
+}
+
+CADASTRE_URL = "https://ovc.catastro.meh.es/ovcservweb/OVCSWLocalizacionRC/OVCCoordenadas.asmx/Consulta_RCCOOR"
+CENSUS_URL = "http://servicios.internet.ine.es/WMS/WMS_INE_SECCIONES_G01/MapServer/WMSServer"
+
+
+def get_location_info(latitude: float, longitude: float, sources: List[str] = None, client: Client = None,
+                      timeout: Union[float, Dict[str, float]] = None, typed: bool = False):
     """Retrieves info from the given location and specified sources. Allowed sources are cadastre, census and geocoding.
+    The sources are queried concurrently.
 
     Parameters
     ----------
@@ -29,6 +52,16 @@ def get_location_info(latitude: float, longitude: float, sources: List[str] = No
             * "geocoding": retrieves from cartociudad API the geocoding data (same as using the
               function ``pycartociudad.reverse_geocode``)
 
+    client: Client (optional)
+        HTTP client used to perform the requests. Default value is None and will use the shared default client.
+
+    timeout: float or dict (optional)
+        Maximum seconds to wait for each source, either a single value or a dict by source
+        (e.g. {"census": 2, "cadastre": 5}). Default value is None, waits until the client timeout.
+
+    typed: bool
+        If True, returns a compact ``LocationInfo`` instead of a dict (default False)
+
     Returns
     -------
     location_information: a dict with the following elements:
@@ -38,36 +71,185 @@ def get_location_info(latitude: float, longitude: float, sources: List[str] = No
         * district_code: the district code. Only if census source is selected.
         * tipo, tipoVia, ... and rest of the fields from ``pycartociudad.reverse_geocode``: the geocoding data.
           Only if "geocoding" is selected.
+        * errors: a dict with the exception raised by each failed or timed out source. Only if any failed; the
+          fields of the failed sources are None (cadastre, census) or missing (geocoding).
     """
     # Check the parameters
-    cadastre_source = "cadastre"
-    census_source = "census"
-    geocoding_source = "geocoding"
-    all_sources = [cadastre_source, census_source, geocoding_source]
+    sources = _check_sources(sources)
+    client = client or get_default_client()
 
-    if sources is None:
-        sources = all_sources
+    def request():
+        return _get_location_info(latitude, longitude, sources, client, timeout)
 
-    invalid_sources = set(sources) - set(all_sources)
-    if invalid_sources:
-        raise ValueError(f"Invalid sources: {', '.join(invalid_sources)}")
+    # partial results are not cached
+    query = _cache_query(latitude, longitude, sources)
+    result = cached(client.cache, "location_info", query, request, keep=lambda result: "errors" not in result,
+                    flights=client.flights)
+    return LocationInfo(result) if typed else result
+
+
+def get_location_info_many(points: Iterable[Tuple[float, float]], sources: List[str] = None, max_workers: int = 8,
+                           client: Client = None, time_budget: float = None,
+                           typed: bool = False) -> Iterator[Tuple[Tuple[float, float], dict]]:
+    """Retrieves the info of many locations. The requests to every source for every point are pipelined through the
+    same pool of threads, so the slowest service doesn't hold back the others. As in ``get_location_info``, the points
+    are looked up in the cache of the client and their complete results are stored in it.
+
+    Parameters
+    ----------
+    points: iterable of (latitude, longitude) tuples
+        Points in geographical coordinates. Any iterable is allowed, including generators, and it is consumed lazily.
+
+    sources: list of str
+        List of sources to retrieve the data from. Allowed values are ["cadastre", "census", "geocoding"].
+        Default value is None and will retrieve the data from all the sources.
+
+    max_workers: int
+        Maximum number of concurrent requests (default 8)
+
+    client: Client (optional)
+        HTTP client used to perform the requests. Default value is None and will use the shared default client.
+
+    time_budget: float (optional)
+        Maximum seconds for the whole batch. The sources not queried in time are reported as ``DeadlineExceeded``
+        errors. Default value is None, no limit.
+
+    typed: bool
+        If True, the location informations are compact ``LocationInfo`` objects instead of dicts (default False)
+
+    Returns
+    -------
+    results: a generator of (point, location_information) tuples, in the same order as the points. See
+    ``get_location_info`` for the details of location_information.
+    """
+    sources = [source for source in ALL_SOURCES if source in _check_sources(sources)]
+    client = client or get_default_client()
+
+    def tasks():
+        # the points in the cache are a single task carrying their result
+        for point in points:
+            result = lookup(client.cache, "location_info", _cache_query(*point, sources))
+            if result is not None:
+                yield point, None, result
+                continue
+            for source in sources:
+                yield point, source, None
+
+    def query_source(task):
+        (latitude, longitude), source, result = task
+        return result if source is None else _query_source(source, latitude, longitude, client)
+
+    # the results are only kept while their point is in the window, so the memory doesn't grow with the stream
+    results = imap_unique(query_source, tasks(), key=lambda task: (tuple(task[0]), task[1]),
+                          max_workers=max_workers, window=4 * max_workers * len(sources), dedupe=False,
+                          time_budget=time_budget)
+
+    # the results of the sources of a point are consecutive
+    partials = {}
+    for (point, source, hit), partial in results:
+        if source is None:
+            yield point, LocationInfo(hit) if typed else hit
+            continue
+        partials[source] = partial
+        if len(partials) == len(sources):
+            result = _merge_sources(sources, partials)
+            # partial results are not cached
+            if client.cache is not None and "errors" not in result:
+                client.cache.set("location_info", _cache_query(*point, sources), result)
+            yield point, LocationInfo(result) if typed else result
+            partials = {}
+
+
+def _cache_query(latitude: float, longitude: float, sources: List[str]) -> dict:
+    """Builds the cache query of the location info of a point"""
+    return {"lat": latitude, "lon": longitude, "sources": ",".join(sorted(sources))}
 
-    # Retrieve the information from the specified sources
+
+def _get_location_info(latitude: float, longitude: float, sources: List[str], client: Client,
+                       timeout: Union[float, Dict[str, float]]) -> dict:
+    """Retrieves the information from the specified sources concurrently"""
+    start = time.monotonic()
+    executor = _get_executor()
+    # the deadline of the calling thread also bounds the requests of the pool threads
+    deadline_at = _current_deadline()
+
+    def query_source(source):
+        with _deadline_at(deadline_at):
+            return _query_source(source, latitude, longitude, client)
+
+    futures = {source: executor.submit(query_source, source) for source in sources}
+
+    partials = {}
+    for source, future in futures.items():
+        source_timeout = timeout.get(source) if isinstance(timeout, dict) else timeout
+        if source_timeout is not None:
+            source_timeout = max(0, start + source_timeout - time.monotonic())
+        try:
+            partials[source] = future.result(timeout=source_timeout)
+        except FutureTimeoutError:
+            partials[source] = TimeoutError(f"{source} source didn't answer in time")
+        except Exception as err:
+            partials[source] = err
+
+    return _merge_sources(sources, partials)
+
+
+def _query_source(source: str, latitude: float, longitude: float, client: Client) -> dict:
+    """Retrieves the fields provided by a single source"""
+    if source == CADASTRE_SOURCE:
+        return {"cadastral_ref": get_cadastral_reference(latitude, longitude, client=client)}
+    if source == CENSUS_SOURCE:
+        census_data = get_census_info(latitude, longitude, client=client)
+        return {"census_section": census_data.get("census_section"), "district_code": census_data.get("district_code")}
+    return reverse_geocode(latitude, longitude, cadastral=False, client=client) or {}
+
+
+def _merge_sources(sources: List[str], partials: Dict[str, Union[dict, BaseException]]) -> dict:
+    """Merges the fields of every source, in the cadastre, census and geocoding order.
+    Failed sources are reported in the errors field."""
     result = {}
-    if cadastre_source in sources:
-        result["cadastral_ref"] = get_cadastral_reference(latitude, longitude)
-    if census_source in sources:
-        census_data = get_census_info(latitude, longitude)
-        result["census_section"] = census_data.get("census_section")
-        result["district_code"] = census_data.get("district_code")
-    if geocoding_source in sources:
-        geocoding_data = reverse_geocode(latitude, longitude, cadastral=False) or {}
-        result = {**result, **geocoding_data}
+    errors = {}
+    for source in ALL_SOURCES:
+        if source not in sources:
+            continue
+        partial = partials[source]
+        if isinstance(partial, BaseException):
+            errors[source] = partial
+            partial = _EMPTY_FIELDS.get(source, {})
+        result = {**result, **partial}
 
+    if errors:
+        result["errors"] = errors
     return result
 
 
-def get_cadastral_reference(latitude: float, longitude: float, srs: str = "EPSG:4326"):
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Returns the pool of threads shared by all the location info requests"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="pycartociudad")
+    return _executor
+
+
+def _check_sources(sources: List[str]) -> List[str]:
+    """Validates the requested sources. If None, all the sources are returned."""
+    if sources is None:
+        sources = ALL_SOURCES
+
+    invalid_sources = set(sources) - set(ALL_SOURCES)
+    if invalid_sources:
+        raise ValueError(f"Invalid sources: {', '.join(invalid_sources)}")
+
+    return sources
+
+
+def get_cadastral_reference(latitude: float, longitude: float, srs: str = "EPSG:4326", client: Client = None):
     """Performs a request to the spanish cadastre web API. It returns the cadastral reference of the given location.
 
     Parameters
@@ -81,17 +263,24 @@ def get_cadastral_reference(latitude: float, longitude: float, srs: str = "EPSG:
     srs: str
         Spatial reference system code (e.g. "EPSG:4230"). Default value is "EPSG:4326" (i.e. WGS 80)
 
+    client: Client (optional)
+        HTTP client used to perform the request. Default value is None and will use the shared default client.
+
     Returns
     -------
     cadastral_reference: a string with the cadastral reference, or None if not found
     """
     # Make the API requests
-    url = "https://ovc.catastro.meh.es/ovcservweb/OVCSWLocalizacionRC/OVCCoordenadas.asmx/Consulta_RCCOOR"
     params = {"SRS": srs, "Coordenada_X": longitude, "Coordenada_Y": latitude}
-    response = requests.get(url, params)
+    client = client or get_default_client()
+    response = client.get(CADASTRE_URL, params)
+
+    return _parse_cadastral_reference(response)
 
-    # Parse the XML response
-    root = ET.fromstring(response.text)
+
+def _parse_cadastral_reference(response):
+    """Parses the XML response of the cadastre service"""
+    root = parse_xml(response.content, CADASTRE_SOURCE)
     ns = "{http://www.catastro.meh.es/}"  # the namespace of the xml elements
     xml_ref = root.find(f"{ns}coordenadas/{ns}coord/{ns}pc")
     if xml_ref is not None:
@@ -105,10 +294,11 @@ def get_cadastral_reference(latitude: float, longitude: float, srs: str = "EPSG:
     return cadastral_ref
 
 
-def get_census_info(latitude: float, longitude: float):
+def get_census_info(latitude: float, longitude: float, client: Client = None):
     """
     Performs a request to the spanish national institute of statistics map web services. It returns the census section
-    and district codes
+    and district codes. If the client has a ``census_index``, the point is looked up locally first and the service is
+    only queried if it is outside every indexed section.
 
     Parameters
     ----------
@@ -118,12 +308,29 @@ def get_census_info(latitude: float, longitude: float):
     longitude: float
         Point longitude in geographical coordinates (e.g., -3.7227241)
 
+    client: Client (optional)
+        HTTP client used to perform the request. Default value is None and will use the shared default client.
+
     Returns
     -------
     census_information: a dict with two elements, census_section and district_code. Or an empty dict if no results were
     found.
     """
-    # Build the request parameters
+    # Look up the local index
+    client = client or get_default_client()
+    if client.census_index is not None:
+        census_data = client.census_index.lookup(latitude, longitude)
+        if census_data:
+            return census_data
+
+    # Make the request
+    response = client.get(CENSUS_URL, _census_params(latitude, longitude))
+
+    return _parse_census_info(response)
+
+
+def _census_params(latitude: float, longitude: float) -> dict:
+    """Builds the WMS GetFeatureInfo parameters of a census request"""
     # TODO - parametrize year, automatically select the most recent one?
     bbox = [latitude, longitude, latitude + 1e-5, longitude + 1e-5]
     str_bbox = ",".join([str(point) for point in bbox])
@@ -144,13 +351,13 @@ def get_census_info(latitude: float, longitude: float):
         "crs": "EPSG:4326",
     }
 
-    # Make the request
-    url = "http://servicios.internet.ine.es/WMS/WMS_INE_SECCIONES_G01/MapServer/WMSServer"
-    response = requests.get(url, params)
+    return params
+
 
-    # Parse the XML response
+def _parse_census_info(response) -> dict:
+    """Parses the XML response of the census service"""
     result = {}
-    root = ET.fromstring(response.text)
+    root = parse_xml(response.content, CENSUS_SOURCE)
     section_xml = root.find(".//*[@CUSEC]")
     district_xml = root.find(".//*[@CUDIS]")
     if section_xml is not None:
@@ -0,0 +1,328 @@
+"""
+Instrumentation hooks of the requests, caches, coalescing and decoding of the pycartociudad functions
+
+Hooks are callables receiving an ``Event``, subscribed for the whole process with ``subscribe``. Without subscribed
+hooks the instrumented code only checks an empty list, so it costs next to nothing. Two hooks are included:
+``PrometheusExporter``, which aggregates the events into metrics in the Prometheus text format, and ``SpanEmitter``,
+which turns the requests into OpenTelemetry-compatible spans.
+"""
+
+import threading
+import time
+import urllib.parse
+from collections import deque
+from typing import Callable, Dict, Tuple
+
+# event kinds
+REQUEST = "request"
+DECODE = "decode"
+CACHE = "cache"
+COALESCE = "coalesce"
+
+# endpoint name by the last segment of the path of the service URLs
+_ENDPOINTS = {
+    "findJsonp": "geocode",
+    "reverseGeocode": "reverse_geocode",
+    "route": "route",
+    "Consulta_RCCOOR": "cadastre",
+    "WMSServer": "census",
+}
+
+# upper bounds in seconds of the buckets of the duration histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_hooks = []
+_lock = threading.Lock()
+
+
+class Event:
+    """Something measured inside a call. The fields not applying to its kind are None.
+
+    Attributes
+    ----------
+    kind: str
+        "request" (an attempt of an HTTP request), "decode" (parsing of a response body), "cache" (lookup of a
+        result in the cache of the client) or "coalesce" (call joining an identical one in flight)
+
+    endpoint: str
+        Queried endpoint: "geocode", "reverse_geocode", "route", "cadastre" or "census"
+
+    host: str
+        Upstream host of the requests
+
+    status: int
+        HTTP status of the requests, None if they failed without answer
+
+    attempt: int
+        Number of the attempt of the requests, 0 for the first one and the retry number for the rest
+
+    connect_time, ttfb, duration: float
+        Seconds to open the connection (None if the transport doesn't report it, 0 if it was reused), to receive the
+        response headers and of the whole request, decoding or coalesced wait
+
+    size: int
+        Bytes of the response bodies
+
+    hit: bool
+        Whether the cache lookups found the result
+
+    shared: bool
+        Whether the coalesced calls waited on another one instead of performing the request
+
+    error: BaseException
+        Exception of the failed requests
+
+    timestamp: float
+        Wall clock time (``time.time()``) of the end of the event
+    """
+
+    __slots__ = ("kind", "endpoint", "host", "status", "attempt", "connect_time", "ttfb", "duration", "size", "hit",
+                 "shared", "error", "timestamp")
+
+    def __init__(self, kind: str, endpoint: str = None, host: str = None, status: int = None, attempt: int = None,
+                 connect_time: float = None, ttfb: float = None, duration: float = None, size: int = None,
+                 hit: bool = None, shared: bool = None, error: BaseException = None):
+        self.kind = kind
+        self.endpoint = endpoint
+        self.host = host
+        self.status = status
+        self.attempt = attempt
+        self.connect_time = connect_time
+        self.ttfb = ttfb
+        self.duration = duration
+        self.size = size
+        self.hit = hit
+        self.shared = shared
+        self.error = error
+        self.timestamp = time.time()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__[1:-1]
+                           if getattr(self, name) is not None)
+        return f"Event({self.kind!r}, {fields})"
+
+
+def subscribe(hook: Callable[[Event], None]) -> Callable[[Event], None]:
+    """Subscribes a hook to the events of every call. Hooks run synchronously in the thread (or event loop) of the
+    call, so they should be fast; their exceptions are not caught.
+
+    Parameters
+    ----------
+    hook: callable
+        Function receiving every ``Event``
+
+    Returns
+    -------
+    hook: the same hook, so it can be used as a decorator
+    """
+    global _hooks
+    with _lock:
+        _hooks = _hooks + [hook]
+    return hook
+
+
+def unsubscribe(hook: Callable[[Event], None]):
+    """Unsubscribes a hook. Does nothing if it wasn't subscribed."""
+    global _hooks
+    with _lock:
+        _hooks = [subscribed for subscribed in _hooks if subscribed != hook]
+
+
+def enabled() -> bool:
+    """Returns whether any hook is subscribed. The instrumented code checks it before measuring anything."""
+    return bool(_hooks)
+
+
+def emit(event: Event):
+    """Sends an event to every subscribed hook"""
+    for hook in _hooks:
+        hook(event)
+
+
+def endpoint_of(url: str) -> str:
+    """Returns the endpoint name of a service URL, or the last segment of its path for unknown services"""
+    segment = urllib.parse.urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1]
+    return _ENDPOINTS.get(segment, segment)
+
+
+def request_event(url: str, host: str, attempt: int, start: float, response=None,
+                  error: BaseException = None) -> Event:
+    """Builds the event of a request attempt started at ``start`` (a ``time.monotonic`` value)"""
+    duration = time.monotonic() - start
+    if response is None:
+        return Event(REQUEST, endpoint_of(url), host, attempt=attempt, duration=duration, error=error)
+    elapsed = getattr(response, "elapsed", None)
+    return Event(REQUEST, endpoint_of(url), host, response.status_code, attempt,
+                 connect_time=getattr(response, "connect_time", None),
+                 ttfb=elapsed.total_seconds() if elapsed is not None else None,
+                 duration=duration, size=len(response.content))
+
+
+def _labels(labels: Tuple[Tuple[str, object], ...]) -> str:
+    """Formats the labels of a Prometheus series, escaping their values"""
+    if not labels:
+        return ""
+    values = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, values)) + "}"
+
+
+class _Histogram:
+    """Cumulative histogram of a Prometheus metric"""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.total = 0.0
+        self.count = 0
+
+
+class PrometheusExporter:
+    """Hook aggregating the events into Prometheus metrics, rendered in the text exposition format by ``render``.
+
+    Parameters
+    ----------
+    buckets: tuple of float
+        Upper bounds in seconds of the buckets of the duration histograms (default from 5 ms to 10 s)
+
+    prefix: str
+        Prefix of the metric names (default "pycartociudad")
+
+    Example
+    -------
+    >>> exporter = subscribe(PrometheusExporter())
+    >>> print(exporter.render())
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, prefix: str = "pycartociudad"):
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: Event):
+        endpoint = ("endpoint", event.endpoint)
+        with self._lock:
+            if event.kind == REQUEST:
+                status = event.status if event.status is not None else type(event.error).__name__
+                self._count("requests_total", "Requests sent to the services, retries included",
+                            (endpoint, ("host", event.host), ("status", status)))
+                if event.attempt:
+                    self._count("retries_total", "Retried requests", (endpoint,))
+                self._observe("request_duration_seconds", "Duration of the requests", (endpoint,), event.duration)
+                if event.ttfb is not None:
+                    self._observe("request_ttfb_seconds", "Time to the first byte of the answers", (endpoint,),
+                                  event.ttfb)
+                if event.connect_time is not None:
+                    self._observe("connect_duration_seconds", "Time to open the connections", (endpoint,),
+                                  event.connect_time)
+                if event.size is not None:
+                    self._count("response_bytes_total", "Bytes of the response bodies", (endpoint,), event.size)
+            elif event.kind == DECODE:
+                self._observe("decode_duration_seconds", "Time to parse the response bodies", (endpoint,),
+                              event.duration)
+            elif event.kind == CACHE:
+                self._count("cache_lookups_total", "Lookups in the result caches",
+                            (endpoint, ("result", "hit" if event.hit else "miss")))
+            elif event.kind == COALESCE:
+                self._count("coalesced_calls_total", "Calls going through the coalescing of identical calls",
+                            (endpoint, ("shared", "true" if event.shared else "false")))
+                if event.shared:
+                    self._observe("coalesced_wait_seconds", "Time waited by the coalesced calls", (endpoint,),
+                                  event.duration)
+
+    def _count(self, name: str, description: str, labels: tuple, value: float = 1):
+        metric = self._counters.setdefault(name, (description, {}))[1]
+        metric[labels] = metric.get(labels, 0) + value
+
+    def _observe(self, name: str, description: str, labels: tuple, value: float):
+        metric = self._histograms.setdefault(name, (description, {}))[1]
+        histogram = metric.get(labels)
+        if histogram is None:
+            histogram = metric[labels] = _Histogram(len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram.counts[i] += 1
+        histogram.total += value
+        histogram.count += 1
+
+    def render(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (description, series) in sorted(self._counters.items()):
+                name = f"{self.prefix}_{name}"
+                lines.extend([f"# HELP {name} {description}", f"# TYPE {name} counter"])
+                for labels, value in sorted(series.items(), key=lambda item: str(item[0])):
+                    lines.append(f"{name}{_labels(labels)} {value:g}")
+            for name, (description, series) in sorted(self._histograms.items()):
+                name = f"{self.prefix}_{name}"
+                lines.extend([f"# HELP {name} {description}", f"# TYPE {name} histogram"])
+                for labels, histogram in sorted(series.items(), key=lambda item: str(item[0])):
+                    for bound, count in zip(self.buckets, histogram.counts):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {count}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.total:g}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class SpanEmitter:
+    """Hook turning every request attempt into an OpenTelemetry-compatible span.
+
+    The spans follow the OpenTelemetry semantic conventions of HTTP clients. They are created with an OpenTelemetry
+    ``Tracer`` if one is given (``opentelemetry`` isn't a dependency; any object with its ``start_span`` method
+    works). Otherwise they are built as dicts and passed to ``on_span``, or kept in ``spans``, a deque with the last
+    ``max_spans`` ones.
+
+    Parameters
+    ----------
+    tracer: opentelemetry.trace.Tracer (optional)
+        Tracer creating the spans
+
+    on_span: callable (optional)
+        Function receiving every span dict when there is no tracer. Default value is None, they are kept in ``spans``.
+
+    max_spans: int
+        Number of the last spans kept in ``spans`` when there is neither tracer nor ``on_span`` (default 1000)
+    """
+
+    def __init__(self, tracer=None, on_span: Callable[[dict], None] = None, max_spans: int = 1000):
+        self.tracer = tracer
+        self.on_span = on_span
+        self.spans = deque(maxlen=max_spans)
+
+    def __call__(self, event: Event):
+        if event.kind != REQUEST:
+            return
+        end_time = int(event.timestamp * 1e9)
+        start_time = end_time - int(event.duration * 1e9)
+        name = f"GET {event.endpoint}"
+        attributes = self.attributes(event)
+
+        if self.tracer is not None:
+            span = self.tracer.start_span(name, start_time=start_time, attributes=attributes)
+            if event.error is not None:
+                span.record_exception(event.error)
+            span.end(end_time=end_time)
+            return
+
+        span = {"name": name, "kind": "CLIENT", "start_time_unix_nano": start_time, "end_time_unix_nano": end_time,
+                "attributes": attributes,
+                "status": {"code": "ERROR" if event.error is not None or (event.status or 0) >= 400 else "UNSET"}}
+        if self.on_span is not None:
+            self.on_span(span)
+        else:
+            self.spans.append(span)
+
+    @staticmethod
+    def attributes(event: Event) -> Dict[str, object]:
+        """Returns the span attributes of a request event"""
+        attributes = {"http.request.method": "GET", "server.address": event.host,
+                      "pycartociudad.endpoint": event.endpoint, "http.request.resend_count": event.attempt}
+        optional = (("http.response.status_code", event.status), ("http.response.body.size", event.size),
+                    ("pycartociudad.connect_time", event.connect_time), ("pycartociudad.ttfb", event.ttfb),
+                    ("error.type", type(event.error).__name__ if event.error is not None else None))
+        attributes.update((key, value) for key, value in optional if value is not None)
+        return attributes
@@ -0,0 +1,599 @@
+"""
+Offline geocoding and reverse geocoding of addresses with a local index of the CartoCiudad portals
+
+The streets are indexed by the tokens of their normalized names, municipalities and provinces (an inverted index), and
+their portals are kept sorted by number in compact columns, so an address is resolved with a few dict lookups and
+binary searches. The portals are also bucketed in a grid of square cells, searched in rings around a point for the
+nearest portal. The index is saved to a single binary file, which is loaded with a copy of its arrays or memory-mapped.
+"""
+
+import array
+import bisect
+import csv
+import json
+import math
+import re
+import sys
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from pycartociudad.cache import METERS_PER_DEGREE
+from pycartociudad.normalize import normalize_address
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# fields of the portals given to LocalGeocoder
+PORTAL_FIELDS = ("id", "tip_via", "street", "number", "extension", "muni", "province", "postal_code", "lat", "lon")
+
+# columns of the portal fields in the CSV files read by LocalGeocoder.from_csv
+DEFAULT_COLUMNS = {"id": "id_vial", "tip_via": "tipo_vial", "street": "nombre_via", "number": "numero",
+                   "extension": "extension", "muni": "municipio", "province": "provincia", "postal_code": "cod_postal",
+                   "lat": "lat", "lon": "lon"}
+
+# words that are not indexed nor required, as they are often omitted ("calle de alcala" or "calle alcala")
+STOP_WORDS = frozenset(("de", "del", "la", "las", "el", "los", "y", "e", "en", "a", "al"))
+
+# state and message of the results, as in the geocoding service
+_STATES = {
+    1: "Resultado exacto de la búsqueda",
+    2: "Portal par no encontrado, se devuelve el más próximo",
+    3: "Portal impar no encontrado, se devuelve el más próximo",
+    4: "Extensión del portal no encontrada, se devuelve el más próximo",
+    5: "Portal no encontrado, se devuelve el más próximo",
+}
+
+# side in meters of the cells of the grid of portals
+GRID_CELL_M = 50
+
+# the grid cells are square at this latitude (the center of the Peninsula), and a bit narrower or wider elsewhere
+_GRID_LATITUDE = 40
+_LON_SCALE = math.cos(math.radians(_GRID_LATITUDE))
+# cell key of a (row, column) cell: row * _ROW_STRIDE + column + _ROW_STRIDE // 2
+_ROW_STRIDE = 1 << 20
+# points of a bulk query searched at once, bounding the memory of the candidate portals
+_CHUNK_SIZE = 16384
+
+_MAGIC = b"PYCARTOCIUDAD-LOCAL-GEOCODER 1\n"
+# type codes of the arrays saved to the index files, in the order they are written: the widest first, so that every
+# array is aligned when the file is memory-mapped
+_ARRAYS = (("lats", "d"), ("lons", "d"), ("cell_keys", "q"), ("street_portals", "I"), ("numbers", "i"),
+           ("extensions", "I"), ("postal_codes", "I"), ("postings", "I"), ("cell_starts", "I"),
+           ("cell_portals", "I"), ("street_tokens", "B"))
+
+_PORTAL = re.compile(r"(\d+)([a-z]*)$")
+
+
+def _contains(values: array.array, value: int, start: int, end: int) -> bool:
+    """Returns whether a sorted slice of an array contains a value"""
+    i = bisect.bisect_left(values, value, start, end)
+    return i < end and values[i] == value
+
+
+def _cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    """Returns the (row, column) grid cell of a point"""
+    return (math.floor(latitude * METERS_PER_DEGREE / GRID_CELL_M),
+            math.floor(longitude * METERS_PER_DEGREE * _LON_SCALE / GRID_CELL_M))
+
+
+def _reach(latitude: float) -> float:
+    """Returns the meters around a point covered by every ring of cells around its cell"""
+    return GRID_CELL_M * min(1.0, math.cos(math.radians(latitude)) / _LON_SCALE)
+
+
+def _ring(radius: int) -> List[Tuple[int, int]]:
+    """Returns the (row, column) offsets of the cells at a Chebyshev distance ``radius`` of a cell"""
+    if radius == 0:
+        return [(0, 0)]
+    side = range(-radius, radius + 1)
+    return ([(-radius, column) for column in side] + [(radius, column) for column in side]
+            + [(row, -radius) for row in side[1:-1]] + [(row, radius) for row in side[1:-1]])
+
+
+def _check_numpy():
+    if np is None:
+        raise ImportError("numpy is required for the bulk reverse geocoding: pip install pycartociudad[numpy]")
+
+
+def _number(value) -> int:
+    """Parses a portal number, e.g. "5" or "5.0" as read from a CSV file; 0 if it is empty or invalid"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class LocalGeocoder:
+    """Local index of the streets and portals of a CartoCiudad dataset, answering ``geocode``-compatible results.
+
+    Parameters
+    ----------
+    portals: iterable of tuples
+        Portals as (id, tip_via, street, number, extension, muni, province, postal_code, lat, lon) tuples, where id
+        is the identifier of the street, number and extension the portal number and letter (e.g. 5 and "B"), and
+        lat and lon the geographical coordinates of the portal
+    """
+
+    def __init__(self, portals: Iterable[Sequence] = ()):
+        streets = {}
+        rows = []
+        for street_id, tip_via, street, number, extension, muni, province, postal_code, lat, lon in portals:
+            key = (str(street_id or ""), str(tip_via or ""), str(street or ""), str(muni or ""), str(province or ""))
+            rows.append((streets.setdefault(key, len(streets)), _number(number), str(extension or "").lower(),
+                         str(postal_code or ""), float(lat), float(lon)))
+        rows.sort(key=lambda row: row[:3])
+
+        self.streets = list(streets)
+        self.extension_values = sorted({row[2] for row in rows})
+        self.postal_code_values = sorted({row[3] for row in rows})
+        extension_ids = {value: i for i, value in enumerate(self.extension_values)}
+        postal_code_ids = {value: i for i, value in enumerate(self.postal_code_values)}
+
+        # portals of the street i are those from street_portals[i] to street_portals[i + 1]
+        self.street_portals = array.array("I", [0] * (len(self.streets) + 1))
+        for row in rows:
+            self.street_portals[row[0] + 1] += 1
+        for i in range(len(self.streets)):
+            self.street_portals[i + 1] += self.street_portals[i]
+        self.numbers = array.array("i", (row[1] for row in rows))
+        self.extensions = array.array("I", (extension_ids[row[2]] for row in rows))
+        self.postal_codes = array.array("I", (postal_code_ids[row[3]] for row in rows))
+        self.lats = array.array("d", (row[4] for row in rows))
+        self.lons = array.array("d", (row[5] for row in rows))
+
+        postings = {}
+        self.street_tokens = array.array("B")
+        for i, (_, tip_via, street, muni, province) in enumerate(self.streets):
+            tokens = {token for token in normalize_address(f"{tip_via} {street} {muni} {province}").split()
+                      if token not in STOP_WORDS}
+            self.street_tokens.append(min(len(tokens), 255))
+            for token in tokens:
+                postings.setdefault(token, []).append(i)
+
+        self.postings = array.array("I")
+        self._tokens = {}
+        for token, street_ids in sorted(postings.items()):
+            self._tokens[token] = (len(self.postings), len(self.postings) + len(street_ids))
+            self.postings.extend(street_ids)
+
+        # portals of the cell cell_keys[i] are cell_portals[cell_starts[i]:cell_starts[i + 1]]
+        cells = [_cell(lat, lon) for lat, lon in zip(self.lats, self.lons)]
+        keys = [row * _ROW_STRIDE + column + _ROW_STRIDE // 2 for row, column in cells]
+        self.cell_portals = array.array("I", sorted(range(len(keys)), key=keys.__getitem__))
+        self.cell_keys = array.array("q")
+        self.cell_starts = array.array("I")
+        for position, portal in enumerate(self.cell_portals):
+            if not self.cell_keys or keys[portal] != self.cell_keys[-1]:
+                self.cell_keys.append(keys[portal])
+                self.cell_starts.append(position)
+        self.cell_starts.append(len(keys))
+
+        # first and last rows and columns of the grid, bounding the rings of cells searched around a point
+        self._extent = ((min(row for row, _ in cells), max(row for row, _ in cells)),
+                        (min(column for _, column in cells), max(column for _, column in cells))) if cells else None
+        self._street_columns = None
+
+    @classmethod
+    def from_csv(cls, path: str, columns: Dict[str, str] = None, delimiter: str = None) -> "LocalGeocoder":
+        """Loads the portals from a CSV file with a row per portal, e.g. the portals of a CartoCiudad download
+        (``portal_pk``) joined with their streets and municipalities and exported with
+        ``ogr2ogr -f CSV -lco GEOMETRY=AS_XY``.
+
+        Parameters
+        ----------
+        path: str
+            Path of the UTF-8 CSV file
+
+        columns: dict (optional)
+            Column of every portal field (see ``PORTAL_FIELDS``), for the fields whose column is not the default one
+            (see ``DEFAULT_COLUMNS``). Missing columns are left empty, except the coordinates, which are required;
+            e.g. ``{"lat": "Y", "lon": "X"}`` for the coordinates exported by ogr2ogr.
+
+        delimiter: str (optional)
+            Delimiter of the columns. Default value is None, it is detected from the header.
+
+        Returns
+        -------
+        geocoder: the ``LocalGeocoder`` of the portals
+        """
+        columns = dict(DEFAULT_COLUMNS, **(columns or {}))
+        with open(path, encoding="utf-8-sig", newline="") as file:
+            header = file.readline()
+            file.seek(0)
+            if delimiter is None:
+                delimiter = max(",;\t|", key=header.count)
+            reader = csv.DictReader(file, delimiter=delimiter)
+            portals = [tuple(row.get(columns[field]) for field in PORTAL_FIELDS) for row in reader]
+        return cls(portals)
+
+    def save(self, path: str):
+        """Saves the index to a file, loaded back with ``LocalGeocoder.load``"""
+        header = {"byteorder": sys.byteorder,
+                  "itemsizes": {name: getattr(self, name).itemsize for name, _ in _ARRAYS},
+                  "lengths": {name: len(getattr(self, name)) for name, _ in _ARRAYS},
+                  "streets": self.streets, "extensions": self.extension_values,
+                  "postal_codes": self.postal_code_values, "extent": self._extent,
+                  "tokens": [[token, start, end] for token, (start, end) in self._tokens.items()]}
+        header = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # the header is padded so that the arrays start at a multiple of 8 bytes
+        header += b" " * (-(len(_MAGIC) + len(header) + 1) % 8) + b"\n"
+        with open(path, "wb") as file:
+            file.write(_MAGIC)
+            file.write(header)
+            for name, _ in _ARRAYS:
+                values = getattr(self, name)
+                if isinstance(values, array.array):
+                    values.tofile(file)
+                else:
+                    file.write(values.tobytes())
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = False) -> "LocalGeocoder":
+        """Loads an index saved with ``save``.
+
+        Parameters
+        ----------
+        path: str
+            Path of the index file
+
+        mmap: bool
+            If True, the arrays of the index are memory-mapped instead of read (requires numpy), so the index is
+            loaded at once and its pages are shared by every process using the same file (default False)
+
+        Returns
+        -------
+        geocoder: the loaded ``LocalGeocoder``
+        """
+        if mmap:
+            _check_numpy()
+        geocoder = cls.__new__(cls)
+        with open(path, "rb") as file:
+            if file.readline() != _MAGIC:
+                raise ValueError(f"{path} is not a local geocoder index")
+            header = json.loads(file.readline().decode("utf-8"))
+            if mmap and header["byteorder"] != sys.byteorder:
+                raise ValueError(f"{path} was saved in a platform with a different byte order, it can't be mapped")
+            offset = file.tell()
+            for name, typecode in _ARRAYS:
+                values = array.array(typecode)
+                length = header["lengths"][name]
+                if values.itemsize != header["itemsizes"][name]:
+                    raise ValueError(f"{path} was saved in a platform with different integer sizes")
+                if mmap:
+                    values = np.memmap(path, dtype=np.dtype(typecode), mode="r", offset=offset, shape=(length,)) \
+                        if length else np.empty(0, dtype=np.dtype(typecode))
+                else:
+                    values.fromfile(file, length)
+                    if header["byteorder"] != sys.byteorder:
+                        values.byteswap()
+                offset += length * values.itemsize
+                setattr(geocoder, name, values)
+
+        geocoder.streets = [tuple(street) for street in header["streets"]]
+        geocoder.extension_values = header["extensions"]
+        geocoder.postal_code_values = header["postal_codes"]
+        geocoder._tokens = {token: (start, end) for token, start, end in header["tokens"]}
+        geocoder._extent = header["extent"]
+        geocoder._street_columns = None
+        return geocoder
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def _candidates(self, words: List[str]) -> List[int]:
+        """Returns the streets having every word among their tokens"""
+        ranges = []
+        for word in set(words):
+            token_range = self._tokens.get(word)
+            if token_range is None:
+                return []
+            ranges.append(token_range)
+        ranges.sort(key=lambda token_range: token_range[1] - token_range[0])
+
+        start, end = ranges[0]
+        candidates = self.postings[start:end]
+        for start, end in ranges[1:]:
+            candidates = [street for street in candidates if _contains(self.postings, street, start, end)]
+            if not candidates:
+                break
+        return candidates
+
+    def lookup(self, address: str) -> dict:
+        """Geocodes an address with the local index.
+
+        The street is the one having every word of the address among the words of its type, name, municipality
+        and province and, among them, the one in the postal code of the address with the fewest other words. Its
+        portal is the one with the number of the address, or the closest one with the same parity, as in the
+        geocoding service. Without number, the street is returned.
+
+        Parameters
+        ----------
+        address: str
+            Address to geocode, e.g. "calle miguel servet 5, zaragoza"
+
+        Returns
+        -------
+        geolocation: a dict with the fields of the ``geocode`` results, or an empty dict if the street is not found
+        """
+        words, number, extension, postal_code = [], None, "", None
+        for token in normalize_address(address).split():
+            if len(token) == 5 and token.isdigit():
+                postal_code = token
+            elif token[0].isdigit():
+                if number is not None:
+                    words.append(str(number) + extension)
+                match = _PORTAL.match(token)
+                number, extension = (int(match.group(1)), match.group(2)) if match else (None, "")
+            elif token not in STOP_WORDS:
+                words.append(token)
+        if not words:
+            return {}
+
+        candidates = self._candidates(words)
+        if not candidates:
+            return {}
+
+        def score(street):
+            start, end = self.street_portals[street], self.street_portals[street + 1]
+            has_number = number is not None and _contains(self.numbers, number, start, end)
+            in_postal_code = postal_code is not None and any(
+                self.postal_code_values[self.postal_codes[i]] == postal_code for i in range(start, end))
+            return not in_postal_code, self.street_tokens[street], not has_number
+
+        street = min(candidates, key=score)
+        return self._result(street, number, extension)
+
+    def _result(self, street: int, number: int, extension: str) -> dict:
+        """Builds the result of a portal of a street, or of the street itself if number is None"""
+        start, end = self.street_portals[street], self.street_portals[street + 1]
+        if number is None:
+            return self._portal_result((start + end) // 2, street, 1, "callejero", 0)
+        portal, state = self._portal(start, end, number, extension)
+        return self._portal_result(portal, street, state, "portal", int(self.numbers[portal]))
+
+    def _portal_result(self, portal: int, street: int, state: int, result_type: str, portal_number: int) -> dict:
+        """Builds the result of a portal, with the fields of the geocoding service answers"""
+        street_id, tip_via, name, muni, province = self.streets[street]
+        lat, lon = float(self.lats[portal]), float(self.lons[portal])
+        return {
+            "id": street_id, "province": province or None, "comunidadAutonoma": None, "muni": muni or None,
+            "type": result_type, "address": name,
+            "postalCode": self.postal_code_values[self.postal_codes[portal]] or None, "poblacion": muni or None,
+            "geom": f"POINT ({lon!r} {lat!r})", "tip_via": tip_via or None,
+            "lat": lat, "lng": lon, "portalNumber": portal_number, "stateMsg": _STATES[state], "state": state,
+            "priority": 0, "countryCode": "011", "refCatastral": None,
+        }
+
+    def _portal(self, start: int, end: int, number: int, extension: str) -> Tuple[int, int]:
+        """Returns the portal with a number (and extension, if it exists) among the portals of a street, or the
+        closest one with the same parity, and the state of the result"""
+        first = bisect.bisect_left(self.numbers, number, start, end)
+        last = bisect.bisect_right(self.numbers, number, start, end)
+        if first < last:
+            for portal in range(first, last):
+                if self.extension_values[self.extensions[portal]] == extension:
+                    return portal, 1
+            # the number exists, but not with the requested extension
+            return first, 4
+
+        # the closest portals with the same parity below and above the number
+        parity = number % 2
+        below = (portal for portal in range(first - 1, start - 1, -1) if self.numbers[portal] % 2 == parity)
+        above = (portal for portal in range(first, end) if self.numbers[portal] % 2 == parity)
+        candidates = [portal for portal in (next(below, None), next(above, None)) if portal is not None]
+        if candidates:
+            return min(candidates, key=lambda portal: abs(self.numbers[portal] - number)), 3 if parity else 2
+        closest = [portal for portal in (first - 1, first) if start <= portal < end]
+        return min(closest, key=lambda portal: abs(self.numbers[portal] - number)), 5
+
+    def reverse_lookup(self, latitude: float, longitude: float, max_distance_m: float = 100) -> dict:
+        """Reverse geocodes a point with the local index, returning its nearest portal.
+
+        Parameters
+        ----------
+        latitude: float
+            Point latitude in geographical coordinates (e.g., 40.473219)
+
+        longitude: float
+            Point longitude in geographical coordinates (e.g., -3.7227241)
+
+        max_distance_m: float (optional)
+            Maximum distance in meters to the portal (default 100). Farther points are considered outside the area
+            of the index. If None, the nearest portal is returned however far it is.
+
+        Returns
+        -------
+        address: a dict with the fields of the ``reverse_geocode`` results, and the distance in meters to the portal,
+        or an empty dict if there is no portal within ``max_distance_m``
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        if self._extent is None or math.isnan(latitude) or math.isnan(longitude):
+            return {}
+        row, column = _cell(latitude, longitude)
+        scale = math.cos(math.radians(latitude)) * METERS_PER_DEGREE
+        reach = _reach(latitude)
+        best, best_distance = -1, math.inf
+        for radius in range(self._max_ring(row, column, reach, max_distance_m) + 1):
+            # far from the portals, scanning every portal is faster than searching more cells: once there are more
+            # searched cells than cells in the grid, or much earlier if the scan is vectorized
+            exhaustive = (2 * radius + 1) ** 2 > (len(self.cell_keys) if np is None else len(self.lats) // 64)
+            if exhaustive and np is not None:
+                distances = (((np.asarray(self.lats) - latitude) * METERS_PER_DEGREE) ** 2
+                             + ((np.asarray(self.lons) - longitude) * scale) ** 2)
+                best = int(np.argmin(distances))
+                best_distance = float(distances[best])
+                break
+            for portal in range(len(self.lats)) if exhaustive else self._ring_portals(row, column, _ring(radius)):
+                distance = (((self.lats[portal] - latitude) * METERS_PER_DEGREE) ** 2
+                            + ((self.lons[portal] - longitude) * scale) ** 2)
+                if distance < best_distance:
+                    best, best_distance = portal, distance
+            # the portals outside this ring are farther than radius * reach
+            if exhaustive or best_distance <= (radius * reach) ** 2:
+                break
+
+        best_distance = math.sqrt(best_distance)
+        if best < 0 or (max_distance_m is not None and best_distance > max_distance_m):
+            return {}
+        street = bisect.bisect_right(self.street_portals, best) - 1
+        result = self._portal_result(best, street, 1, "portal", int(self.numbers[best]))
+        result["distance"] = best_distance
+        return result
+
+    def _ring_portals(self, row: int, column: int, ring: List[Tuple[int, int]]) -> Iterable[int]:
+        """Yields the portals in the cells of a ring around a cell"""
+        for row_offset, column_offset in ring:
+            key = (row + row_offset) * _ROW_STRIDE + column + column_offset + _ROW_STRIDE // 2
+            i = bisect.bisect_left(self.cell_keys, key)
+            if i < len(self.cell_keys) and self.cell_keys[i] == key:
+                for position in range(self.cell_starts[i], self.cell_starts[i + 1]):
+                    yield self.cell_portals[position]
+
+    def _max_ring(self, row: int, column: int, reach: float, max_distance_m: float) -> int:
+        """Returns the number of rings of cells to search around a cell: those within max_distance_m or, if it is
+        None, those up to the farthest cell of the grid"""
+        if max_distance_m is not None:
+            return math.ceil(max_distance_m / reach)
+        (first_row, last_row), (first_column, last_column) = self._extent
+        return max(abs(row - first_row), abs(row - last_row), abs(column - first_column), abs(column - last_column))
+
+    def reverse_lookup_many(self, latitudes: Sequence[float], longitudes: Sequence[float],
+                            max_distance_m: float = 100) -> Dict[str, "np.ndarray"]:
+        """Vectorized reverse geocoding of many points with the local index. Requires numpy.
+
+        The points are processed in chunks: the portals in the rings of cells around every point of a chunk are
+        gathered and compared with array operations, and only the points without a close enough portal go on to
+        the next ring.
+
+        Parameters
+        ----------
+        latitudes: sequence of float
+            Points latitudes in geographical coordinates
+
+        longitudes: sequence of float
+            Points longitudes in geographical coordinates
+
+        max_distance_m: float (optional)
+            Maximum distance in meters to the portals (default 100). If None, the nearest portal is returned however
+            far it is.
+
+        Returns
+        -------
+        addresses: a dict of arrays with an element per point: id, tip_via, address, muni, province, postalCode
+        (object arrays, None for the points without portal), portalNumber (int64, -1 without portal), lat, lng (the
+        portal coordinates) and distance (float64, NaN without portal)
+        """
+        _check_numpy()
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        portals = np.full(len(latitudes), -1, dtype=np.int64)
+        distances = np.full(len(latitudes), np.inf)
+        if self._extent is not None:
+            for start in range(0, len(latitudes), _CHUNK_SIZE):
+                chunk = slice(start, start + _CHUNK_SIZE)
+                portals[chunk], distances[chunk] = self._nearest_many(latitudes[chunk], longitudes[chunk],
+                                                                      max_distance_m)
+
+        found = portals >= 0
+        if max_distance_m is not None:
+            found &= distances <= max_distance_m
+        portals = np.where(found, portals, -1)
+        return self._portal_columns(portals, np.where(found, distances, np.nan))
+
+    def _nearest_many(self, latitudes: "np.ndarray", longitudes: "np.ndarray",
+                      max_distance_m: float) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Returns the nearest portal (-1 if none is found) and its distance in meters of every point"""
+        lats, lons = np.asarray(self.lats), np.asarray(self.lons)
+        cell_keys, cell_starts = np.asarray(self.cell_keys), np.asarray(self.cell_starts, dtype=np.int64)
+        cell_portals = np.asarray(self.cell_portals)
+
+        valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        rows = np.floor(np.where(valid, latitudes, 0) * METERS_PER_DEGREE / GRID_CELL_M).astype(np.int64)
+        columns = np.floor(np.where(valid, longitudes, 0) * METERS_PER_DEGREE * _LON_SCALE / GRID_CELL_M
+                           ).astype(np.int64)
+        scales = np.cos(np.radians(latitudes)) * METERS_PER_DEGREE
+        reaches = GRID_CELL_M * np.minimum(1.0, np.cos(np.radians(latitudes)) / _LON_SCALE)
+        best = np.full(len(latitudes), -1, dtype=np.int64)
+        best_distances = np.full(len(latitudes), np.inf)
+
+        pending = np.flatnonzero(valid)
+        radius = 0
+        while len(pending):
+            offsets = np.array(_ring(radius), dtype=np.int64)
+            if (2 * radius + 1) ** 2 > len(cell_keys):
+                # far from the portals, once more cells than those of the grid are searched, scanning every portal is
+                # faster
+                for point in pending:
+                    point_distances = (((lats - latitudes[point]) * METERS_PER_DEGREE) ** 2
+                                       + ((lons - longitudes[point]) * scales[point]) ** 2)
+                    best[point] = np.argmin(point_distances)
+                    best_distances[point] = point_distances[best[point]]
+                break
+
+            keys = ((rows[pending, None] + offsets[:, 0]) * _ROW_STRIDE + columns[pending, None] + offsets[:, 1]
+                    + _ROW_STRIDE // 2).ravel()
+            owners = np.repeat(pending, len(offsets))
+            cells = np.minimum(np.searchsorted(cell_keys, keys), len(cell_keys) - 1)
+            in_grid = cell_keys[cells] == keys
+            cells, owners = cells[in_grid], owners[in_grid]
+
+            starts = cell_starts[cells]
+            counts = cell_starts[cells + 1] - starts
+            if counts.sum():
+                # candidate portals of every point, grouped by point as the owners are sorted
+                owners = np.repeat(owners, counts)
+                positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+                candidates = cell_portals[positions].astype(np.int64)
+                candidate_distances = (((lats[candidates] - latitudes[owners]) * METERS_PER_DEGREE) ** 2
+                                       + ((lons[candidates] - longitudes[owners]) * scales[owners]) ** 2)
+
+                group_starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+                minima = np.minimum.reduceat(candidate_distances, group_starts)
+                group_owners = owners[group_starts]
+                is_minimum = candidate_distances == np.repeat(minima, np.diff(np.r_[group_starts, len(owners)]))
+                minimum_positions = np.flatnonzero(is_minimum)
+                minimum_owners = owners[minimum_positions]
+                first = minimum_positions[np.r_[True, minimum_owners[1:] != minimum_owners[:-1]]]
+
+                better = minima < best_distances[group_owners]
+                best_distances[group_owners[better]] = minima[better]
+                best[group_owners[better]] = candidates[first[better]]
+
+            # the portals outside this ring are farther than radius * reach
+            covered = radius * reaches[pending]
+            done = best_distances[pending] <= covered ** 2
+            if max_distance_m is not None:
+                done |= covered >= max_distance_m
+            else:
+                (first_row, last_row), (first_column, last_column) = self._extent
+                # the ring covers the whole grid
+                done |= ((rows[pending] - radius <= first_row) & (rows[pending] + radius >= last_row)
+                         & (columns[pending] - radius <= first_column) & (columns[pending] + radius >= last_column))
+            pending = pending[~done]
+            radius += 1
+
+        return best, np.sqrt(best_distances)
+
+    def _portal_columns(self, portals: "np.ndarray", distances: "np.ndarray") -> Dict[str, "np.ndarray"]:
+        """Returns the reverse geocoding columns of some portals, -1 for the missing ones"""
+        if self._street_columns is None:
+            # the last element, selected by the -1 of the missing portals, is None
+            self._street_columns = {
+                field: np.array([street[i] or None for street in self.streets] + [None], dtype=object)
+                for i, field in enumerate(("id", "tip_via", "address", "muni", "province"))
+            }
+        found = portals >= 0
+        valid_portals = np.where(found, portals, 0)
+        streets = np.searchsorted(np.asarray(self.street_portals), valid_portals, side="right") - 1
+        streets = np.where(found, streets, -1)
+        postal_codes = np.array([value or None for value in self.postal_code_values] + [None], dtype=object)
+
+        columns = {field: values[streets] for field, values in self._street_columns.items()}
+        portal_postal_codes = np.asarray(self.postal_codes)[valid_portals].astype(np.int64)
+        columns["postalCode"] = postal_codes[np.where(found, portal_postal_codes, -1)]
+        columns["portalNumber"] = np.where(found, np.asarray(self.numbers)[valid_portals].astype(np.int64), -1)
+        columns["lat"] = np.where(found, np.asarray(self.lats)[valid_portals], np.nan)
+        columns["lng"] = np.where(found, np.asarray(self.lons)[valid_portals], np.nan)
+        columns["distance"] = distances
+        return columns
@@ -0,0 +1,585 @@
+"""
+Offline routing with a local graph of the road network of a CartoCiudad dataset
+
+The road segments are loaded into compact arrays: the nodes (junctions and shape points of the roads), bucketed in the
+grid of square cells of the local geocoder to snap the ends of the routes, and a graph per profile (walking and
+driving) whose arcs are kept in CSR layout, the arcs leaving and reaching every node being contiguous slices of a
+single array. Routes are computed with A* or bidirectional Dijkstra searches, or with contraction hierarchies once the
+graphs are preprocessed with ``LocalRouter.contract``: the nodes are ranked by importance and shortcut arcs skipping
+the less important ones are added, so every query only searches upwards from both ends and settles a few hundred
+nodes, however long the route. The graph is saved to a single binary file.
+"""
+
+import array
+import bisect
+import csv
+import heapq
+import json
+import math
+import sys
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from pycartociudad.cache import METERS_PER_DEGREE
+from pycartociudad.local_geocoder import _ROW_STRIDE, _cell, _reach, _ring
+from pycartociudad.polyline import encode_polyline
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# fields of the road segments given to LocalRouter
+SEGMENT_FIELDS = ("name", "from_lat", "from_lon", "to_lat", "to_lon", "length", "speed", "oneway", "foot")
+
+# columns of the segment fields in the CSV files read by LocalRouter.from_csv
+DEFAULT_COLUMNS = {"name": "nombre", "from_lat": "lat_ini", "from_lon": "lon_ini", "to_lat": "lat_fin",
+                   "to_lon": "lon_fin", "length": "longitud", "speed": "velocidad", "oneway": "sentido",
+                   "foot": "peatones"}
+
+# routing profiles, as the vehicle parameter of the routing service
+PROFILES = ("WALK", "CAR")
+
+ALGORITHMS = ("astar", "dijkstra", "ch")
+
+# walking speed in km/h, as the walking routes of the routing service
+WALK_SPEED_KMH = 5
+
+# nodes settled by the witness searches of the contraction. Shorter searches find fewer witnesses and add more
+# shortcuts than needed, which are correct but make the queries slower.
+_WITNESS_SETTLED = 100
+
+# change of direction in degrees between two streets of a route to describe it as a turn
+_TURN_DEGREES = 30
+
+_MAGIC = b"PYCARTOCIUDAD-LOCAL-ROUTER 1\n"
+# type codes of the arrays saved to the graph files, in the order they are written
+_ARRAYS = (("lats", "d"), ("lons", "d"), ("lengths", "d"), ("cell_keys", "q"), ("cell_starts", "I"),
+           ("segment_names", "I"))
+_GRAPH_ARRAYS = (("weights", "d"), ("tails", "I"), ("heads", "I"), ("segments", "i"), ("firsts", "i"),
+                 ("seconds", "i"), ("out_offsets", "I"), ("out_arcs", "I"), ("in_offsets", "I"), ("in_arcs", "I"),
+                 ("ranks", "I"), ("up_offsets", "I"), ("up_arcs", "I"), ("down_offsets", "I"), ("down_arcs", "I"))
+
+
+def _check_numpy():
+    if np is None:
+        raise ImportError("numpy is required to return the routes as arrays: pip install pycartociudad[numpy]")
+
+
+def _value(value, default: float) -> float:
+    """Parses a numeric field, e.g. "50" or "50.0" as read from a CSV file; default if it is empty or invalid"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _distance(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    """Returns the meters between two points with the equirectangular approximation"""
+    scale = math.cos(math.radians((latitude + other_latitude) / 2))
+    return METERS_PER_DEGREE * math.hypot(latitude - other_latitude, (longitude - other_longitude) * scale)
+
+
+def _bearing(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    """Returns the direction from a point to another, in degrees clockwise from the north"""
+    scale = math.cos(math.radians(latitude))
+    return math.degrees(math.atan2((other_longitude - longitude) * scale, other_latitude - latitude))
+
+
+def _csr(node_count: int, arcs: Iterable[Tuple[int, int]]) -> Tuple[array.array, array.array]:
+    """Returns the CSR layout of (node, arc) pairs: the arcs of the node i are arcs[offsets[i]:offsets[i + 1]]"""
+    arcs = sorted(arcs, key=lambda pair: pair[0])
+    offsets = array.array("I", [0] * (node_count + 1))
+    for node, _ in arcs:
+        offsets[node + 1] += 1
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+    return offsets, array.array("I", (arc for _, arc in arcs))
+
+
+def _witness(out_adjacency: List[Dict[int, Tuple[float, int]]], source: int, avoid: int, targets: Iterable[int],
+             limit: float) -> Dict[int, float]:
+    """Returns the distances from a node to the nodes reached within limit without going through another node,
+    settling at most _WITNESS_SETTLED nodes or until the targets are settled. They are the lengths of actual paths,
+    although not always the shortest."""
+    distances = {source: 0.0}
+    heap = [(0.0, source)]
+    pending = set(targets)
+    settled = 0
+    while heap and pending and settled < _WITNESS_SETTLED:
+        distance, node = heapq.heappop(heap)
+        if distance > limit:
+            break
+        if distance > distances[node]:
+            continue
+        pending.discard(node)
+        settled += 1
+        for head, (weight, _) in out_adjacency[node].items():
+            candidate = distance + weight
+            if head != avoid and candidate < distances.get(head, math.inf):
+                distances[head] = candidate
+                heapq.heappush(heap, (candidate, head))
+    return distances
+
+
+class _Graph:
+    """Arcs of a profile, with their weight in milliseconds. The arcs i are tails[i] -> heads[i], along the road
+    segment segments[i], or shortcuts of the arcs firsts[i] and seconds[i] (segment -1) added by the contraction.
+
+    The arcs leaving and reaching every node are kept in CSR layout (out_offsets and out_arcs, in_offsets and
+    in_arcs). Once contracted, the nodes have a rank, and the arcs to higher ranked nodes are kept by their tail (up)
+    and those from higher ranked nodes by their head (down).
+    """
+
+    def __init__(self, node_count: int, arcs: Sequence[Tuple[int, int, float, int]]):
+        self.tails = array.array("I", (arc[0] for arc in arcs))
+        self.heads = array.array("I", (arc[1] for arc in arcs))
+        self.weights = array.array("d", (arc[2] for arc in arcs))
+        self.segments = array.array("i", (arc[3] for arc in arcs))
+        self.firsts = array.array("i", [-1] * len(arcs))
+        self.seconds = array.array("i", [-1] * len(arcs))
+        self.out_offsets, self.out_arcs = _csr(node_count, ((tail, arc) for arc, tail in enumerate(self.tails)))
+        self.in_offsets, self.in_arcs = _csr(node_count, ((head, arc) for arc, head in enumerate(self.heads)))
+        self.ranks = array.array("I")
+        self.up_offsets, self.up_arcs = array.array("I"), array.array("I")
+        self.down_offsets, self.down_arcs = array.array("I"), array.array("I")
+
+    def contract(self, node_count: int):
+        """Ranks the nodes and adds the shortcuts of the contraction hierarchy, unless it is already contracted"""
+        if len(self.ranks):
+            return
+        out_adjacency = [{} for _ in range(node_count)]
+        in_adjacency = [{} for _ in range(node_count)]
+        for arc in range(len(self.firsts)):
+            tail, head, weight = self.tails[arc], self.heads[arc], self.weights[arc]
+            if tail != head and weight < out_adjacency[tail].get(head, (math.inf,))[0]:
+                out_adjacency[tail][head] = in_adjacency[head][tail] = (weight, arc)
+
+        def shortcuts(node):
+            """Shortcuts needed to contract a node: the paths through it without a shorter witness path"""
+            if not in_adjacency[node] or not out_adjacency[node]:
+                return []
+            longest = max(weight for weight, _ in out_adjacency[node].values())
+            found = []
+            for tail, (in_weight, in_arc) in in_adjacency[node].items():
+                distances = _witness(out_adjacency, tail, node, out_adjacency[node], in_weight + longest)
+                for head, (out_weight, out_arc) in out_adjacency[node].items():
+                    if head != tail and distances.get(head, math.inf) > in_weight + out_weight:
+                        found.append((tail, head, in_weight + out_weight, in_arc, out_arc))
+            return found
+
+        def priority(node, found):
+            """Edge difference and contracted neighbours: the nodes adding fewer arcs and in less contracted areas
+            are contracted first"""
+            return len(found) - len(in_adjacency[node]) - len(out_adjacency[node]) + contracted[node]
+
+        contracted = [0] * node_count
+        heap = [(priority(node, shortcuts(node)), node) for node in range(node_count)]
+        heapq.heapify(heap)
+        ranks = [0] * node_count
+        up, down = [], []
+        rank = 0
+        while heap:
+            # lazy updates: the priority of a node is recomputed when it is popped
+            _, node = heapq.heappop(heap)
+            found = shortcuts(node)
+            if heap and priority(node, found) > heap[0][0]:
+                heapq.heappush(heap, (priority(node, found), node))
+                continue
+
+            ranks[node] = rank
+            rank += 1
+            up.extend((node, arc) for _, arc in out_adjacency[node].values())
+            down.extend((node, arc) for _, arc in in_adjacency[node].values())
+            for tail in in_adjacency[node]:
+                del out_adjacency[tail][node]
+                contracted[tail] += 1
+            for head in out_adjacency[node]:
+                del in_adjacency[head][node]
+                contracted[head] += 1
+            for tail, head, weight, in_arc, out_arc in found:
+                if weight < out_adjacency[tail].get(head, (math.inf,))[0]:
+                    out_adjacency[tail][head] = in_adjacency[head][tail] = (weight, len(self.tails))
+                    self.tails.append(tail)
+                    self.heads.append(head)
+                    self.weights.append(weight)
+                    self.segments.append(-1)
+                    self.firsts.append(in_arc)
+                    self.seconds.append(out_arc)
+
+        self.ranks = array.array("I", ranks)
+        self.up_offsets, self.up_arcs = _csr(node_count, up)
+        self.down_offsets, self.down_arcs = _csr(node_count, down)
+
+    def unpack(self, arcs: List[int]) -> List[int]:
+        """Returns the arcs of the road segments of a path, replacing its shortcuts by the arcs they skip"""
+        unpacked = []
+        stack = arcs[::-1]
+        while stack:
+            arc = stack.pop()
+            if self.firsts[arc] < 0:
+                unpacked.append(arc)
+            else:
+                stack.append(self.seconds[arc])
+                stack.append(self.firsts[arc])
+        return unpacked
+
+    def astar(self, source: int, target: int, heuristic: Callable[[int], float]) -> List[int]:
+        """Returns the arcs of the shortest path between two nodes with an A* search, or None if there is none"""
+        distances = {source: 0.0}
+        parents = {source: -1}
+        heap = [(heuristic(source), 0.0, source)]
+        while heap:
+            _, distance, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if distance > distances[node]:
+                continue
+            for position in range(self.out_offsets[node], self.out_offsets[node + 1]):
+                arc = self.out_arcs[position]
+                head = self.heads[arc]
+                candidate = distance + self.weights[arc]
+                if candidate < distances.get(head, math.inf):
+                    distances[head] = candidate
+                    parents[head] = arc
+                    heapq.heappush(heap, (candidate + heuristic(head), candidate, head))
+        else:
+            return None
+
+        path = []
+        while parents[node] >= 0:
+            path.append(parents[node])
+            node = self.tails[parents[node]]
+        return path[::-1]
+
+    def bidirectional(self, source: int, target: int, contracted: bool = False) -> List[int]:
+        """Returns the arcs of the shortest path between two nodes with a bidirectional Dijkstra search, or None if
+        there is none. If contracted, both searches only go up the contraction hierarchy."""
+        if contracted:
+            directions = ((self.up_offsets, self.up_arcs, self.heads), (self.down_offsets, self.down_arcs, self.tails))
+        else:
+            directions = ((self.out_offsets, self.out_arcs, self.heads), (self.in_offsets, self.in_arcs, self.tails))
+        distances = ({source: 0.0}, {target: 0.0})
+        parents = ({source: -1}, {target: -1})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meeting = (0.0, source) if source == target else (math.inf, -1)
+        while heaps[0] or heaps[1]:
+            tops = [heap[0][0] if heap else math.inf for heap in heaps]
+            # the contracted searches go on until both are farther than the best path, as they only go upwards
+            if (min(tops) if contracted else tops[0] + tops[1]) >= best:
+                break
+            side = 0 if tops[0] <= tops[1] else 1
+            distance, node = heapq.heappop(heaps[side])
+            if distance > distances[side][node]:
+                continue
+            offsets, arcs, ends = directions[side]
+            reached, other = distances[side], distances[1 - side]
+            for position in range(offsets[node], offsets[node + 1]):
+                arc = arcs[position]
+                end = ends[arc]
+                candidate = distance + self.weights[arc]
+                if candidate < reached.get(end, math.inf):
+                    reached[end] = candidate
+                    parents[side][end] = arc
+                    heapq.heappush(heaps[side], (candidate, end))
+                    if end in other and candidate + other[end] < best:
+                        best, meeting = candidate + other[end], end
+        if meeting < 0:
+            return None
+
+        path = []
+        node = meeting
+        while parents[0][node] >= 0:
+            path.append(parents[0][node])
+            node = self.tails[parents[0][node]]
+        path.reverse()
+        node = meeting
+        while parents[1][node] >= 0:
+            path.append(parents[1][node])
+            node = self.heads[parents[1][node]]
+        return path
+
+
+class LocalRouter:
+    """Local graph of the road network of a CartoCiudad dataset, answering ``route_between_two_points``-compatible
+    routes for walking and driving.
+
+    Parameters
+    ----------
+    segments: iterable of tuples
+        Road segments as (name, from_lat, from_lon, to_lat, to_lon, length, speed, oneway, foot) tuples, where the
+        segments are straight lines between two points (the curved roads are split at their shape points), and the
+        segments sharing an end are connected. length is in meters (computed from the coordinates if empty), speed
+        is the maximum speed of the cars in km/h (0 or empty if they aren't allowed), oneway is 1 if the cars can
+        only drive from the first point to the second, -1 from the second to the first and 0 or empty both ways, and
+        foot is 0 if the pedestrians aren't allowed (e.g. motorways) and 1 or empty otherwise
+    """
+
+    def __init__(self, segments: Iterable[Sequence] = ()):
+        nodes = {}
+        rows = []
+        for name, from_lat, from_lon, to_lat, to_lon, length, speed, oneway, foot in segments:
+            ends = [nodes.setdefault((round(float(lat), 7), round(float(lon), 7)), len(nodes))
+                    for lat, lon in ((from_lat, from_lon), (to_lat, to_lon))]
+            rows.append((str(name or ""), ends[0], ends[1], _value(length, 0), _value(speed, 0), _value(oneway, 0),
+                         _value(foot, 1)))
+
+        # the nodes are numbered by grid cell: the nodes of the cell cell_keys[i] are those from cell_starts[i] to
+        # cell_starts[i + 1]
+        points = list(nodes)
+        keys = [row * _ROW_STRIDE + column + _ROW_STRIDE // 2 for row, column in (_cell(*point) for point in points)]
+        order = sorted(range(len(points)), key=keys.__getitem__)
+        numbers = [0] * len(points)
+        for number, node in enumerate(order):
+            numbers[node] = number
+        self.lats = array.array("d", (points[node][0] for node in order))
+        self.lons = array.array("d", (points[node][1] for node in order))
+        self.cell_keys = array.array("q")
+        self.cell_starts = array.array("I")
+        for number, node in enumerate(order):
+            if not self.cell_keys or keys[node] != self.cell_keys[-1]:
+                self.cell_keys.append(keys[node])
+                self.cell_starts.append(number)
+        self.cell_starts.append(len(order))
+
+        self.names = sorted({row[0] for row in rows})
+        name_ids = {name: i for i, name in enumerate(self.names)}
+        self.segment_names = array.array("I", (name_ids[row[0]] for row in rows))
+        self.lengths = array.array("d")
+        walk, car = [], []
+        walk_cost = 3600 / WALK_SPEED_KMH
+        for segment, (_, tail, head, length, speed, oneway, foot) in enumerate(rows):
+            tail, head = numbers[tail], numbers[head]
+            if length <= 0:
+                length = _distance(self.lats[tail], self.lons[tail], self.lats[head], self.lons[head])
+            self.lengths.append(length)
+            if foot:
+                walk.extend(((tail, head, length * walk_cost, segment), (head, tail, length * walk_cost, segment)))
+            if speed > 0:
+                if oneway >= 0:
+                    car.append((tail, head, length * 3600 / speed, segment))
+                if oneway <= 0:
+                    car.append((head, tail, length * 3600 / speed, segment))
+        self._graphs = {"WALK": _Graph(len(order), walk), "CAR": _Graph(len(order), car)}
+
+        # lowest milliseconds per meter of every profile, scaling the straight line distances of the A* searches
+        self._costs = {"WALK": walk_cost, "CAR": min((3600 / row[4] for row in rows if row[4] > 0), default=0)}
+
+    @classmethod
+    def from_csv(cls, path: str, columns: Dict[str, str] = None, delimiter: str = None) -> "LocalRouter":
+        """Loads the road segments from a CSV file with a row per segment, e.g. the road segments of a CartoCiudad
+        download (``tramo_vial``) split at their vertices and exported with ``ogr2ogr -f CSV``.
+
+        Parameters
+        ----------
+        path: str
+            Path of the UTF-8 CSV file
+
+        columns: dict (optional)
+            Column of every segment field (see ``SEGMENT_FIELDS``), for the fields whose column is not the default
+            one (see ``DEFAULT_COLUMNS``). Missing columns are left empty, except the coordinates, which are required.
+
+        delimiter: str (optional)
+            Delimiter of the columns. Default value is None, it is detected from the header.
+
+        Returns
+        -------
+        router: the ``LocalRouter`` of the road segments
+        """
+        columns = dict(DEFAULT_COLUMNS, **(columns or {}))
+        with open(path, encoding="utf-8-sig", newline="") as file:
+            header = file.readline()
+            file.seek(0)
+            if delimiter is None:
+                delimiter = max(",;\t|", key=header.count)
+            reader = csv.DictReader(file, delimiter=delimiter)
+            segments = [tuple(row.get(columns[field]) for field in SEGMENT_FIELDS) for row in reader]
+        return cls(segments)
+
+    def _arrays(self) -> Iterable[Tuple[object, str, str]]:
+        """Yields the owner, name and type code of every array of the router, in the order they are saved"""
+        for name, typecode in _ARRAYS:
+            yield self, name, typecode
+        for profile in PROFILES:
+            for name, typecode in _GRAPH_ARRAYS:
+                yield self._graphs[profile], name, typecode
+
+    def save(self, path: str):
+        """Saves the graph, contracted or not, to a file, loaded back with ``LocalRouter.load``"""
+        arrays = [getattr(owner, name) for owner, name, _ in self._arrays()]
+        header = {"byteorder": sys.byteorder, "itemsizes": [values.itemsize for values in arrays],
+                  "lengths": [len(values) for values in arrays], "names": self.names, "costs": self._costs}
+        header = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with open(path, "wb") as file:
+            file.write(_MAGIC)
+            file.write(header + b"\n")
+            for values in arrays:
+                values.tofile(file)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalRouter":
+        """Loads a graph saved with ``save``"""
+        router = cls.__new__(cls)
+        router._graphs = {profile: _Graph.__new__(_Graph) for profile in PROFILES}
+        with open(path, "rb") as file:
+            if file.readline() != _MAGIC:
+                raise ValueError(f"{path} is not a local router graph")
+            header = json.loads(file.readline().decode("utf-8"))
+            sizes = zip(header["itemsizes"], header["lengths"])
+            for (owner, name, typecode), (itemsize, length) in zip(router._arrays(), sizes):
+                values = array.array(typecode)
+                if values.itemsize != itemsize:
+                    raise ValueError(f"{path} was saved in a platform with different integer sizes")
+                values.fromfile(file, length)
+                if header["byteorder"] != sys.byteorder:
+                    values.byteswap()
+                setattr(owner, name, values)
+
+        router.names = header["names"]
+        router._costs = header["costs"]
+        return router
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def contract(self):
+        """Preprocesses the graphs of both profiles into contraction hierarchies, which answer the routes in a
+        fraction of the time of the A* searches. The preprocessing takes about a second per thousand nodes, so the
+        contracted graph is best saved once and loaded afterwards."""
+        for graph in self._graphs.values():
+            graph.contract(len(self.lats))
+
+    def route(self, lat_init: float, lon_init: float, lat_dest: float, lon_dest: float, vehicle: bool = False,
+              algorithm: str = None, max_distance_m: float = 500, arrays: bool = False) -> dict:
+        """Computes the route between two points with the local graph. The points are snapped to the closest node
+        of the graph where the profile is allowed.
+
+        Parameters
+        ----------
+        lat_init, lon_init: float
+            Initial point latitude and longitude in geographical coordinates
+
+        lat_dest, lon_dest: float
+            Final point latitude and longitude in geographical coordinates
+
+        vehicle: bool
+            If True, uses vehicle, if False walking (default False)
+
+        algorithm: str (optional)
+            "astar", "dijkstra" (bidirectional) or "ch" (contraction hierarchies, which requires ``contract``).
+            Default value is None, "ch" if the graph is contracted and "astar" otherwise.
+
+        max_distance_m: float (optional)
+            Maximum distance in meters from the points to the graph (default 500). Farther points are considered
+            outside the area of the graph.
+
+        arrays: bool
+            If True, adds the geometry as 'coordinates' and the meters of the instructions as
+            'instruction_distances', both NumPy arrays, as ``route_between_two_points`` (requires numpy)
+
+        Returns
+        -------
+        route: a dict with the fields of the ``route_between_two_points`` results (distance in meters, time in
+        milliseconds), or an empty dict if a point is outside the graph or there is no route between them
+        """
+        graph = self._graphs["CAR" if vehicle else "WALK"]
+        if algorithm is None:
+            algorithm = "ch" if len(graph.ranks) else "astar"
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm {algorithm!r}, expected one of {', '.join(ALGORITHMS)}")
+        if algorithm == "ch" and not len(graph.ranks):
+            raise ValueError("The contraction hierarchies require preprocessing the graph with contract")
+
+        source = self._snap(graph, lat_init, lon_init, max_distance_m)
+        target = self._snap(graph, lat_dest, lon_dest, max_distance_m)
+        if source < 0 or target < 0:
+            return {}
+        if algorithm == "astar":
+            path = graph.astar(source, target, self._heuristic("CAR" if vehicle else "WALK", target))
+        else:
+            path = graph.bidirectional(source, target, contracted=algorithm == "ch")
+        if path is None:
+            return {}
+        return self._route(graph, graph.unpack(path), source, f"{lat_init},{lon_init}", f"{lat_dest},{lon_dest}",
+                           arrays)
+
+    def _snap(self, graph: _Graph, latitude: float, longitude: float, max_distance_m: float) -> int:
+        """Returns the closest node with arcs of a graph within max_distance_m of a point, or -1 if there is none"""
+        latitude, longitude = float(latitude), float(longitude)
+        if not len(self.cell_keys) or math.isnan(latitude) or math.isnan(longitude):
+            return -1
+        row, column = _cell(latitude, longitude)
+        scale = math.cos(math.radians(latitude)) * METERS_PER_DEGREE
+        reach = _reach(latitude)
+        best, best_distance = -1, max_distance_m ** 2
+        for radius in range(math.ceil(max_distance_m / reach) + 1):
+            for row_offset, column_offset in _ring(radius):
+                key = (row + row_offset) * _ROW_STRIDE + column + column_offset + _ROW_STRIDE // 2
+                i = bisect.bisect_left(self.cell_keys, key)
+                if i == len(self.cell_keys) or self.cell_keys[i] != key:
+                    continue
+                for node in range(self.cell_starts[i], self.cell_starts[i + 1]):
+                    distance = (((self.lats[node] - latitude) * METERS_PER_DEGREE) ** 2
+                                + ((self.lons[node] - longitude) * scale) ** 2)
+                    if distance <= best_distance and (graph.out_offsets[node] < graph.out_offsets[node + 1]
+                                                      or graph.in_offsets[node] < graph.in_offsets[node + 1]):
+                        best, best_distance = node, distance
+            # the nodes outside this ring are farther than radius * reach
+            if best >= 0 and best_distance <= (radius * reach) ** 2:
+                break
+        return best
+
+    def _heuristic(self, profile: str, target: int) -> Callable[[int], float]:
+        """Returns the lower bound of the milliseconds from every node to the target: the straight line distance at
+        the highest speed. It is shrunk by 1% to stay below the lengths of the segments despite the approximation."""
+        latitude, longitude = self.lats[target], self.lons[target]
+        scale = math.cos(math.radians(latitude))
+        cost = self._costs[profile] * METERS_PER_DEGREE * 0.99
+
+        def heuristic(node):
+            return cost * math.hypot(self.lats[node] - latitude, (self.lons[node] - longitude) * scale)
+        return heuristic
+
+    def _route(self, graph: _Graph, arcs: List[int], source: int, origin: str, destination: str,
+               arrays: bool) -> dict:
+        """Returns the route along the arcs of road segments, in the format of the routing service"""
+        nodes = [source] + [graph.heads[arc] for arc in arcs]
+        lats = [self.lats[node] for node in nodes]
+        lons = [self.lons[node] for node in nodes]
+        instructions = self._instructions(graph, arcs)
+        route = {"bbox": [min(lons), min(lats), max(lons), max(lats)],
+                 "distance": sum(self.lengths[graph.segments[arc]] for arc in arcs), "found": "true",
+                 "from": origin, "geom": encode_polyline(zip(lats, lons)), "info": {"router": "local"},
+                 "instructionsData": {"instruction": instructions},
+                 "time": sum(graph.weights[arc] for arc in arcs), "to": destination}
+        if arrays:
+            _check_numpy()
+            route["coordinates"] = np.column_stack((lats, lons))
+            route["instruction_distances"] = np.array([item["distance"] for item in instructions], dtype=np.float64)
+        return route
+
+    def _instructions(self, graph: _Graph, arcs: List[int]) -> List[dict]:
+        """Returns an instruction per street of a route, describing the turns as the routing service"""
+        instructions = []
+        name, bearing = None, None
+        for arc in arcs:
+            segment = graph.segments[arc]
+            tail, head = graph.tails[arc], graph.heads[arc]
+            if self.segment_names[segment] == name:
+                instructions[-1]["distance"] += self.lengths[segment]
+            else:
+                name = self.segment_names[segment]
+                description = "Continúe"
+                if bearing is not None:
+                    turn = (_bearing(self.lats[tail], self.lons[tail], self.lats[head], self.lons[head]) - bearing
+                            + 180) % 360 - 180
+                    if turn > _TURN_DEGREES:
+                        description = "Gire a la derecha"
+                    elif turn < -_TURN_DEGREES:
+                        description = "Gire a la izquierda"
+                if self.names[name]:
+                    description += f" por {self.names[name]}"
+                instructions.append({"description": description, "distance": self.lengths[segment]})
+            if self.lengths[segment] > 0:
+                bearing = _bearing(self.lats[tail], self.lons[tail], self.lats[head], self.lons[head])
+        instructions.append({"description": "Objetivo logrado", "distance": 0.0})
+        return instructions
@@ -0,0 +1,95 @@
+"""
+Normalization of Spanish addresses
+
+Different spellings of the same address, e.g. "C/ Miguel Servet 5, Zaragoza" and "calle miguel servet, nº 5
+zaragoza", are normalized to the same string, which is used as key of the caches and of the deduplication of the
+batch functions. The normalization is a handful of precompiled regular expressions and a single translation table, so
+it handles millions of addresses per minute; the addresses repeated in a batch are served from a small LRU cache.
+"""
+
+import functools
+import re
+import unicodedata
+
+# street types and other usual abbreviations, once folded and without punctuation
+ABBREVIATIONS = {
+    "c": "calle", "cl": "calle", "cll": "calle", "call": "calle",
+    "av": "avenida", "avd": "avenida", "avda": "avenida", "avnda": "avenida",
+    "pz": "plaza", "pza": "plaza", "plz": "plaza", "plza": "plaza",
+    "po": "paseo", "ps": "paseo", "pso": "paseo",
+    "ctra": "carretera", "crta": "carretera", "cra": "carretera", "ctr": "carretera",
+    "cmno": "camino", "cno": "camino",
+    "gta": "glorieta", "glta": "glorieta",
+    "rda": "ronda",
+    "trv": "travesia", "trva": "travesia", "trav": "travesia",
+    "pje": "pasaje", "psje": "pasaje",
+    "cjon": "callejon", "cllon": "callejon",
+    "urb": "urbanizacion",
+    "pg": "poligono", "pol": "poligono", "polig": "poligono",
+    "bo": "barrio", "bda": "barriada",
+    "sta": "santa", "sto": "santo", "sr": "senor", "sra": "senora",
+    "dr": "doctor", "gral": "general", "pdte": "presidente",
+}
+
+# abbreviations only expanded as the leading street type, as elsewhere they mean something else (pl: planta)
+LEADING_ABBREVIATIONS = {"pl": "plaza"}
+
+
+def _fold_table() -> dict:
+    """Builds the translation table folding the accents and replacing the punctuation with spaces"""
+    table = {}
+    for code in range(0x80, 0x250):
+        char = chr(code)
+        base = unicodedata.normalize("NFKD", char)[0]
+        if base != char and ord(base) < 128 and base.isalpha():
+            table[code] = base.lower()
+    table.update({ord("º"): "o", ord("ª"): "a", ord("°"): "o"})
+    for char in ".,;:()[]{}\"'`´/\\-_#&+*¿?¡!|<>=":
+        table[ord(char)] = " "
+    return table
+
+
+_FOLD = _fold_table()
+
+# abbreviations with a slash (C/ and s/n), ordinals (1º, 2ª) and markers of the portal number (nº 5, núm. 5)
+_STREET = re.compile(r"\bc\s*/")
+_WITHOUT_NUMBER = re.compile(r"\bs\s*/\s*n\b")
+_ORDINAL = re.compile(r"(\d)\s*[ºª°]")
+_NUMBER_MARK = re.compile(r"\b(?:n|no|nro|num|numero|número|núm)\s*[.º°]*\s*(?=\d)")
+# portal numbers: leading zeros are dropped and the letter of the portal is joined (5 b, 5-B -> 5b)
+_LEADING_ZEROS = re.compile(r"\b0+(?=\d)")
+_PORTAL_LETTER = re.compile(r"\b(\d+) ([a-z])\b(?! \d)")
+
+
+def normalize_address(address: str) -> str:
+    """Normalizes a Spanish address: case and accents are folded, the street type abbreviations (C/, Avda., Pza.,
+    ...) are expanded, the portal numbers are canonicalized and the punctuation is removed.
+
+    Parameters
+    ----------
+    address: str
+        Free text address, e.g. "C/ Miguel Servet nº 5, Zaragoza"
+
+    Returns
+    -------
+    normalized_address: the normalized address, e.g. "calle miguel servet 5 zaragoza", or "" if it is empty
+    """
+    if not address:
+        return ""
+    return _normalize(str(address))
+
+
+@functools.lru_cache(maxsize=65536)
+def _normalize(address: str) -> str:
+    text = address.lower()
+    if "/" in text:
+        text = _STREET.sub(" calle ", _WITHOUT_NUMBER.sub(" sn ", text))
+    text = _ORDINAL.sub(r"\1", text)
+    text = _NUMBER_MARK.sub(" ", text)
+    text = _LEADING_ZEROS.sub("", " ".join(text.translate(_FOLD).split()))
+    # the portal letters are joined before expanding the abbreviations, as some are letters too (5 C is not 5 calle)
+    text = _PORTAL_LETTER.sub(r"\1\2", text)
+    tokens = [ABBREVIATIONS.get(token, token) for token in text.split()]
+    if tokens:
+        tokens[0] = LEADING_ABBREVIATIONS.get(tokens[0], tokens[0])
+    return " ".join(tokens)
@@ -0,0 +1,122 @@
+"""
+Vectorized decoding of the route geometries and instruction distances into NumPy arrays
+
+The routing service returns the route geometry as an encoded polyline (Google's polyline algorithm). It is decoded
+with array operations over all its bytes at once, instead of a Python loop per coordinate. Requires numpy
+(``pip install pycartociudad[numpy]``), which is imported on first use so that the routing functions don't load it
+when the arrays aren't requested. The routes computed locally are encoded with ``encode_polyline``, which doesn't
+require numpy.
+"""
+
+import re
+from typing import Iterable, Sequence, Tuple
+
+np = None
+
+# distance in meters of an instruction, e.g. "120 m"
+_DISTANCE_PATTERN = re.compile(rb"(\d+) m")
+
+
+def _check_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("numpy is required to decode routes into arrays: pip install pycartociudad[numpy]")
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> "np.ndarray":
+    """Decodes an encoded polyline.
+
+    Parameters
+    ----------
+    encoded: str
+        Encoded polyline, e.g. the ``geom`` of a route
+
+    precision: int
+        Number of decimals of the encoded coordinates (default 5)
+
+    Returns
+    -------
+    coordinates: a (N, 2) float64 array with the latitude and longitude of every point
+    """
+    _check_numpy()
+    chunks = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    if not len(chunks):
+        return np.empty((0, 2), dtype=np.float64)
+
+    # every value is split in 5-bit chunks, least significant first; the 0x20 bit flags that more chunks follow
+    last = (chunks & 0x20) == 0
+    if not last[-1] or np.any((chunks < 0) | (chunks > 63)):
+        raise ValueError("Invalid encoded polyline")
+    ends = np.flatnonzero(last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = 5 * (np.arange(len(chunks)) - np.repeat(starts, ends - starts + 1))
+    values = np.add.reduceat((chunks & 0x1f) << shifts, starts)
+    if len(values) % 2:
+        raise ValueError("Invalid encoded polyline")
+
+    # zigzag-decoded deltas from the previous point
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10 ** precision
+
+
+def encode_polyline(coordinates: Iterable[Tuple[float, float]], precision: int = 5) -> str:
+    """Encodes the points of a route as a polyline, the inverse of ``decode_polyline``.
+
+    Parameters
+    ----------
+    coordinates: iterable of (latitude, longitude) tuples
+        Points of the route in geographical coordinates
+
+    precision: int
+        Number of decimals of the encoded coordinates (default 5)
+
+    Returns
+    -------
+    encoded: the encoded polyline
+    """
+    chars = []
+    factor = 10 ** precision
+    previous_latitude, previous_longitude = 0, 0
+    for latitude, longitude in coordinates:
+        latitude, longitude = round(latitude * factor), round(longitude * factor)
+        for value in (latitude - previous_latitude, longitude - previous_longitude):
+            # zigzag encoding of the delta, split in 5-bit chunks flagged with 0x20 while more chunks follow
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chars.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chars.append(chr(value + 63))
+        previous_latitude, previous_longitude = latitude, longitude
+    return "".join(chars)
+
+
+def instruction_distances(distances: Sequence[str]) -> "np.ndarray":
+    """Parses the distances of the route instructions in a single pass over all of them.
+
+    Parameters
+    ----------
+    distances: sequence of str
+        Distance of every instruction as returned by the routing service (e.g. "120 m")
+
+    Returns
+    -------
+    meters: a float64 array with the meters of every instruction. It is NaN for the distances without exactly one
+    value in meters, which ``route_between_two_points`` leaves unparsed.
+    """
+    _check_numpy()
+    meters = np.full(len(distances), np.nan)
+    text = "\n".join(str(distance) for distance in distances).encode("utf-8")
+    matches = list(_DISTANCE_PATTERN.finditer(text))
+    if not matches:
+        return meters
+
+    # the instruction of every match is the number of line breaks before it
+    line_breaks = np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == ord("\n"))
+    lines = np.searchsorted(line_breaks, [match.start() for match in matches])
+    single = np.bincount(lines, minlength=len(distances))[lines] == 1
+    values = np.array([match.group(1) for match in matches]).astype(np.float64)
+    meters[lines[single]] = values[single]
+    return meters
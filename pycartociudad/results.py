@@ -0,0 +1,186 @@
+"""
+Compact result objects of the geocoding, reverse geocoding, location info and routing functions
+
+They are returned instead of dicts when the functions are called with ``typed=True``. Their fields are stored in
+``__slots__`` and the repeated strings (province, municipality, ...) are interned, so millions of results take a
+fraction of the memory of the dicts. They are read-only mappings, so ``result["address"]`` keeps working, and
+``to_dict`` converts them back to plain dicts.
+"""
+
+import re
+import sys
+from collections.abc import Mapping
+from typing import List, Tuple, Union
+
+from pycartociudad.polyline import decode_polyline
+
+# fields of the geocoding and reverse geocoding results
+GEOCODE_FIELDS = ("id", "province", "comunidadAutonoma", "muni", "type", "address", "postalCode", "poblacion", "geom",
+                  "tip_via", "lat", "lng", "portalNumber", "stateMsg", "state", "priority", "countryCode",
+                  "refCatastral")
+
+# fields of the location info results besides the geocoding ones
+LOCATION_FIELDS = ("cadastral_ref", "census_section", "district_code")
+
+# fields of the route results
+ROUTE_FIELDS = ("bbox", "distance", "found", "from", "geom", "info", "instructionsData", "time", "to")
+
+# fields with few distinct values, interned so all the results share the same string objects
+_INTERNED_FIELDS = frozenset(["province", "comunidadAutonoma", "muni", "type", "poblacion", "tip_via", "stateMsg",
+                              "countryCode", "postalCode"])
+
+_WKT_TOKENS = re.compile(r"\(|\)|[^(),]+")
+
+
+def parse_wkt(wkt: str) -> Union[Tuple[float, float], List]:
+    """Parses the coordinates of a WKT geometry.
+
+    Parameters
+    ----------
+    wkt: str
+        WKT geometry, e.g. "POINT (-3.7066 40.4150)"
+
+    Returns
+    -------
+    coordinates: a (x, y) tuple for points, nested lists of (x, y) tuples for the other geometries, or None for empty
+    geometries
+    """
+    name, _, body = wkt.strip().partition("(")
+    if not body:
+        return None
+
+    stack = [[]]
+    for token in _WKT_TOKENS.findall("(" + body):
+        if token == "(":
+            group = []
+            stack[-1].append(group)
+            stack.append(group)
+        elif token == ")":
+            stack.pop()
+        else:
+            for point in token.split(","):
+                values = point.split()
+                if values:
+                    stack[-1].append((float(values[0]), float(values[1])))
+
+    coordinates = stack[0][0]
+    return coordinates[0] if name.strip().upper() == "POINT" else coordinates
+
+
+class _Result(Mapping):
+    """Read-only mapping whose known keys are stored in slots. Unknown keys are kept in a separate dict."""
+
+    __slots__ = ("_extra",)
+
+    # (key, attribute) of the known keys, in their iteration order
+    _keys = ()
+    _attribute_of = {}
+    _attribute_names = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._attribute_of = dict(cls._keys)
+        cls._attribute_names = frozenset(cls._attribute_of.values())
+
+    def __init__(self, data: dict = None):
+        attributes = self._attribute_of
+        extra = None
+        for key, value in (data or {}).items():
+            attribute = attributes.get(key)
+            if attribute is None:
+                extra = extra or {}
+                extra[key] = value
+                continue
+            if key in _INTERNED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            object.__setattr__(self, attribute, value)
+        object.__setattr__(self, "_extra", extra)
+
+    def __getattr__(self, name: str):
+        # the fields missing in the response are None
+        if name in self._attribute_names:
+            return None
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f"{type(self).__name__!r} objects are read-only")
+
+    def __getitem__(self, key: str):
+        attribute = self._attribute_of.get(key)
+        if attribute is not None:
+            try:
+                return object.__getattribute__(self, attribute)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key, attribute in self._keys:
+            try:
+                object.__getattribute__(self, attribute)
+            except AttributeError:
+                continue
+            yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __reduce__(self):
+        return type(self), (self.to_dict(),)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def to_dict(self) -> dict:
+        """Returns the result as the plain dict returned by the functions without ``typed=True``"""
+        return {key: self[key] for key in self}
+
+
+class GeocodeResult(_Result):
+    """Result of ``geocode`` and ``reverse_geocode``. See their documentation for the details of the fields."""
+
+    __slots__ = GEOCODE_FIELDS + ("_coordinates",)
+    _keys = tuple((field, field) for field in GEOCODE_FIELDS)
+
+    @property
+    def coordinates(self) -> Union[Tuple[float, float], List]:
+        """Coordinates of the ``geom`` WKT geometry, parsed on first access: a (longitude, latitude) tuple for
+        points, or nested lists of them for the other geometries. None if there is no geometry."""
+        try:
+            return object.__getattribute__(self, "_coordinates")
+        except AttributeError:
+            coordinates = parse_wkt(self.geom) if self.geom else None
+            object.__setattr__(self, "_coordinates", coordinates)
+            return coordinates
+
+
+class LocationInfo(GeocodeResult):
+    """Result of ``get_location_info``. See its documentation for the details of the fields."""
+
+    __slots__ = LOCATION_FIELDS + ("errors",)
+    _keys = tuple((field, field) for field in LOCATION_FIELDS + GEOCODE_FIELDS + ("errors",))
+
+
+class RouteResult(_Result):
+    """Result of ``route_between_two_points``. See its documentation for the details of the fields.
+
+    The ``from`` field is available as the ``origin`` attribute, as ``from`` is a reserved word.
+    """
+
+    __slots__ = tuple(field for field in ROUTE_FIELDS if field != "from") + ("origin", "_coordinates")
+    _keys = tuple((field, "origin" if field == "from" else field) for field in ROUTE_FIELDS)
+
+    @property
+    def coordinates(self):
+        """Points of the encoded ``geom`` polyline, decoded on first access into a (N, 2) float64 NumPy array of
+        (latitude, longitude) rows (requires numpy). None if there is no geometry."""
+        try:
+            return object.__getattribute__(self, "_coordinates")
+        except AttributeError:
+            coordinates = decode_polyline(self.geom) if self.geom else None
+            object.__setattr__(self, "_coordinates", coordinates)
+            return coordinates
@@ -5,9 +5,20 @@ Reverse geocoding of a location using cartociudad API
 import requests
 import urllib
 import json
+from typing import Iterable, Iterator, Tuple
+from pycartociudad._batch import imap_unique
+from pycartociudad._decode import loads
+from pycartociudad._spatial import PointGrid
+from pycartociudad.cache import cached
+from pycartociudad.client import Client, get_default_client
+from pycartociudad.exceptions import ServiceError
+from pycartociudad.results import GeocodeResult
 
+REVERSE_GEOCODE_URL = 'http://www.cartociudad.es/geocoder/api/geocoder/reverseGeocode'
 
-def reverse_geocode(latitude: float, longitude: float, cadastral: bool = False, error: str = 'raise') -> dict:
+
+def reverse_geocode(latitude: float, longitude: float, cadastral: bool = False, error: str = 'raise',
+                    client: Client = None, typed: bool = False) -> dict:
     """This function performs reverse geocoding of a location in Spain.
     It returns the closest address details (or cadastral details if)  a
     cadastral reverse geocode is done.
@@ -23,6 +34,13 @@ def reverse_geocode(latitude: float, longitude: float, cadastral: bool = False,
     cadastral: bool (optional) (default: False)
         Set to True if performing cadastral address reverse geocoding
 
+    client: Client (optional)
+        HTTP client used to perform the request. Default value is None
+        and will use the shared default client.
+
+    typed: bool (optional) (default: False)
+        If True, returns a compact ``GeocodeResult`` instead of a dict
+
     Returns
     -------
     addrs_details :  dictionary with the following items
@@ -58,33 +76,135 @@ def reverse_geocode(latitude: float, longitude: float, cadastral: bool = False,
     ** For cadastral searches **: Same fields but
         * address:           Address as registered in Cadastre
         * refCatastral:      Cadastral reference
+
+    Raises
+    ------
+    ServiceError: if the service answers with an HTTP error or an invalid response, and error is 'raise'
     """
 
     # build query content
+    qParams = _build_params(latitude, longitude, cadastral)
+
+    # perform request, unless there is a portal of the local index of the client nearby
+    client = client or get_default_client()
+    if client.local_geocoder is not None and not cadastral:
+        result = client.local_geocoder.reverse_lookup(latitude, longitude)
+        if result:
+            return GeocodeResult(result) if typed else result
+
+    def request():
+        r = client.get(REVERSE_GEOCODE_URL, params=qParams)
+        return _handle_response(r, error)
+
+    # ignored errors always give an empty result, not worth caching nor coalescing
+    cache, flights = (client.cache, client.flights) if error != 'ignore' else (None, None)
+    query = {'lat': latitude, 'lon': longitude, 'cadastral': cadastral}
+    result = cached(cache, 'reverse_geocode', query, request, flights=flights)
+    return GeocodeResult(result) if typed else result
+
+
+def reverse_geocode_many(points: Iterable[Tuple[float, float]], reuse_radius_m: float = 10, cadastral: bool = False,
+                         max_workers: int = 8, ordered: bool = True, client: Client = None,
+                         time_budget: float = None, typed: bool = False
+                         ) -> Iterator[Tuple[Tuple[float, float], dict]]:
+    """Reverse geocodes many points concurrently, reusing the answer of a
+    nearby point instead of requesting every one of them.
+
+    Every point is matched against a grid index of the points already
+    requested (or in flight): if one of them is within ``reuse_radius_m``
+    meters, the point gets its answer; otherwise it is requested and
+    indexed. On dense traces, e.g. GPS telemetry sampled every second, most
+    points fall within a few meters of a previous one, so the requests drop
+    by orders of magnitude.
+
+    Parameters
+    ----------
+    points : iterable of (float, float)
+        (latitude, longitude) points in geographical coordinates. Any
+        iterable is allowed, including generators, and it is consumed
+        lazily.
+
+    reuse_radius_m : float
+        Maximum distance in meters to reuse the answer of another point
+        (default 10). With 0 or None, only the repeated points share it.
+
+    cadastral : bool
+        Set to True if performing cadastral address reverse geocoding
+
+    max_workers : int
+        Maximum number of concurrent requests (default 8). The pool size of
+        the client should be at least this value.
+
+    ordered : bool
+        If True (default), results are yielded in the same order as the
+        points. Otherwise, they are yielded as soon as they are ready.
+
+    client : Client (optional)
+        HTTP client used to perform the requests. Default value is None
+        and will use the shared default client.
+
+    time_budget : float (optional)
+        Maximum seconds for the whole batch. The points not reverse geocoded
+        in time get a ``DeadlineExceeded`` result. Default value is None, no
+        limit.
+
+    typed : bool
+        If True, the addresses are compact ``GeocodeResult`` objects
+        instead of dicts (default False)
+
+    Returns
+    -------
+    results
+        A generator of ((latitude, longitude), address) tuples, where
+        address is the ``reverse_geocode`` result of the point (or of the
+        nearby point whose answer was reused), or the exception raised
+        while reverse geocoding it. A failing point doesn't stop the batch.
+    """
+    client = client or get_default_client()
+    grid = PointGrid(reuse_radius_m) if reuse_radius_m else None
+
+    def key(point):
+        latitude, longitude = float(point[0]), float(point[1])
+        if grid is None:
+            return latitude, longitude
+        nearby = grid.nearest(latitude, longitude)
+        if nearby is None:
+            nearby = (latitude, longitude)
+            grid.add(latitude, longitude, nearby)
+        return nearby
+
+    def reverse_geocode_one(point):
+        return reverse_geocode(point[0], point[1], cadastral=cadastral, client=client, typed=typed)
+
+    return imap_unique(reverse_geocode_one, points, key=key, max_workers=max_workers, ordered=ordered,
+                       time_budget=time_budget)
+
+
+def _build_params(latitude, longitude, cadastral: bool) -> str:
+    """Builds the query string of a reverse geocoding request"""
     searchContent = {'lat': latitude,
                      'lon': longitude}
     if cadastral:
         searchContent['type'] = 'refcatastral'
 
-    qParams = urllib.parse.urlencode(searchContent)
+    return urllib.parse.urlencode(searchContent)
 
-    url = 'http://www.cartociudad.es/geocoder/api/geocoder/reverseGeocode'
 
-    # perform request
+def _handle_response(r, error: str) -> dict:
+    """Checks the reverse geocoding response and parses its content"""
     try:
-        r = requests.get(url=url, params=qParams)
         if error == 'raise':
             r.raise_for_status()
         elif error == 'ignore':
             return {}
     except requests.exceptions.HTTPError as err:
-        raise SystemExit(err)
+        raise ServiceError(str(err)) from err
 
     try:
-        addrs_details = json.loads(r.text)
+        addrs_details = loads(r.content, 'reverse_geocode')
         if error == 'ignore':
             addrs_details = {}
     except json.JSONDecodeError as err:
-        raise SystemExit(err)
+        raise ServiceError(f"Invalid reverse geocoding response: {err}") from err
 
     return addrs_details
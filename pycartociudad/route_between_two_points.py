@@ -5,11 +5,23 @@ Get the route between two points using cartociudad API
 import re
 import json
 import requests
+from pycartociudad._decode import loads
+from pycartociudad.cache import cached
+from pycartociudad.client import Client, get_default_client
+from pycartociudad.exceptions import RouteNotFoundError, ServiceError
+from pycartociudad.polyline import decode_polyline, instruction_distances
+from pycartociudad.results import RouteResult
+
+ROUTE_URL = 'http://www.cartociudad.es/services/api/route'
+
+# distance in meters of an instruction, e.g. "120 m"
+_DISTANCE_PATTERN = re.compile(r"(\d+) m")
 
 
 def route_between_two_points(lat_init: float, lon_init: float, lat_dest: float,
                              lon_dest: float, vehicle: bool = False,
-                             error: str = 'raise') -> dict:
+                             error: str = 'raise', client: Client = None, typed: bool = False,
+                             arrays: bool = False) -> dict:
     """This function get the route between two points.
 
     Parameters
@@ -27,6 +39,15 @@ def route_between_two_points(lat_init: float, lon_init: float, lat_dest: float,
     :param error: str
         if 'raise', an error would be raise, if 'ignore, just return an
         empty list.
+    :param client: Client
+        HTTP client used to perform the request. If None, uses the shared
+        default client.
+    :param typed: bool
+        If True, returns a compact ``RouteResult`` instead of a dict.
+    :param arrays: bool
+        If True, adds the decoded geometry as 'coordinates' and the meters
+        of the instructions as 'instruction_distances', both NumPy arrays
+        (requires numpy). The instructions are left unparsed.
     Returns
     -------
      :  dict with the following info:
@@ -39,36 +60,70 @@ def route_between_two_points(lat_init: float, lon_init: float, lat_dest: float,
         * 'instructionsData: dict with the instructions
         * 'time': time that takes (float)
         * 'to': final destination point given by user
+        * 'coordinates': (N, 2) float64 array with the latitude and longitude
+          of the points of the route, only if arrays is True
+        * 'instruction_distances': float64 array with the meters of each
+          instruction (NaN if unknown), only if arrays is True
 
+    Raises
+    ------
+    ServiceError: if the service answers with an HTTP error or an invalid response, and error is 'raise'
+    RouteNotFoundError: if there is no route between the points, and error is 'raise'
     """
 
-    # base url:
-    base_url = f'http://www.cartociudad.es/services/api/route'
-    request_url = f'{base_url}?orig={lat_init},{lon_init}&dest={lat_dest},{lon_dest}' \
-                  f'&locale=es&vehicle={"CAR" if vehicle else "WALK"}'
+    request_url = _build_url(lat_init, lon_init, lat_dest, lon_dest, vehicle)
+
+    # perform request, unless the route is found in the local graph of the client
+    client = client or get_default_client()
+    if client.local_router is not None:
+        result = client.local_router.route(lat_init, lon_init, lat_dest, lon_dest, vehicle=vehicle, arrays=arrays)
+        if result:
+            return RouteResult(result) if typed else result
+
+    def request():
+        request_result = client.get(request_url)
+        return _handle_response(request_result, error, parse_instructions=not arrays)
+
+    # ignored errors always give an empty result, not worth caching nor coalescing
+    cache, flights = (client.cache, client.flights) if error != 'ignore' else (None, None)
+    query = {'orig': f'{lat_init},{lon_init}', 'dest': f'{lat_dest},{lon_dest}', 'vehicle': vehicle}
+    # the routes with unparsed instructions are cached apart
+    result = cached(cache, 'route_raw' if arrays else 'route', query, request, flights=flights)
+    if arrays:
+        result = _add_arrays(result)
+    return RouteResult(result) if typed else result
 
-    # perform request
+
+def _build_url(lat_init, lon_init, lat_dest, lon_dest, vehicle: bool) -> str:
+    """Builds the url of a route request"""
+    return f'{ROUTE_URL}?orig={lat_init},{lon_init}&dest={lat_dest},{lon_dest}' \
+           f'&locale=es&vehicle={"CAR" if vehicle else "WALK"}'
+
+
+def _handle_response(request_result, error: str, parse_instructions: bool = True) -> dict:
+    """Checks the route response and parses its content. The distances of the instructions are only
+    parsed if parse_instructions is True."""
     try:
-        request_result = requests.get(request_url)
         if error == 'raise':
             request_result.raise_for_status()
         elif error == 'ignore':
             return {}
     except requests.exceptions.HTTPError as err:
-        raise SystemExit(err)
+        raise ServiceError(str(err)) from err
 
     # load results
     try:
-        instructions_raw = json.loads(request_result.text)
+        instructions_raw = loads(request_result.content, 'route')
         if error == 'ignore':
             request_result = {}
     except json.JSONDecodeError as err:
-        raise SystemExit(err)
+        raise ServiceError(f"Invalid route response: {err}") from err
 
     if instructions_raw['found'] == 'false':
         # Can not find the route
         if error == 'raise':
-            raise SystemExit()
+            raise RouteNotFoundError(f"Route not found from {instructions_raw.get('from')} to "
+                                     f"{instructions_raw.get('to')}")
         elif error == 'ignore':
             return {}
 
@@ -76,14 +131,24 @@ def route_between_two_points(lat_init: float, lon_init: float, lat_dest: float,
     instructions_raw['distance'] = float(instructions_raw['distance'])
     instructions_raw['time'] = float(instructions_raw['time'])
 
+    if not parse_instructions:
+        return instructions_raw
+
     # parse to float in each instruction:
-    re_pattern = r"(\d+) m"
     for item in instructions_raw['instructionsData']['instruction']:
         distance_item = item['distance']
-        distance_found = re.findall(re_pattern, distance_item)
+        distance_found = _DISTANCE_PATTERN.findall(distance_item)
 
         if distance_found and len(distance_found) == 1:
             item['distance'] = float(distance_found[0])
 
     return instructions_raw
 
+
+def _add_arrays(route: dict) -> dict:
+    """Returns a copy of a route with its geometry and the distances of its instructions decoded into arrays"""
+    if not route:
+        return route
+    instructions = (route.get('instructionsData') or {}).get('instruction') or []
+    return dict(route, coordinates=decode_polyline(route.get('geom') or ''),
+                instruction_distances=instruction_distances([item['distance'] for item in instructions]))
@@ -0,0 +1,113 @@
+"""
+Distance and time matrices between many origins and destinations using cartociudad API
+"""
+
+from typing import List, Sequence, Tuple
+
+from pycartociudad._batch import imap_unique
+from pycartociudad.cache import cached
+from pycartociudad.client import Client, get_default_client
+from pycartociudad.exceptions import RouteNotFoundError
+from pycartociudad.route_between_two_points import _build_url, _handle_response
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+def route_matrix(origins: Sequence[Tuple[float, float]], destinations: Sequence[Tuple[float, float]],
+                 vehicle: bool = False, symmetric: bool = False, max_workers: int = 8,
+                 client: Client = None, time_budget: float = None, return_errors: bool = False) -> Tuple:
+    """Computes the route distance and time between every origin and every destination.
+    The legs are requested concurrently and only their distance and time are parsed.
+
+    Parameters
+    ----------
+    origins: sequence of (latitude, longitude) tuples
+        Origin points in geographical coordinates
+
+    destinations: sequence of (latitude, longitude) tuples
+        Destination points in geographical coordinates
+
+    vehicle: bool
+        If True, uses vehicle, if False walking (default False)
+
+    symmetric: bool
+        If True, the route from A to B is reused for B to A. Only allowed for walking routes, as the
+        vehicle ones depend on the direction (default False).
+
+    max_workers: int
+        Maximum number of concurrent requests (default 8)
+
+    client: Client (optional)
+        HTTP client used to perform the requests. Default value is None and will use the shared default client.
+
+    time_budget: float (optional)
+        Maximum seconds for the whole matrix. The legs not requested in time are NaN. Default value is None, no limit.
+
+    return_errors: bool
+        If True, also returns the exceptions of the failed legs (default False)
+
+    Returns
+    -------
+    (distances, times): two float64 arrays of shape (len(origins), len(destinations)) with the distance in meters
+    and the time of every leg, as returned by ``route_between_two_points``. The legs whose route is not
+    found or fails are NaN.
+
+    With ``return_errors``, (distances, times, errors), where errors is a dict with the exception raised by each
+    failed leg (e.g. ``ServiceError``, or ``DeadlineExceeded`` for the legs not requested in time) keyed by its
+    (origin, destination) indices. The legs whose route is not found are NaN without error.
+    """
+    if np is None:
+        raise ImportError("numpy is required for route matrices: pip install pycartociudad[numpy]")
+    if symmetric and vehicle:
+        raise ValueError("Symmetric routes are only allowed for walking routes")
+
+    client = client or get_default_client()
+    origins = [tuple(point) for point in origins]
+    destinations = [tuple(point) for point in destinations]
+    distances = np.full((len(origins), len(destinations)), np.nan)
+    times = np.full((len(origins), len(destinations)), np.nan)
+    errors = {}
+
+    def leg_key(leg):
+        (_, origin), (_, destination) = leg
+        return tuple(sorted((origin, destination))) if symmetric else (origin, destination)
+
+    def route_leg(leg):
+        (_, origin), (_, destination) = leg
+        if origin == destination:
+            return 0.0, 0.0
+        return _route_summary(origin, destination, vehicle, client)
+
+    legs = ((origin, destination) for origin in enumerate(origins) for destination in enumerate(destinations))
+    for ((i, _), (j, _)), summary in imap_unique(route_leg, legs, key=leg_key, max_workers=max_workers,
+                                                 ordered=False, time_budget=time_budget):
+        if isinstance(summary, Exception):
+            errors[i, j] = summary
+        elif summary is not None:
+            distances[i, j], times[i, j] = summary
+
+    return (distances, times, errors) if return_errors else (distances, times)
+
+
+def _route_summary(origin: Tuple[float, float], destination: Tuple[float, float], vehicle: bool,
+                   client: Client) -> List[float]:
+    """Returns the [distance, time] of a route, or None if it is not found"""
+    if client.local_router is not None:
+        route = client.local_router.route(*origin, *destination, vehicle=vehicle)
+        if route:
+            return [route['distance'], route['time']]
+
+    def request():
+        request_result = client.get(_build_url(*origin, *destination, vehicle))
+        try:
+            route = _handle_response(request_result, 'raise', parse_instructions=False)
+        except RouteNotFoundError:
+            return None
+        return [route['distance'], route['time']]
+
+    query = {'orig': f'{origin[0]},{origin[1]}', 'dest': f'{destination[0]},{destination[1]}', 'vehicle': vehicle}
+    return cached(client.cache, 'route_summary', query, request, keep=lambda summary: summary is not None,
+                  flights=client.flights)
@@ -0,0 +1,133 @@
+"""
+Coalescing of identical in-flight requests
+
+Concurrent calls with the same endpoint and normalized query wait on a single upstream request and share its result
+(or its exception), so a burst of lookups of a popular address only reaches the services once. The callers waiting on
+another one get a copy of its result, so modifying a result doesn't change the others.
+"""
+
+import copy
+import threading
+import time
+from typing import Awaitable, Callable, Union
+
+from pycartociudad import instrumentation
+from pycartociudad.cache import normalize_query
+
+
+class _Call:
+    """In-flight call of a ``SingleFlight`` group"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Group of in-flight calls shared by the threads performing identical requests."""
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, endpoint: str, query: Union[str, dict], compute: Callable):
+        """Returns the result of a query. If the same query is already in flight, waits for it instead of computing it.
+
+        Parameters
+        ----------
+        endpoint: str
+            Name of the queried endpoint (e.g. "geocode")
+
+        query: str or dict
+            Query sent to the endpoint
+
+        compute: callable
+            Function without arguments performing the request
+
+        Returns
+        -------
+        result: the result of the call. If it raised an exception, it is raised to every waiting caller.
+        """
+        key = (endpoint, normalize_query(query))
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            start = time.monotonic()
+            call.done.wait()
+            _emit(endpoint, True, start)
+            if call.error is not None:
+                raise call.error
+            return copy.copy(call.result)
+
+        _emit(endpoint, False)
+        try:
+            call.result = compute()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        """Returns the number of calls and how many of them shared an in-flight request"""
+        return {"calls": self.calls, "shared": self.shared}
+
+
+class AsyncSingleFlight:
+    """Group of in-flight calls shared by the coroutines performing identical requests in an event loop."""
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._calls = {}
+
+    async def do(self, endpoint: str, query: Union[str, dict], compute: Callable[[], Awaitable]):
+        """Coroutine version of ``SingleFlight.do``, where ``compute`` returns an awaitable.
+
+        A cancelled caller doesn't cancel the shared request, which goes on for the other callers.
+        """
+        import asyncio  # only the asyncio clients use this class, so it isn't imported with the package
+
+        key = (endpoint, normalize_query(query))
+        self.calls += 1
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(compute())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+            _emit(endpoint, False)
+            return await asyncio.shield(future)
+
+        self.shared += 1
+        start = time.monotonic()
+        try:
+            return copy.copy(await asyncio.shield(future))
+        finally:
+            _emit(endpoint, True, start)
+
+    def stats(self) -> dict:
+        """Returns the number of calls and how many of them shared an in-flight request"""
+        return {"calls": self.calls, "shared": self.shared}
+
+
+def _emit(endpoint: str, shared: bool, start: float = None):
+    """Reports a coalesced call to the instrumentation hooks, with the time it waited if it was shared"""
+    if instrumentation.enabled():
+        duration = time.monotonic() - start if start is not None else None
+        instrumentation.emit(instrumentation.Event(instrumentation.COALESCE, endpoint, shared=shared,
+                                                   duration=duration))
@@ -0,0 +1,273 @@
+"""
+Adaptive per-host pacing of the requests to the cartociudad, cadastre and census services
+
+Every upstream host gets a token bucket, which caps its request rate, and an AIMD (additive increase,
+multiplicative decrease) concurrency limit, which grows while the host answers fine and is cut on errors
+and latency spikes. The throughput of each host converges to the maximum it tolerates.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict
+
+# statuses telling the host is overloaded
+OVERLOAD_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# weights of the new latencies in the moving average of a host, the spikes being folded slower
+LATENCY_WEIGHT = 0.1
+SPIKE_WEIGHT = 0.02
+
+
+class TokenBucket:
+    """Token bucket allowing ``rate`` requests per second on average, with bursts of up to ``burst`` requests.
+
+    Parameters
+    ----------
+    rate: float
+        Average requests per second
+
+    burst: int (optional)
+        Size of the bucket. Default value is the rate, i.e. up to one second of requests in a burst.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class AIMDLimiter:
+    """Adaptive limit of concurrent requests.
+
+    The limit grows by one every ``limit`` successful requests (i.e. once per round of requests) and is
+    multiplied by ``backoff`` on an error or on a latency above ``latency_factor`` times the usual one. The
+    requests already in flight when the limit is cut don't cut it again, so a burst of errors backs off once. The
+    usual latency is a moving average of the successful requests, spikes included with a lower weight, so it follows
+    a lasting change of the latency of the host.
+
+    Parameters
+    ----------
+    initial_limit: int
+        Initial concurrency limit (default 8)
+
+    min_limit: int
+        Minimum concurrency limit (default 1)
+
+    max_limit: int
+        Maximum concurrency limit (default 64)
+
+    backoff: float
+        Factor applied to the limit on errors and latency spikes (default 0.5)
+
+    latency_factor: float
+        Latency, relative to the moving average of the successful requests, considered a spike (default 3)
+    """
+
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1, max_limit: int = 64, backoff: float = 0.5,
+                 latency_factor: float = 3):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.latency = None
+        self._epoch = 0
+        self._condition = threading.Condition()
+        # (loop, future) of the coroutines waiting for a slot
+        self._waiters = []
+
+    def try_acquire(self) -> int:
+        """Takes a slot if there is a free one. Returns its token, or None if the limit is reached."""
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return None
+            self.in_flight += 1
+            return self._epoch
+
+    def acquire(self, timeout: float = None) -> int:
+        """Waits for a free slot and takes it. Returns its token, to be given back in ``release``."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                raise TimeoutError("No free request slot in time")
+            self.in_flight += 1
+            return self._epoch
+
+    async def acquire_async(self) -> int:
+        """Coroutine version of ``acquire``, which waits on a future resolved by ``release`` instead of blocking"""
+        loop = asyncio.get_event_loop()
+        while True:
+            with self._condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return self._epoch
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, token: int, success: bool = True, latency: float = None):
+        """Frees a slot and adapts the limit to the outcome of its request.
+
+        Parameters
+        ----------
+        token: int
+            Token returned when the slot was taken
+
+        success: bool
+            False if the request failed or the host reported it is overloaded, None if its outcome is unknown (e.g.
+            it was cancelled), which frees the slot without adapting the limit
+
+        latency: float (optional)
+            Seconds taken by the request
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if success is None:
+                self._notify()
+                return
+            congested = not success
+            if success and latency is not None:
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    # the spikes are folded slowly into the usual latency, so a lasting rise of the latency of the
+                    # host becomes its new usual one instead of backing off for good
+                    congested = latency > self.latency_factor * self.latency
+                    weight = SPIKE_WEIGHT if congested else LATENCY_WEIGHT
+                    self.latency = (1 - weight) * self.latency + weight * latency
+
+            if not congested:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif token == self._epoch:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._epoch += 1
+            self._notify()
+
+    def _notify(self):
+        """Wakes the threads and coroutines waiting for a slot. Must be called with the condition held."""
+        self._condition.notify_all()
+        waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                # the loop of the waiter is already closed
+                pass
+
+
+def _wake(waiter: asyncio.Future):
+    """Resolves the future of a coroutine waiting for a slot, unless it was cancelled"""
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class Throttle:
+    """Per-host rate limiter and adaptive concurrency limiter, to be shared by the clients.
+
+    Parameters
+    ----------
+    rates: dict (optional)
+        Maximum requests per second by host (e.g. {"www.cartociudad.es": 20}). Default value is None.
+
+    default_rate: float (optional)
+        Maximum requests per second of the hosts not in ``rates``. Default value is None, no rate limit.
+
+    burst: int (optional)
+        Size of the token buckets. Default value is one second of requests.
+
+    initial_concurrency, min_concurrency, max_concurrency, backoff, latency_factor:
+        Settings of the ``AIMDLimiter`` of every host
+    """
+
+    def __init__(self, rates: Dict[str, float] = None, default_rate: float = None, burst: int = None,
+                 initial_concurrency: int = 8, min_concurrency: int = 1, max_concurrency: int = 64,
+                 backoff: float = 0.5, latency_factor: float = 3):
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self.burst = burst
+        self._limiter_settings = dict(initial_limit=initial_concurrency, min_limit=min_concurrency,
+                                      max_limit=max_concurrency, backoff=backoff, latency_factor=latency_factor)
+        self._hosts = {}
+        self._paused_until = {}
+        self._lock = threading.Lock()
+
+    def _host(self, host: str):
+        """Returns the (bucket, limiter) of a host, creating them on first use"""
+        limits = self._hosts.get(host)
+        if limits is None:
+            with self._lock:
+                limits = self._hosts.get(host)
+                if limits is None:
+                    rate = self.rates.get(host, self.default_rate)
+                    bucket = TokenBucket(rate, self.burst) if rate else None
+                    limits = self._hosts[host] = (bucket, AIMDLimiter(**self._limiter_settings))
+        return limits
+
+    def _delay(self, host: str, bucket: TokenBucket) -> float:
+        """Returns the seconds to wait before the next request to a host, given its rate and pauses"""
+        delay = bucket.reserve() if bucket is not None else 0
+        return max(delay, self._paused_until.get(host, 0) - time.monotonic())
+
+    def acquire(self, host: str, timeout: float = None) -> tuple:
+        """Waits until a request to the host is allowed. Returns the token to give back in ``release``."""
+        bucket, limiter = self._host(host)
+        delay = self._delay(host, bucket)
+        if delay > 0:
+            time.sleep(delay)
+        return host, limiter.acquire(timeout), time.monotonic()
+
+    async def acquire_async(self, host: str) -> tuple:
+        """Coroutine version of ``acquire``, which doesn't block the event loop"""
+        bucket, limiter = self._host(host)
+        delay = self._delay(host, bucket)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return host, await limiter.acquire_async(), time.monotonic()
+
+    def release(self, token: tuple, status_code: int = None, retry_after: str = None, cancelled: bool = False):
+        """Reports the outcome of a request.
+
+        Parameters
+        ----------
+        token: tuple
+            Token returned by ``acquire``
+
+        status_code: int (optional)
+            HTTP status of the response. Default value is None, meaning the request failed without response.
+
+        retry_after: str (optional)
+            Retry-After header of the response. If it is a number of seconds, the host is paused for that time.
+
+        cancelled: bool (optional)
+            True if the request was cancelled before its outcome was known (e.g. by a timeout of the caller or a
+            faster hedged request), which only frees the slot (default False)
+        """
+        host, epoch, start = token
+        _, limiter = self._host(host)
+        success = None if cancelled else status_code is not None and status_code not in OVERLOAD_STATUSES
+        limiter.release(epoch, success, time.monotonic() - start)
+
+        if retry_after:
+            try:
+                paused_until = time.monotonic() + float(retry_after)
+            except ValueError:
+                return
+            with self._lock:
+                self._paused_until[host] = max(self._paused_until.get(host, 0), paused_until)
+
+    def stats(self) -> Dict[str, dict]:
+        """Returns the current concurrency limit and requests in flight of every host"""
+        return {host: {"concurrency_limit": int(limiter.limit), "in_flight": limiter.in_flight}
+                for host, (_, limiter) in self._hosts.items()}
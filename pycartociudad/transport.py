@@ -0,0 +1,268 @@
+"""
+Transports performing the HTTP requests of the clients
+
+A ``Client`` delegates every request to its transport, while retries, throttling and hedging stay in the client.
+Any object with ``send`` and ``close`` methods can be used, e.g. to route the requests through an HTTP/2 library, a
+pool of proxies or an in-memory fake. Besides ``RequestsTransport``, the default one, ``RecordingTransport`` saves
+every answer to a cassette file and ``ReplayTransport`` answers from it without network.
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+import urllib.parse
+from typing import Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.poolmanager import ProxyManager
+
+from pycartociudad.exceptions import ReplayMissError
+
+# headers describing the raw transfer, which don't apply to the already decoded recorded body
+_TRANSFER_HEADERS = frozenset(["content-encoding", "content-length", "transfer-encoding", "connection"])
+
+# seconds spent opening connections by the request in progress of each thread
+_connecting = threading.local()
+
+
+class Transport:
+    """Interface of the synchronous transports."""
+
+    def send(self, url: str, params=None, timeout=None) -> requests.Response:
+        """Performs a single GET request.
+
+        Parameters
+        ----------
+        url: str
+            Request URL
+
+        params: dict or str (optional)
+            Query string parameters
+
+        timeout: float or tuple (optional)
+            Timeout of the request, either a single value or a (connect, read) tuple
+
+        Returns
+        -------
+        response: a ``requests.Response``, or any object with its ``status_code``, ``content``, ``headers``
+        and ``raise_for_status``. Connection errors and timeouts are raised as ``requests.RequestException``.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the resources of the transport"""
+
+    def use_default(self, transport: "Transport"):
+        """Receives the default transport of the client the transport is given to, i.e. a ``RequestsTransport`` on
+        its pooled session. The transports wrapping another one perform their requests through it if none was
+        given."""
+
+
+class RequestsTransport(Transport):
+    """Transport sending the requests through a ``requests.Session``, which keeps a connection pool per host.
+
+    Parameters
+    ----------
+    session: requests.Session (optional)
+        Session to send the requests with. Default value is None, a new session.
+    """
+
+    def __init__(self, session: requests.Session = None):
+        self.session = session or requests.Session()
+
+    def send(self, url: str, params=None, timeout=None) -> requests.Response:
+        return self.session.get(url, params=params, timeout=timeout)
+
+    def close(self):
+        self.session.close()
+
+
+class _TimedConnection:
+    """Mixin of the urllib3 connections adding the time they take to connect to the request in progress"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _connecting.time = getattr(_connecting, "time", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+_TIMED_POOLS = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+
+class TimingAdapter(HTTPAdapter):
+    """``HTTPAdapter`` measuring the time to open the connection of every request.
+
+    The seconds are set as ``connect_time`` of the responses, 0 if the connection was reused from the pool, so the
+    request events of the sync clients report them as the async ones. ``Client`` mounts it on its session.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _TIMED_POOLS
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        # the SOCKS managers have their own pools, so their requests report the connection as reused
+        if isinstance(manager, ProxyManager):
+            manager.pool_classes_by_scheme = _TIMED_POOLS
+        return manager
+
+    def send(self, request, **kwargs) -> requests.Response:
+        _connecting.time = 0.0
+        response = super().send(request, **kwargs)
+        response.connect_time = _connecting.time
+        return response
+
+
+def request_key(url: str, params=None) -> str:
+    """Returns the URL of a request with all its query parameters sorted, used as key of the recorded answers"""
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    if isinstance(params, str):
+        query.extend(urllib.parse.parse_qsl(params, keep_blank_values=True))
+    elif params:
+        query.extend((str(key), str(value)) for key, value in params.items())
+    return urllib.parse.urlunsplit(parts[:3] + (urllib.parse.urlencode(sorted(query)), ""))
+
+
+class Cassette:
+    """Recorded answers of the web services, stored as a file with a JSON document per line.
+
+    Parameters
+    ----------
+    path: str
+        Path of the cassette file. It is created on the first recorded answer if it doesn't exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._answers = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        answer = json.loads(line)
+                        self._answers[answer["url"]] = answer
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._answers
+
+    def play(self, url: str, params=None):
+        """Returns the recorded (status, headers, content) of a request. Raises ``ReplayMissError`` if there is none."""
+        key = request_key(url, params)
+        answer = self._answers.get(key)
+        if answer is None:
+            raise ReplayMissError(f"Request not recorded in {self.path}: {key}")
+        if "body_base64" in answer:
+            content = base64.b64decode(answer["body_base64"])
+        else:
+            content = answer["body"].encode("utf-8")
+        return answer["status"], answer["headers"], content
+
+    def record(self, url: str, params, status: int, headers, content: bytes):
+        """Records the answer of a request, replacing the previous answer of the same request"""
+        answer = {"url": request_key(url, params), "status": status,
+                  "headers": {key: value for key, value in headers.items() if key.lower() not in _TRANSFER_HEADERS}}
+        try:
+            answer["body"] = content.decode("utf-8")
+        except UnicodeDecodeError:
+            answer["body_base64"] = base64.b64encode(content).decode("ascii")
+
+        line = json.dumps(answer, ensure_ascii=False)
+        with self._lock:
+            self._answers[answer["url"]] = answer
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def _cassette(cassette: Union[str, Cassette]) -> Cassette:
+    return cassette if isinstance(cassette, Cassette) else Cassette(cassette)
+
+
+class ReplayTransport(Transport):
+    """Transport answering every request from a cassette, without network.
+
+    Parameters
+    ----------
+    cassette: str or Cassette
+        Cassette, or path of the cassette file, with the recorded answers
+
+    Raises
+    ------
+    ReplayMissError: when sending a request that isn't recorded in the cassette
+    """
+
+    def __init__(self, cassette: Union[str, Cassette]):
+        self.cassette = _cassette(cassette)
+
+    def send(self, url: str, params=None, timeout=None) -> requests.Response:
+        status, headers, content = self.cassette.play(url, params)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = content
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request_key(url, params)
+        return response
+
+
+class RecordingTransport(Transport):
+    """Transport recording to a cassette every answer of another transport, to be replayed later.
+
+    Parameters
+    ----------
+    cassette: str or Cassette
+        Cassette, or path of the cassette file, to record the answers to
+
+    transport: Transport (optional)
+        Transport performing the requests. Default value is None, the default transport of the client it is given to,
+        so the recorded requests are sent with the session, headers and adapters of the client (or a new
+        ``RequestsTransport`` if it is used on its own).
+    """
+
+    def __init__(self, cassette: Union[str, Cassette], transport: Transport = None):
+        self.cassette = _cassette(cassette)
+        self.transport = transport
+
+    def use_default(self, transport: Transport):
+        if self.transport is None:
+            self.transport = transport
+
+    def send(self, url: str, params=None, timeout=None) -> requests.Response:
+        if self.transport is None:
+            self.transport = RequestsTransport()
+        response = self.transport.send(url, params, timeout)
+        self.cassette.record(url, params, response.status_code, response.headers, response.content)
+        return response
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
@@ -14,7 +14,7 @@ requirements = [ ]
 
 setup_requirements = [ ]
 
-test_requirements = [ ]
+test_requirements = ['aiohttp', 'numpy', 'pandas']
 
 setup(
     author="PyLadies Madrid",
@@ -33,6 +33,17 @@ setup(
     ],
     description="PyCartociudad contains Python functions to access the CartoCiudad REST and WPS API (REST y WPS) from IGN with spanish cartography services.",
     install_requires=['requests'],
+    extras_require={
+        'aio': ['aiohttp'],
+        'fast': ['orjson'],
+        'numpy': ['numpy'],
+        'pandas': ['pandas'],
+    },
+    entry_points={
+        'console_scripts': [
+            'pycartociudad=pycartociudad.cli:main',
+        ],
+    },
     license='GPLv3+',
     long_description=readme + '\n\n' + history,
     include_package_data=True,
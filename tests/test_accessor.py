@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""Tests for `accessor` module."""
+
+
+import json
+import unittest
+import urllib
+
+from tests.utils import FakeClient
+
+try:
+    import pandas as pd
+    import pycartociudad.accessor  # noqa: F401, registers the accessor
+except ImportError:
+    pd = None
+
+
+def geocoder_body(url, params):
+    """Answers a geocoding request with the number of the address as portal, failing the address "error" """
+    address = urllib.parse.unquote(url.split("q=")[1])
+    if address == "error":
+        return "<html>Service unavailable</html>"
+    portal = address.split()[-1]
+    number = int(portal.rstrip("B"))
+    result = {"province": "Madrid", "muni": "Madrid", "portalNumber": number if portal.isdigit() else portal,
+              "lat": 40 + number / 100, "lng": -3.7, "address": address}
+    return f"callback({json.dumps(result)})"
+
+
+def reverse_body(url, params):
+    """Answers a reverse geocoding request with the requested latitude"""
+    query = urllib.parse.parse_qs(params)
+    return json.dumps({"province": "Madrid", "lat": float(query["lat"][0]), "lng": float(query["lon"][0])})
+
+
+@unittest.skipIf(pd is None, "pandas is not installed")
+class TestAccessor(unittest.TestCase):
+    """Tests for `accessor` module."""
+
+    def test_001_geocode(self):
+        """Test that every distinct normalized address is geocoded once and the columns are typed"""
+        df = pd.DataFrame({"address": ["calle 1", "calle 2", "C/ 1", None, "error", "calle 12B"]},
+                          index=list("abcdef"))
+        client = FakeClient(geocoder_body)
+        result = df.cartociudad.geocode("address", client=client)
+
+        self.assertEqual(len(client.calls), 4)
+        self.assertEqual(list(result.index), list("abcdef"))
+        self.assertEqual(result["lat"].dtype, "float64")
+        self.assertEqual(result["portalNumber"].tolist()[:3] + result["portalNumber"].tolist()[5:], [1, 2, 1, "12B"])
+        self.assertEqual(result["province"].dtype, "category")
+        self.assertEqual(result["lat"].tolist()[:3], [40.01, 40.02, 40.01])
+        self.assertTrue(result["lat"].iloc[3:5].isna().all())
+        self.assertEqual(result["address"].tolist()[:3], ["calle 1", "calle 2", "calle 1"])
+        self.assertIsNone(result["error"].iloc[0])
+        self.assertIsNotNone(result["error"].iloc[4])
+
+    def test_002_reverse_geocode(self):
+        """Test that every distinct point is reverse geocoded once"""
+        df = pd.DataFrame({"lat": [40.1, 40.2, 40.1, None], "lon": [-3.7, -3.7, -3.7, -3.7]})
+        client = FakeClient(reverse_body)
+        result = df.cartociudad.reverse_geocode(client=client, fields=["lat", "lng", "province"], prefix="cc_")
+
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(list(result.columns), ["cc_lat", "cc_lng", "cc_province", "cc_error"])
+        self.assertEqual(result["cc_lat"].tolist()[:3], [40.1, 40.2, 40.1])
+        self.assertTrue(pd.isna(result["cc_province"].iloc[3]))
+
+    def test_003_location_info(self):
+        """Test that the location info columns depend on the sources"""
+        df = pd.DataFrame({"lat": [40.1, 40.1], "lon": [-3.7, -3.7]})
+        client = FakeClient('<FeatureInfoResponse><FIELDS CUSEC="2807906001"/><FIELDS CUDIS="2807906"/>'
+                            '</FeatureInfoResponse>')
+        result = df.cartociudad.location_info(sources=["census"], client=client)
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(list(result.columns), ["census_section", "district_code", "error"])
+        self.assertEqual(result["census_section"].tolist(), ["2807906001", "2807906001"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""Tests for `aio` module."""
+
+
+import asyncio
+import unittest
+
+from pycartociudad import CartociudadError, aio
+from pycartociudad.aio import Response
+from tests.utils import FakeAsyncClient
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+CADASTRE_XML = ('<consulta_coordenadas xmlns="http://www.catastro.meh.es/"><coordenadas><coord><pc>'
+                '<pc1>0079609</pc1><pc2>VK4707G</pc2></pc></coord></coordenadas></consulta_coordenadas>')
+CENSUS_XML = '<FeatureInfoResponse><Fields CUSEC="2807906001"/><Fields CUDIS="2807906"/></FeatureInfoResponse>'
+
+
+def fake_services(url, params):
+    """Answers the requests to every service with a canned body"""
+    if "catastro" in url:
+        return CADASTRE_XML
+    if "ine.es" in url:
+        return CENSUS_XML
+    if "findJsonp" in url:
+        return 'callback({"address": "MAYOR"})'
+    if "route" in url:
+        return '{"found": "true", "distance": "810.5", "time": "600", ' \
+               '"instructionsData": {"instruction": [{"distance": "20 m"}]}}'
+    return '{"address": "REINA VICTORIA"}'
+
+
+class TestAio(unittest.TestCase):
+    """Tests for `aio` module."""
+
+    def test_001_geocode(self):
+        """Test the async geocoding"""
+        client = FakeAsyncClient(fake_services)
+        result = asyncio.run(aio.geocode("Plaza mayor 1, Madrid", client=client))
+        self.assertEqual(result, {"address": "MAYOR"})
+        self.assertEqual(asyncio.run(aio.geocode("", client=client)), {})
+        self.assertEqual(len(client.calls), 1)
+
+    def test_002_reverse_geocode_and_route(self):
+        """Test the async reverse geocoding and routing"""
+        client = FakeAsyncClient(fake_services)
+        result = asyncio.run(aio.reverse_geocode(40.4472, -3.7076, client=client))
+        self.assertEqual(result["address"], "REINA VICTORIA")
+
+        result = asyncio.run(aio.route_between_two_points(40.4167, -3.7038, 40.4114, -3.7083, client=client))
+        self.assertEqual(result["distance"], 810.5)
+        self.assertEqual(result["instructionsData"]["instruction"][0]["distance"], 20.0)
+
+    def test_003_get_location_info(self):
+        """Test that the async location info merges every source"""
+        client = FakeAsyncClient(fake_services, delay=0.01)
+        result = asyncio.run(aio.get_location_info(40.4472, -3.7076, client=client))
+        self.assertEqual(result["cadastral_ref"], "0079609VK4707G")
+        self.assertEqual(result["census_section"], "2807906001")
+        self.assertEqual(result["district_code"], "2807906")
+        self.assertEqual(result["address"], "REINA VICTORIA")
+        self.assertEqual(client.peak_in_flight, 3)
+
+    def test_004_location_info_timeout(self):
+        """Test that a slow source gives a partial result"""
+        client = FakeAsyncClient(fake_services, delay=0.2)
+        result = asyncio.run(aio.get_location_info(40.4472, -3.7076, sources=["census"], client=client, timeout=0.01))
+        self.assertEqual(result["census_section"], None)
+        self.assertIsInstance(result["errors"]["census"], TimeoutError)
+
+    def test_005_concurrency_limit(self):
+        """Test that the semaphore bounds the number of requests in flight"""
+        client = FakeAsyncClient(fake_services, delay=0.001, max_concurrency=5)
+
+        async def many():
+            return await asyncio.gather(*[aio.reverse_geocode(40.0, -3.0 - i / 1000, client=client)
+                                          for i in range(200)])
+
+        results = asyncio.run(many())
+        self.assertEqual(len(results), 200)
+        self.assertEqual(client.peak_in_flight, 5)
+
+    def test_006_http_errors(self):
+        """Test that HTTP errors are handled as in the sync functions"""
+        response = Response(500, b"", "http://www.cartociudad.es")
+        with self.assertRaises(CartociudadError):
+            aio._handle_reverse_geocode(response, "raise")
+
+    def test_007_retries(self):
+        """Test that overloaded answers are retried until the deadline"""
+        answers = [(503, "busy"), (429, "slow down"), '{"address": "MAYOR"}']
+        client = FakeAsyncClient(lambda url, params: answers.pop(0), backoff=0.001)
+        result = asyncio.run(aio.reverse_geocode(40.4472, -3.7076, client=client))
+        self.assertEqual(result["address"], "MAYOR")
+        self.assertEqual(len(client.calls), 3)
+
+        client = FakeAsyncClient(lambda url, params: (503, "busy"), retries=100, backoff=0.05, deadline=0.2)
+        with self.assertRaises(CartociudadError):
+            asyncio.run(aio.reverse_geocode(40.4472, -3.7076, client=client))
+        self.assertLess(len(client.calls), 100)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_008_retry_client_errors(self):
+        """Test that the aiohttp client errors that aren't OSError, as a closed kept-alive connection, are retried"""
+        errors = [aiohttp.ServerDisconnectedError()]
+
+        def disconnect_once(url, params):
+            if errors:
+                raise errors.pop()
+            return '{"address": "MAYOR"}'
+
+        client = FakeAsyncClient(disconnect_once, backoff=0.001)
+        result = asyncio.run(aio.reverse_geocode(40.4472, -3.7076, client=client))
+        self.assertEqual(result["address"], "MAYOR")
+        self.assertEqual(len(client.calls), 2)
+
+    def test_009_coalesce_spellings(self):
+        """Test that the spellings of the same address share their coalesced geocoding request"""
+        client = FakeAsyncClient(fake_services, delay=0.01, coalesce=True)
+
+        async def spellings():
+            return await asyncio.gather(aio.geocode("C/ Mayor 1, Madrid", client=client),
+                                        aio.geocode("calle mayor, nº 1 madrid", client=client))
+
+        self.assertEqual(asyncio.run(spellings()), [{"address": "MAYOR"}] * 2)
+        self.assertEqual(len(client.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""Tests for the offline benchmark suite and its mock server."""
+
+
+import unittest
+
+from benchmarks import run
+from benchmarks.mock_server import MockClient, MockServer
+from pycartociudad import CartociudadError, geocode, get_location_info, reverse_geocode, route_between_two_points
+
+
+class TestBenchmarks(unittest.TestCase):
+    """Tests for the offline benchmark suite and its mock server."""
+
+    def test_001_mock_server(self):
+        """Test that the recorded responses of every endpoint are served to the real functions"""
+        with MockServer() as server:
+            client = MockClient(server.url)
+            self.assertEqual(geocode("calle miguel servet 5, zaragoza", client=client)["portalNumber"], 5)
+            self.assertEqual(reverse_geocode(40.4473, -3.7044, client=client)["address"], "BRAVO MURILLO")
+            route = route_between_two_points(40.4473, -3.7044, 40.44, -3.70, vehicle=True, client=client)
+            self.assertEqual(route["distance"], 9321.4)
+            info = get_location_info(40.4473, -3.7044, client=client)
+            self.assertEqual((info["cadastral_ref"], info["census_section"]), ("0079609VK4707G", "2807906001"))
+            self.assertEqual(server.requests, {"geocode": 1, "reverse_geocode": 2, "route": 1, "cadastre": 1,
+                                               "census": 1})
+            client.close()
+
+    def test_002_error_injection(self):
+        """Test that the injected errors reach the functions once the retries are exhausted"""
+        with MockServer(error_rate=1) as server:
+            client = MockClient(server.url, retries=1, backoff=0)
+            with self.assertRaises(CartociudadError):
+                reverse_geocode(40.4473, -3.7044, client=client)
+            self.assertEqual(server.requests["reverse_geocode"], 2)
+            client.close()
+
+    def test_003_run(self):
+        """Test a short run of the benchmarks and the comparison with a baseline"""
+        with MockServer() as server:
+            for name, mode, scenario in run.scenarios():
+                metrics = run.measure(server, scenario, 4, 2)
+                self.assertEqual(metrics["errors"], 0, f"{name}[{mode}]")
+                self.assertGreater(metrics["throughput"], 0)
+                self.assertGreater(metrics["requests"], 0)
+
+        results = {"geocode[single]": {"throughput": 100, "p99_ms": 10, "peak_kib": 100}}
+        self.assertEqual(run.compare(results, results, 0.25), [])
+        slower = {"geocode[single]": {"throughput": 50, "p99_ms": 12, "peak_kib": 100}}
+        self.assertEqual(len(run.compare(slower, results, 0.25)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
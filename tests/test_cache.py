@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""Tests for `cache` module."""
+
+
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+
+from pycartociudad import geocode, get_location_info, reverse_geocode, route_between_two_points
+from pycartociudad.cache import QuantizedLRUCache, SQLiteCache, TieredCache, normalize_query
+from tests.utils import FakeClient
+
+ROUTE_BODY = '{"found": "true", "distance": "10", "time": "20", "instructionsData": {"instruction": []}}'
+
+
+def write_entries(path, start):
+    """Writes some entries to a shared cache from another process"""
+    cache = SQLiteCache(path)
+    for i in range(start, start + 50):
+        cache.set("geocode", f"calle {i}", {"id": i})
+
+
+class TestSQLiteCache(unittest.TestCase):
+    """Tests for `cache` module."""
+
+    def setUp(self):
+        """Create a temporary database"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite")
+
+    def tearDown(self):
+        """Remove the temporary database"""
+        self.tmpdir.cleanup()
+
+    def test_001_normalize_query(self):
+        """Test that equivalent queries share the same key"""
+        self.assertEqual(normalize_query(" Calle  Alcalá "), normalize_query("calle alcalá"))
+        self.assertEqual(normalize_query({"lon": -3.7, "lat": 40.4}), "lat=40.4&lon=-3.7")
+
+    def test_002_hits_and_misses(self):
+        """Test that the geocoding results are cached"""
+        cache = SQLiteCache(self.path)
+        client = FakeClient('callback({"address": "MAYOR"})', cache=cache)
+        self.assertEqual(geocode("Plaza Mayor 1, Madrid", client=client), {"address": "MAYOR"})
+        self.assertEqual(geocode("plaza mayor 1,  madrid", client=client), {"address": "MAYOR"})
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_003_reverse_geocode_and_route(self):
+        """Test that cadastral and non cadastral reverse geocoding and routes are cached separately"""
+        cache = SQLiteCache(self.path)
+        client = FakeClient('{"address": "REINA VICTORIA"}', cache=cache)
+        for _ in range(2):
+            reverse_geocode(40.4472, -3.7076, client=client)
+            reverse_geocode(40.4472, -3.7076, cadastral=True, client=client)
+        self.assertEqual(len(client.calls), 2)
+
+        client = FakeClient(ROUTE_BODY, cache=cache)
+        for _ in range(2):
+            route_between_two_points(40.4167, -3.7038, 40.4114, -3.7083, client=client)
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(cache.stats()["size"], 3)
+
+    def test_004_ttl(self):
+        """Test that entries expire after the time to live"""
+        cache = SQLiteCache(self.path, ttl=0.05)
+        cache.set("geocode", "calle a", {"id": 1})
+        self.assertEqual(cache.get("geocode", "calle a"), {"id": 1})
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("geocode", "calle a"))
+
+    def test_005_lru_eviction(self):
+        """Test that the least recently used entries are evicted"""
+        cache = SQLiteCache(self.path, max_entries=3)
+        for i in range(3):
+            cache.set("geocode", f"calle {i}", {"id": i})
+        cache.get("geocode", "calle 0")
+        cache.set("geocode", "calle 3", {"id": 3})
+        self.assertIsNone(cache.get("geocode", "calle 1"))
+        self.assertEqual(cache.get("geocode", "calle 0"), {"id": 0})
+        self.assertEqual(cache.stats()["size"], 3)
+
+    def test_006_shared_between_processes(self):
+        """Test that several processes can write to the same cache"""
+        SQLiteCache(self.path)
+        processes = [multiprocessing.Process(target=write_entries, args=(self.path, i * 50)) for i in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(SQLiteCache(self.path).stats()["size"], 150)
+
+
+class TestQuantizedLRUCache(unittest.TestCase):
+    """Tests for `QuantizedLRUCache` class."""
+
+    def test_001_nearby_points_share_entry(self):
+        """Test that points in the same grid cell are resolved once"""
+        cache = QuantizedLRUCache(grid_size=5)
+        client = FakeClient('{"address": "REINA VICTORIA"}', cache=cache)
+        reverse_geocode(40.44724762, -3.70764984, client=client)
+        reverse_geocode(40.44724769, -3.70764991, client=client)
+        reverse_geocode(40.44724762, -3.70764984, cadastral=True, client=client)
+        self.assertEqual(len(client.calls), 2)
+        reverse_geocode(40.44824762, -3.70764984, client=client)
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 3, "size": 3})
+
+    def test_002_location_info(self):
+        """Test that location info is cached and other endpoints are not"""
+        cache = QuantizedLRUCache(grid_size=5)
+        client = FakeClient('{"address": "REINA VICTORIA"}', cache=cache)
+        for i in range(5):
+            get_location_info(40.4472476, -3.7076498 + i * 1e-7, sources=["geocoding"], client=client)
+        self.assertEqual(len(client.calls), 1)
+
+        client = FakeClient('callback({"address": "MAYOR"})', cache=cache)
+        geocode("Plaza mayor", client=client)
+        geocode("Plaza mayor", client=client)
+        self.assertEqual(len(client.calls), 2)
+
+    def test_003_bounded_capacity(self):
+        """Test that the least recently used entries are discarded"""
+        cache = QuantizedLRUCache(grid_size=5, max_entries=2)
+        cache.set("reverse_geocode", {"lat": 40.0, "lon": -3.0}, {"id": 1})
+        cache.set("reverse_geocode", {"lat": 41.0, "lon": -3.0}, {"id": 2})
+        cache.get("reverse_geocode", {"lat": 40.0, "lon": -3.0})
+        cache.set("reverse_geocode", {"lat": 42.0, "lon": -3.0}, {"id": 3})
+        self.assertIsNone(cache.get("reverse_geocode", {"lat": 41.0, "lon": -3.0}))
+        self.assertEqual(cache.get("reverse_geocode", {"lat": 40.0, "lon": -3.0}), {"id": 1})
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_004_tiered_cache(self):
+        """Test that a hit in the persistent cache fills the in-memory one"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            memory = QuantizedLRUCache()
+            disk = SQLiteCache(os.path.join(tmpdir, "cache.sqlite"))
+            disk.set("reverse_geocode", {"lat": 40.0, "lon": -3.0, "cadastral": False}, {"id": 1})
+            cache = TieredCache(memory, disk)
+            client = FakeClient('{"id": 2}', cache=cache)
+            self.assertEqual(reverse_geocode(40.0, -3.0, client=client), {"id": 1})
+            self.assertEqual(memory.stats()["size"], 1)
+            self.assertEqual(len(client.calls), 0)
+
+            reverse_geocode(40.0, -3.0, client=client)["id"] = 3
+            self.assertEqual(reverse_geocode(40.0, -3.0, client=client), {"id": 1})
+
+    def test_005_results_are_copies(self):
+        """Test that modifying a result doesn't change the cached entry of the later hits"""
+        client = FakeClient('{"address": "REINA VICTORIA"}', cache=QuantizedLRUCache())
+        result = reverse_geocode(40.0, -3.0, client=client)
+        result["address"] = "MAYOR"
+        hit = reverse_geocode(40.0, -3.0, client=client)
+        hit["district"] = "CENTRO"
+        self.assertEqual(reverse_geocode(40.0, -3.0, client=client), {"address": "REINA VICTORIA"})
+        self.assertEqual(len(client.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""Tests for `census_index` module."""
+
+
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from pycartociudad.census_index import CensusIndex
+from pycartociudad.get_location_info import get_census_info
+from tests.utils import FakeClient
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def square(x, y, size):
+    return [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+
+
+def grid_features(n=20):
+    """Builds a n x n grid of square sections of 0.01 degrees next to Madrid. The first one has a hole,
+    which is a section itself, and the last one is a multipolygon."""
+    features = []
+    for i in range(n):
+        for j in range(n):
+            code = f"28079{i:02d}{j:03d}"
+            rings = [square(-3.8 + i * 0.01, 40.3 + j * 0.01, 0.01)]
+            if i == j == 0:
+                rings.append(square(-3.798, 40.302, 0.004))
+            geometry = {"type": "Polygon", "coordinates": rings}
+            if i == j == n - 1:
+                geometry = {"type": "MultiPolygon", "coordinates": [rings, [square(-4.0, 40.0, 0.01)]]}
+            features.append({"type": "Feature", "properties": {"CUSEC": code}, "geometry": geometry})
+    features.append({"type": "Feature", "properties": {"CUSEC": "2807999999", "CUDIS": "2807999"},
+                     "geometry": {"type": "Polygon", "coordinates": [square(-3.798, 40.302, 0.004)]}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+class TestCensusIndex(unittest.TestCase):
+    """Tests for `census_index` module."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Write the synthetic sections to a GeoJSON file and index them"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "sections.geojson")
+            with open(path, "w") as file:
+                json.dump(grid_features(), file)
+            cls.index = CensusIndex.from_file(path)
+
+    def test_001_lookup(self):
+        """Test the lookup of single points"""
+        self.assertEqual(len(self.index), 401)
+        self.assertEqual(self.index.lookup(40.355, -3.745),
+                         {"census_section": "2807905005", "district_code": "2807905"})
+        self.assertEqual(self.index.lookup(40.0, -3.0), {})
+
+    def test_002_holes_and_multipolygons(self):
+        """Test that holes are excluded and every part of a multipolygon is included"""
+        self.assertEqual(self.index.lookup(40.304, -3.796)["census_section"], "2807999999")
+        self.assertEqual(self.index.lookup(40.304, -3.796)["district_code"], "2807999")
+        self.assertEqual(self.index.lookup(40.309, -3.791)["census_section"], "2807900000")
+        self.assertEqual(self.index.lookup(40.005, -3.995)["census_section"], "2807919019")
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_003_lookup_many(self):
+        """Test that the vectorized lookup matches the single point one"""
+        rng = random.Random(1)
+        points = [(rng.uniform(40.28, 40.52), rng.uniform(-3.82, -3.58)) for _ in range(2000)]
+        points.append((40.005, -3.995))
+        result = self.index.lookup_many([lat for lat, _ in points], [lng for _, lng in points])
+        for (lat, lng), section, district in zip(points, result["census_section"], result["district_code"]):
+            expected = self.index.lookup(lat, lng)
+            self.assertEqual(section, expected.get("census_section"))
+            self.assertEqual(district, expected.get("district_code"))
+
+    def test_004_service_fallback(self):
+        """Test that the census service is only queried for points outside the index"""
+        client = FakeClient('<FeatureInfoResponse><Fields CUSEC="0100101001" CUDIS="0100101"/>'
+                            '</FeatureInfoResponse>', census_index=self.index)
+        self.assertEqual(get_census_info(40.355, -3.745, client=client)["census_section"], "2807905005")
+        self.assertEqual(len(client.calls), 0)
+        self.assertEqual(get_census_info(42.85, -2.67, client=client)["census_section"], "0100101001")
+        self.assertEqual(len(client.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""Tests for `cli` module."""
+
+
+import csv
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pycartociudad import cli
+
+
+class TestCli(unittest.TestCase):
+    """Tests for `cli` module."""
+
+    def setUp(self):
+        """Create a temporary directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmpdir.name, "input.csv")
+        self.output_path = os.path.join(self.tmpdir.name, "output.csv")
+        with open(self.input_path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["id", "address"])
+            for i in range(25):
+                writer.writerow([i, f"calle {i % 20}, madrid"])
+
+    def tearDown(self):
+        """Remove the temporary directory"""
+        self.tmpdir.cleanup()
+
+    def read_output(self):
+        with open(self.output_path, newline="") as file:
+            return list(csv.DictReader(file))
+
+    def test_001_geocode_csv(self):
+        """Test that every row is enriched with the geocoding result"""
+        def lookup(address):
+            return {"address": address.upper(), "lat": 40.0}
+
+        rows = cli.process_file(self.input_path, self.output_path, lookup, lambda row: row["address"],
+                                ["address", "lat"], max_workers=4)
+        self.assertEqual(rows, 25)
+        output = self.read_output()
+        self.assertEqual([row["id"] for row in output], [str(i) for i in range(25)])
+        self.assertEqual(output[3]["cc_address"], "CALLE 3, MADRID")
+        self.assertEqual(output[3]["cc_lat"], "40.0")
+        self.assertFalse(os.path.exists(self.output_path + ".checkpoint"))
+
+    def test_002_resume_from_checkpoint(self):
+        """Test that a killed job restarts from the last committed row"""
+        def crashing_lookup(address):
+            if address.startswith("calle 17,"):
+                raise KeyboardInterrupt()
+            return {"address": address}
+
+        with self.assertRaises(KeyboardInterrupt):
+            cli.process_file(self.input_path, self.output_path, crashing_lookup, lambda row: row["address"],
+                             ["address"], max_workers=1, checkpoint_every=5)
+        with open(self.output_path + ".checkpoint") as file:
+            self.assertEqual(json.load(file)["rows"], 15)
+
+        queried = []
+
+        def lookup(address):
+            queried.append(int(address.split()[1][:-1]))
+            return {"address": address}
+
+        rows = cli.process_file(self.input_path, self.output_path, lookup, lambda row: row["address"],
+                                ["address"], max_workers=2, checkpoint_every=5)
+        self.assertEqual(rows, 10)
+        # rows 15 to 24 hold the addresses 15 to 19 and 0 to 4
+        self.assertEqual(sorted(queried), [0, 1, 2, 3, 4, 15, 16, 17, 18, 19])
+        output = self.read_output()
+        self.assertEqual([row["id"] for row in output], [str(i) for i in range(25)])
+        self.assertEqual(output[24]["cc_address"], "calle 4, madrid")
+
+    def test_003_ndjson_errors(self):
+        """Test the NDJSON format and the per-row errors"""
+        input_path = os.path.join(self.tmpdir.name, "points.ndjson")
+        output_path = os.path.join(self.tmpdir.name, "points.out.ndjson")
+        with open(input_path, "w") as file:
+            for i in range(3):
+                file.write(json.dumps({"lat": 40 + i, "lon": -3}) + "\n")
+
+        def lookup(point):
+            if point[0] == 41:
+                raise RuntimeError("upstream down")
+            return {"muni": "Madrid"}
+
+        cli.process_file(input_path, output_path, lookup, lambda row: (row["lat"], row["lon"]), ["muni"])
+        with open(output_path) as file:
+            output = [json.loads(line) for line in file]
+        self.assertEqual(output[0]["cc_muni"], "Madrid")
+        self.assertIn("upstream down", output[1]["cc_error"])
+        self.assertEqual(output[2]["lat"], 42)
+
+    def test_004_main(self):
+        """Test the geocode command"""
+        with mock.patch.object(cli, "geocode", return_value={"muni": "Madrid"}) as geocode:
+            with mock.patch("sys.stderr"):
+                cli.main(["geocode", self.input_path, self.output_path, "--column", "address", "--workers", "2"])
+        self.assertEqual(geocode.call_count, 25)
+        self.assertEqual(self.read_output()[0]["cc_muni"], "Madrid")
+
+    def test_005_invalid_checkpoint_every(self):
+        """Test that the checkpoints must be at least every row"""
+        for every in (0, -1):
+            with self.assertRaises(ValueError):
+                cli.process_file(self.input_path, self.output_path, lambda address: {}, lambda row: row["address"],
+                                 ["muni"], checkpoint_every=every)
+            with mock.patch("sys.stderr"), self.assertRaises(SystemExit):
+                cli.main(["geocode", self.input_path, self.output_path, "--column", "address",
+                          "--checkpoint-every", str(every)])
+        self.assertFalse(os.path.exists(self.output_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""Tests for `client` module."""
+
+
+import threading
+import time
+import unittest
+
+import requests
+
+from pycartociudad import (
+    Client, DeadlineExceeded, RouteNotFoundError, ServiceError, deadline, geocode, geocode_many, get_location_info,
+    reverse_geocode, route_between_two_points
+)
+from pycartociudad.client import get_default_client, set_default_client
+from tests.utils import FakeClient, FakeSession
+
+
+class TestClient(unittest.TestCase):
+    """Tests for `client` module."""
+
+    def tearDown(self):
+        """Restore the default client"""
+        set_default_client(None)
+
+    def test_001_pool_settings(self):
+        """Test that the connection pool is configured per upstream host"""
+        client = Client(pool_connections=3, pool_maxsize=7, timeout=2)
+        adapter = client.session.get_adapter("https://ovc.catastro.meh.es")
+        self.assertEqual(adapter._pool_connections, 3)
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(client.timeout, 2)
+        client.close()
+
+    def test_002_compression(self):
+        """Test that compression can be disabled"""
+        self.assertEqual(Client().session.headers["Accept-Encoding"], "gzip, deflate")
+        self.assertEqual(Client(compression=False).session.headers["Accept-Encoding"], "identity")
+
+    def test_003_default_client_is_shared(self):
+        """Test that the default client is created once and can be replaced"""
+        self.assertIs(get_default_client(), get_default_client())
+        client = Client()
+        set_default_client(client)
+        self.assertIs(get_default_client(), client)
+
+    def test_004_functions_use_explicit_client(self):
+        """Test that the public functions perform their requests through the given client"""
+        client = FakeClient('{"address": "MAYOR"}')
+        self.assertEqual(reverse_geocode(40.4, -3.7, client=client)["address"], "MAYOR")
+
+        client = FakeClient('callback({"address": "MAYOR"})')
+        self.assertEqual(geocode("Plaza mayor 1, Madrid", client=client)["address"], "MAYOR")
+        self.assertEqual(len(client.calls), 1)
+
+        client = FakeClient('{"found": "true", "distance": "10", "time": "20", '
+                            '"instructionsData": {"instruction": [{"distance": "10 m"}]}}')
+        self.assertEqual(route_between_two_points(40.4, -3.7, 40.41, -3.71, client=client)["distance"], 10.0)
+
+    def test_005_location_info_uses_default_client(self):
+        """Test that the public functions use the default client when none is given"""
+        client = FakeClient('<root xmlns="http://www.catastro.meh.es/"/>')
+        set_default_client(client)
+        self.assertEqual(get_location_info(40.4, -3.7, sources=["cadastre"]), {"cadastral_ref": None})
+        self.assertEqual(len(client.calls), 1)
+
+    def test_006_retries(self):
+        """Test that connection errors and overloaded answers are retried"""
+        answers = [requests.exceptions.ConnectionError("reset"), (503, "busy"), '{"address": "MAYOR"}']
+
+        def body(url, params):
+            answer = answers.pop(0)
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        session = FakeSession(body)
+        client = Client(session=session, retries=2, backoff=0.001)
+        self.assertEqual(reverse_geocode(40.4, -3.7, client=client)["address"], "MAYOR")
+        self.assertEqual(len(session.calls), 3)
+
+    def test_007_http_errors(self):
+        """Test that HTTP errors are raised as ServiceError once the retries are exhausted"""
+        session = FakeSession(lambda url, params: (500, "error"))
+        client = Client(session=session, retries=1, backoff=0.001)
+        with self.assertRaises(ServiceError):
+            reverse_geocode(40.4, -3.7, client=client)
+        self.assertEqual(len(session.calls), 2)
+        self.assertEqual(reverse_geocode(40.4, -3.7, error='ignore', client=client), {})
+
+        client = FakeClient('{"found": "false"}')
+        with self.assertRaises(RouteNotFoundError):
+            route_between_two_points(40.4, -3.7, 0, 0, client=client)
+
+    def test_008_deadline(self):
+        """Test that the retries stop at the deadline"""
+        def body(url, params):
+            raise requests.exceptions.ConnectionError("refused")
+
+        client = Client(session=FakeSession(body), retries=100, backoff=0.05, deadline=0.2)
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            reverse_geocode(40.4, -3.7, client=client)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+        client = Client(session=FakeSession(body), retries=100, backoff=0.05)
+        with self.assertRaises(DeadlineExceeded), deadline(0.2):
+            reverse_geocode(40.4, -3.7, client=client)
+
+    def test_009_hedging(self):
+        """Test that a request slower than the usual latency is hedged and the fastest answer is used"""
+        calls = []
+        lock = threading.Lock()
+
+        def body(url, params):
+            with lock:
+                calls.append(url)
+                slow = len(calls) == 31
+            time.sleep(1 if slow else 0.001)
+            return '{"address": "MAYOR"}'
+
+        client = Client(session=FakeSession(body), hedge=True)
+        for _ in range(30):
+            reverse_geocode(40.4, -3.7, client=client)
+        start = time.monotonic()
+        self.assertEqual(reverse_geocode(40.4, -3.7, client=client)["address"], "MAYOR")
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(len(calls), 32)
+        client.close()
+
+    def test_010_time_budget(self):
+        """Test that the batches stop at their time budget"""
+        def body(url, params):
+            time.sleep(0.05)
+            return 'callback({"address": "MAYOR"})'
+
+        client = FakeClient(body)
+        results = list(geocode_many([f"calle {i}" for i in range(100)], max_workers=2, client=client, time_budget=0.2))
+        self.assertEqual(len(results), 100)
+        expired = [result for _, result in results if isinstance(result, DeadlineExceeded)]
+        self.assertGreater(len(expired), 50)
+        self.assertEqual(results[0][1]["address"], "MAYOR")
+
+
+if __name__ == '__main__':
+    unittest.main()
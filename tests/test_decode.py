@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Tests for `_decode` module."""
+
+
+import json
+import unittest
+
+from pycartociudad import _decode
+from pycartociudad.geocode import _parse_response
+from pycartociudad.get_location_info import _parse_census_info
+from tests.utils import FakeResponse
+
+BODY = '{"address": "PLAZA DE ESPAÑA", "stateMsg": "Resultado exacto de la búsqueda", "lat": 40.42}'
+
+
+class TestDecode(unittest.TestCase):
+    """Tests for `_decode` module."""
+
+    def setUp(self):
+        """Keep the JSON backend"""
+        self.orjson = _decode.orjson
+
+    def tearDown(self):
+        """Restore the JSON backend"""
+        _decode.orjson = self.orjson
+
+    def test_001_jsonp(self):
+        """Test that the JSONP wrapper is stripped, with or without trailing bytes"""
+        expected = json.loads(BODY)
+        for body in [f"callback({BODY})", f"callback({BODY});\n", BODY]:
+            self.assertEqual(_decode.loads_jsonp(body.encode("utf-8")), expected)
+        self.assertEqual(_parse_response(FakeResponse(f"callback({BODY})"))["address"], "PLAZA DE ESPAÑA")
+        self.assertEqual(_parse_response(FakeResponse("callback(null)")), {})
+
+    def test_002_stdlib_backend(self):
+        """Test that the standard library gives the same results as orjson"""
+        _decode.orjson = None
+        self.assertEqual(_decode.loads_jsonp(f"callback({BODY})".encode("utf-8")), json.loads(BODY))
+        self.assertEqual(_decode.loads(BODY.encode("utf-8")), json.loads(BODY))
+
+    def test_003_invalid_json(self):
+        """Test that invalid documents raise JSONDecodeError with every backend"""
+        for backend in [self.orjson, None]:
+            _decode.orjson = backend
+            with self.assertRaises(json.JSONDecodeError):
+                _decode.loads(b"<html>Service unavailable</html>")
+
+    def test_004_xml_from_bytes(self):
+        """Test that XML is parsed from the bytes in the encoding of its declaration"""
+        body = ('<?xml version="1.0" encoding="ISO-8859-1"?>'
+                '<FeatureInfoResponse><FIELDS CUSEC="2807906001" NMUN="Alcalá"/>'
+                '<FIELDS CUDIS="2807906"/></FeatureInfoResponse>')
+        response = FakeResponse("")
+        response.content = body.encode("iso-8859-1")
+        self.assertEqual(_decode.parse_xml(response.content).find("FIELDS").attrib["NMUN"], "Alcalá")
+        self.assertEqual(_parse_census_info(response), {"census_section": "2807906001", "district_code": "2807906"})
+
+
+if __name__ == '__main__':
+    unittest.main()
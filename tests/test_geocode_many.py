@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Tests for `geocode_many` function."""
+
+
+import threading
+import time
+import unittest
+import urllib
+
+from pycartociudad import geocode_many
+from tests.utils import FakeClient
+
+
+def echo_address(url, params):
+    """Answers a geocoder request with the queried address"""
+    address = urllib.parse.unquote(url.split("q=", 1)[1])
+    if address == "boom":
+        raise ConnectionError("upstream down")
+    if address.startswith("slow"):
+        time.sleep(0.05)
+    return f'callback({{"address": "{address}"}})'
+
+
+class TestGeocodeMany(unittest.TestCase):
+    """Tests for `geocode_many` function."""
+
+    def test_001_ordered_results(self):
+        """Test that results keep the input order"""
+        client = FakeClient(echo_address)
+        addresses = [f"calle {i}" for i in range(50)]
+        results = list(geocode_many(addresses, max_workers=4, client=client))
+        self.assertEqual([address for address, _ in results], addresses)
+        self.assertEqual([result["address"] for _, result in results], addresses)
+
+    def test_002_duplicates_fetched_once(self):
+        """Test that duplicated addresses are requested only once"""
+        client = FakeClient(echo_address)
+        addresses = ["calle a", "calle b", "calle a", "calle a", "calle b"]
+        results = list(geocode_many(iter(addresses), client=client))
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(client.calls), 2)
+
+    def test_003_per_item_errors(self):
+        """Test that a failing address doesn't abort the batch"""
+        client = FakeClient(echo_address)
+        results = dict(geocode_many(["calle a", "boom", "calle b"], client=client))
+        self.assertIsInstance(results["boom"], ConnectionError)
+        self.assertEqual(results["calle b"]["address"], "calle b")
+
+    def test_004_unordered_results(self):
+        """Test that unordered results are yielded as soon as they are ready"""
+        client = FakeClient(echo_address)
+        addresses = ["slow 1", "calle a", "calle b", "calle a"]
+        results = list(geocode_many(addresses, max_workers=4, ordered=False, client=client))
+        self.assertEqual(sorted(address for address, _ in results), sorted(addresses))
+        self.assertEqual(results[-1][0], "slow 1")
+
+    def test_005_bounded_concurrency(self):
+        """Test that no more than max_workers requests are in flight"""
+        lock = threading.Lock()
+        state = {"current": 0, "peak": 0}
+
+        def body(url, params):
+            with lock:
+                state["current"] += 1
+                state["peak"] = max(state["peak"], state["current"])
+            time.sleep(0.01)
+            with lock:
+                state["current"] -= 1
+            return 'callback({})'
+
+        client = FakeClient(body)
+        list(geocode_many((f"calle {i}" for i in range(40)), max_workers=3, client=client))
+        self.assertLessEqual(state["peak"], 3)
+        self.assertEqual(len(client.calls), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
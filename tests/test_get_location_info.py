@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Tests for `get_location_info` function."""
+
+
+import threading
+import time
+import unittest
+
+from pycartociudad import QuantizedLRUCache, get_location_info, get_location_info_many
+from tests.utils import FakeClient
+
+CADASTRE_XML = ('<consulta_coordenadas xmlns="http://www.catastro.meh.es/"><coordenadas><coord><pc>'
+                '<pc1>0079609</pc1><pc2>VK4707G</pc2></pc></coord></coordenadas></consulta_coordenadas>')
+CENSUS_XML = '<FeatureInfoResponse><Fields CUSEC="2807906001"/><Fields CUDIS="2807906"/></FeatureInfoResponse>'
+
+
+def slow_services(delays, failing=()):
+    """Builds a fake body answering every service after the given delay, failing the given hosts"""
+    def body(url, params):
+        for host, text in (("catastro", CADASTRE_XML), ("ine.es", CENSUS_XML), ("cartociudad", '{"address": "X"}')):
+            if host in url:
+                time.sleep(delays.get(host, 0))
+                if host in failing:
+                    raise ConnectionError(f"{host} down")
+                return text
+    return body
+
+
+class TestGetLocationInfo(unittest.TestCase):
+    """Tests for `get_location_info` function."""
+
+    def test_001_sources_are_concurrent(self):
+        """Test that the latency is the one of the slowest source, not the sum"""
+        client = FakeClient(slow_services({"catastro": 0.2, "ine.es": 0.2, "cartociudad": 0.2}))
+        start = time.monotonic()
+        result = get_location_info(40.4472, -3.7076, client=client)
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(result, {"cadastral_ref": "0079609VK4707G", "census_section": "2807906001",
+                                  "district_code": "2807906", "address": "X"})
+
+    def test_002_partial_results_on_timeout(self):
+        """Test that a slow source doesn't hold the others back"""
+        client = FakeClient(slow_services({"ine.es": 0.5}))
+        start = time.monotonic()
+        result = get_location_info(40.4472, -3.7076, client=client, timeout={"census": 0.1})
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(result["cadastral_ref"], "0079609VK4707G")
+        self.assertIsNone(result["census_section"])
+        self.assertIsInstance(result["errors"]["census"], TimeoutError)
+
+    def test_003_partial_results_on_error(self):
+        """Test that a failing source is reported in the errors field"""
+        client = FakeClient(slow_services({}, failing=("cartociudad",)))
+        result = get_location_info(40.4472, -3.7076, client=client)
+        self.assertEqual(result["district_code"], "2807906")
+        self.assertNotIn("address", result)
+        self.assertEqual(list(result["errors"]), ["geocoding"])
+
+    def test_004_invalid_sources(self):
+        """Test that invalid sources are rejected"""
+        with self.assertRaises(ValueError):
+            get_location_info(40.4472, -3.7076, sources=["weather"])
+
+    def test_005_many_points(self):
+        """Test that the batch variant keeps the order and pipelines the sources"""
+        lock = threading.Lock()
+        state = {"current": 0, "peak": 0}
+        fake_body = slow_services({"catastro": 0.01, "ine.es": 0.01, "cartociudad": 0.01})
+
+        def body(url, params):
+            with lock:
+                state["current"] += 1
+                state["peak"] = max(state["peak"], state["current"])
+            try:
+                return fake_body(url, params)
+            finally:
+                with lock:
+                    state["current"] -= 1
+
+        client = FakeClient(body)
+        points = [(40.0 + i / 100, -3.0) for i in range(20)] + [(40.0, -3.0)]
+        results = list(get_location_info_many(points, sources=["census", "cadastre"], max_workers=6, client=client))
+        self.assertEqual([point for point, _ in results], points)
+        self.assertEqual(results[0][1], {"cadastral_ref": "0079609VK4707G", "census_section": "2807906001",
+                                         "district_code": "2807906"})
+        self.assertEqual(len(client.calls), 40)
+        self.assertGreater(state["peak"], 2)
+
+    def test_006_many_points_cache(self):
+        """Test that the batch variant looks up and fills the location info cache of every point"""
+        client = FakeClient(slow_services({}), cache=QuantizedLRUCache())
+        get_location_info(40.0, -3.0, sources=["census", "cadastre"], client=client)
+        points = [(40.0, -3.0), (40.1, -3.0), (40.2, -3.0)]
+        results = list(get_location_info_many(points, sources=["census", "cadastre"], client=client))
+        self.assertEqual(len(client.calls), 6)
+        self.assertEqual([point for point, _ in results], points)
+        self.assertEqual(results[0][1], results[2][1])
+
+        again = list(get_location_info_many(points[::-1], sources=["cadastre", "census"], client=client, typed=True))
+        self.assertEqual(len(client.calls), 6)
+        self.assertEqual(again[0][1].cadastral_ref, "0079609VK4707G")
+
+        client = FakeClient(slow_services({}, failing=("ine.es",)), cache=QuantizedLRUCache())
+        list(get_location_info_many(points[:1], sources=["census"], client=client))
+        list(get_location_info_many(points[:1], sources=["census"], client=client))
+        self.assertEqual(len(client.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Tests for the lazy imports of the package."""
+
+
+import subprocess
+import sys
+import unittest
+
+from benchmarks import run
+
+# modules that importing the package must not load
+HEAVY_MODULES = ("requests", "urllib3", "xml.etree.ElementTree", "numpy", "pandas", "aiohttp", "asyncio", "sqlite3")
+
+
+def imported_modules(statement: str) -> set:
+    """Returns the modules loaded by a statement run in a fresh interpreter"""
+    script = f"import sys\n{statement}\nprint(' '.join(sys.modules))"
+    output = subprocess.run([sys.executable, "-c", script], check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    return set(output.split())
+
+
+class TestImports(unittest.TestCase):
+    """Tests for the lazy imports of the package."""
+
+    def test_001_lazy_package(self):
+        """Test that importing the package doesn't load its dependencies, and the functions load only theirs"""
+        self.assertEqual(imported_modules("import pycartociudad") & set(HEAVY_MODULES), set())
+        modules = imported_modules("from pycartociudad import geocode")
+        self.assertIn("requests", modules)
+        self.assertEqual(modules & {"numpy", "asyncio", "pandas", "pycartociudad.aio"}, set())
+
+    def test_002_public_names(self):
+        """Test that the public names resolve to the functions even after importing their submodules"""
+        import pycartociudad
+        import pycartociudad.geocode
+        import pycartociudad.route_matrix  # noqa: F401
+        from pycartociudad.get_location_info import get_location_info
+
+        self.assertTrue(callable(pycartociudad.geocode))
+        self.assertTrue(callable(pycartociudad.route_matrix))
+        self.assertIs(pycartociudad.get_location_info, get_location_info)
+        self.assertEqual(pycartociudad.geocode.__module__, "pycartociudad.geocode")
+        self.assertIn("reverse_geocode", dir(pycartociudad))
+        for name in pycartociudad.__all__:
+            self.assertIsNotNone(getattr(pycartociudad, name), name)
+        with self.assertRaises(AttributeError):
+            pycartociudad.missing_name
+
+    def test_003_import_benchmark(self):
+        """Test that the import time benchmark measures the package import alone"""
+        metrics = run.measure_import(run.IMPORTS["pycartociudad"], 2)
+        self.assertEqual(metrics["calls"], 2)
+        self.assertEqual(metrics["modules"], 1)
+        self.assertGreater(metrics["p50_ms"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
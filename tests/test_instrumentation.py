@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""Tests for `instrumentation` module."""
+
+
+import threading
+import time
+import unittest
+
+from benchmarks.mock_server import MockClient, MockServer
+from pycartociudad import Client, QuantizedLRUCache, instrumentation, reverse_geocode
+from pycartociudad.instrumentation import Event, PrometheusExporter, SpanEmitter
+from tests.utils import FakeSession
+
+REVERSE_JSON = '{"address": "PLAZA DE ESPAÑA", "muni": "Madrid", "tip_via": "PLAZA", "portalNumber": 3}'
+
+
+class FakeSpan:
+    """Span of ``FakeTracer``"""
+
+    def __init__(self, name, start_time, attributes):
+        self.name = name
+        self.start_time = start_time
+        self.attributes = attributes
+        self.end_time = None
+
+    def record_exception(self, error):
+        self.attributes["exception"] = error
+
+    def end(self, end_time=None):
+        self.end_time = end_time
+
+
+class FakeTracer:
+    """Object with the ``start_span`` method of the OpenTelemetry tracers"""
+
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, start_time=None, attributes=None):
+        span = FakeSpan(name, start_time, dict(attributes))
+        self.spans.append(span)
+        return span
+
+
+class TestInstrumentation(unittest.TestCase):
+    """Tests for `instrumentation` module."""
+
+    def setUp(self):
+        """Subscribe a hook collecting the events"""
+        self.events = []
+        instrumentation.subscribe(self.events.append)
+
+    def tearDown(self):
+        """Unsubscribe the hooks"""
+        for hook in list(instrumentation._hooks):
+            instrumentation.unsubscribe(hook)
+
+    def test_001_request_events(self):
+        """Test the events of the retried requests, their decoding and the cache lookups"""
+        statuses = [503, 200]
+        session = FakeSession(lambda url, params: (statuses.pop(0), REVERSE_JSON))
+        client = Client(session=session, retries=1, backoff=0, cache=QuantizedLRUCache())
+        reverse_geocode(40.4, -3.7, client=client)
+        reverse_geocode(40.4, -3.7, client=client)
+
+        self.assertEqual([event.kind for event in self.events],
+                         ["cache", "request", "request", "decode", "cache"])
+        miss, failed, request, decode, hit = self.events
+        self.assertEqual((miss.endpoint, miss.hit, hit.hit), ("reverse_geocode", False, True))
+        self.assertEqual((failed.status, failed.attempt, request.status, request.attempt), (503, 0, 200, 1))
+        self.assertEqual((request.endpoint, request.host), ("reverse_geocode", "www.cartociudad.es"))
+        self.assertEqual(request.size, len(REVERSE_JSON.encode("utf-8")))
+        self.assertGreaterEqual(request.duration, 0)
+        self.assertEqual((decode.endpoint, decode.size), ("reverse_geocode", request.size))
+
+    def test_002_coalesce_events(self):
+        """Test that the coalesced calls report whether they waited on another one"""
+        release = threading.Event()
+
+        def body(url, params):
+            release.wait(5)
+            return REVERSE_JSON
+
+        client = Client(session=FakeSession(body), coalesce=True)
+        threads = [threading.Thread(target=reverse_geocode, args=(40.4, -3.7), kwargs={"client": client})
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while client.flights.calls < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        coalesced = [event for event in self.events if event.kind == instrumentation.COALESCE]
+        self.assertEqual(sorted(event.shared for event in coalesced), [False, True, True])
+        self.assertTrue(all(event.duration is not None for event in coalesced if event.shared))
+
+    def test_003_prometheus(self):
+        """Test the aggregation of the events into Prometheus metrics"""
+        exporter = PrometheusExporter(buckets=(0.1, 1))
+        exporter(Event("request", "geocode", "www.cartociudad.es", 200, 0, ttfb=0.05, duration=0.2, size=100))
+        exporter(Event("request", "geocode", "www.cartociudad.es", None, 1, duration=2, error=TimeoutError()))
+        exporter(Event("cache", "geocode", hit=True))
+        text = exporter.render()
+        self.assertIn('pycartociudad_requests_total{endpoint="geocode",host="www.cartociudad.es",status="200"} 1',
+                      text)
+        self.assertIn('status="TimeoutError"} 1', text)
+        self.assertIn('pycartociudad_retries_total{endpoint="geocode"} 1', text)
+        self.assertIn('pycartociudad_request_duration_seconds_bucket{endpoint="geocode",le="1"} 1', text)
+        self.assertIn('pycartociudad_request_duration_seconds_bucket{endpoint="geocode",le="+Inf"} 2', text)
+        self.assertIn('pycartociudad_request_duration_seconds_sum{endpoint="geocode"} 2.2', text)
+        self.assertIn('pycartociudad_cache_lookups_total{endpoint="geocode",result="hit"} 1', text)
+        self.assertIn("# TYPE pycartociudad_request_ttfb_seconds histogram", text)
+
+    def test_004_spans(self):
+        """Test the spans built with and without an OpenTelemetry tracer"""
+        event = Event("request", "route", "www.cartociudad.es", 500, 2, duration=0.5, size=10)
+        emitter = SpanEmitter()
+        emitter(event)
+        emitter(Event("cache", "route", hit=False))
+        span, = emitter.spans
+        self.assertEqual((span["name"], span["status"]["code"]), ("GET route", "ERROR"))
+        self.assertEqual(span["end_time_unix_nano"] - span["start_time_unix_nano"], 500000000)
+        self.assertEqual(span["attributes"]["http.response.status_code"], 500)
+        self.assertEqual(span["attributes"]["http.request.resend_count"], 2)
+
+        tracer = FakeTracer()
+        SpanEmitter(tracer)(event)
+        self.assertEqual(tracer.spans[0].attributes["server.address"], "www.cartociudad.es")
+        self.assertEqual(tracer.spans[0].end_time, span["end_time_unix_nano"])
+
+        emitter = SpanEmitter(max_spans=2)
+        for attempt in range(3):
+            emitter(Event("request", "route", "www.cartociudad.es", 200, attempt, duration=0.1))
+        self.assertEqual([span["attributes"]["http.request.resend_count"] for span in emitter.spans], [1, 2])
+
+    def test_005_disabled(self):
+        """Test that nothing is reported without hooks"""
+        instrumentation.unsubscribe(self.events.append)
+        self.assertFalse(instrumentation.enabled())
+        reverse_geocode(40.4, -3.7, client=Client(session=FakeSession(lambda url, params: REVERSE_JSON)))
+        self.assertEqual(self.events, [])
+
+    def test_006_connect_time(self):
+        """Test that the sync requests report the time to open their connection, 0 when it is reused"""
+        with MockServer() as server:
+            client = MockClient(server.url)
+            reverse_geocode(40.4473, -3.7044, client=client)
+            reverse_geocode(40.4473, -3.7044, client=client)
+            client.close()
+
+        first, second = [event for event in self.events if event.kind == instrumentation.REQUEST]
+        self.assertGreater(first.connect_time, 0)
+        self.assertEqual(second.connect_time, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
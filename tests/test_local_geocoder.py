@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""Tests for `local_geocoder` module."""
+
+
+import os
+import random
+import tempfile
+import unittest
+
+from pycartociudad import Client, LocalGeocoder, geocode, reverse_geocode
+from tests.utils import FakeClient
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# synthetic portals: (id, tip_via, street, number, extension, muni, province, postal_code, lat, lon)
+PORTALS = [
+    ("500020000101", "CALLE", "MIGUEL SERVET", 1, "", "Zaragoza", "Zaragoza", "50002", 41.6470, -0.8720),
+    ("500020000101", "CALLE", "MIGUEL SERVET", 3, "", "Zaragoza", "Zaragoza", "50002", 41.6468, -0.8716),
+    ("500020000101", "CALLE", "MIGUEL SERVET", 5, "", "Zaragoza", "Zaragoza", "50002", 41.6466, -0.8712),
+    ("500020000101", "CALLE", "MIGUEL SERVET", 5, "B", "Zaragoza", "Zaragoza", "50002", 41.6465, -0.8711),
+    ("500020000101", "CALLE", "MIGUEL SERVET", 8, "", "Zaragoza", "Zaragoza", "50002", 41.6467, -0.8714),
+    ("280790001063", "PLAZA", "MAYOR", 1, "", "Madrid", "Madrid", "28012", 40.4150, -3.7066),
+    ("280790001064", "CALLE", "MAYOR", 1, "", "Madrid", "Madrid", "28013", 40.4165, -3.7050),
+    ("280790001064", "CALLE", "MAYOR", 2, "", "Madrid", "Madrid", "28013", 40.4166, -3.7052),
+    ("281480000501", "CALLE", "MAYOR", 2, "", "Torrejón de Ardoz", "Madrid", "28850", 40.4580, -3.4790),
+    ("280790002001", "CALLE", "DOS DE MAYO", 4, "", "Madrid", "Madrid", "28004", 40.4260, -3.7040),
+]
+
+CSV = "\n".join(["id_vial;tipo_vial;nombre_via;numero;extension;municipio;provincia;cod_postal;lat;lon"] +
+                [";".join(str(value) for value in portal) for portal in PORTALS])
+
+
+class TestLocalGeocoder(unittest.TestCase):
+    """Tests for `local_geocoder` module."""
+
+    def setUp(self):
+        """Build the geocoder of the synthetic portals"""
+        self.geocoder = LocalGeocoder(PORTALS)
+
+    def test_001_exact_portals(self):
+        """Test that the portals are found with any spelling of the address"""
+        result = self.geocoder.lookup("C/ Miguel Servet nº 5, Zaragoza")
+        self.assertEqual((result["address"], result["tip_via"], result["portalNumber"]), ("MIGUEL SERVET", "CALLE", 5))
+        self.assertEqual((result["lat"], result["lng"], result["state"]), (41.6466, -0.8712, 1))
+        self.assertEqual((result["muni"], result["postalCode"], result["type"]), ("Zaragoza", "50002", "portal"))
+        self.assertEqual(result["geom"], "POINT (-0.8712 41.6466)")
+        self.assertEqual(self.geocoder.lookup("calle miguel servet 5-B zaragoza")["lat"], 41.6465)
+        self.assertEqual(self.geocoder.lookup("calle miguel servet 5-B zaragoza")["state"], 1)
+        approximate = self.geocoder.lookup("calle miguel servet 3-A zaragoza")
+        self.assertEqual((approximate["portalNumber"], approximate["lat"], approximate["state"]), (3, 41.6468, 4))
+        self.assertEqual(self.geocoder.lookup("calle dos de mayo 4, madrid")["id"], "280790002001")
+
+    def test_002_ambiguous_streets(self):
+        """Test that the street with the fewest words besides the address ones is chosen"""
+        self.assertEqual(self.geocoder.lookup("plaza mayor 1, madrid")["id"], "280790001063")
+        self.assertEqual(self.geocoder.lookup("calle mayor 1, madrid")["id"], "280790001064")
+        self.assertEqual(self.geocoder.lookup("calle mayor 2, torrejon de ardoz")["id"], "281480000501")
+        self.assertEqual(self.geocoder.lookup("calle mayor 2, 28850")["id"], "281480000501")
+
+    def test_003_missing_portals(self):
+        """Test the closest portals with the same parity, the streets without number and the misses"""
+        odd = self.geocoder.lookup("calle miguel servet 7, zaragoza")
+        self.assertEqual((odd["portalNumber"], odd["state"]), (5, 3))
+        even = self.geocoder.lookup("calle miguel servet 2, zaragoza")
+        self.assertEqual((even["portalNumber"], even["state"]), (8, 2))
+        street = self.geocoder.lookup("calle miguel servet, zaragoza")
+        self.assertEqual((street["type"], street["portalNumber"]), ("callejero", 0))
+        self.assertEqual(self.geocoder.lookup("calle inexistente 1, zaragoza"), {})
+        self.assertEqual(self.geocoder.lookup(""), {})
+
+    def test_004_save_and_load(self):
+        """Test that the index is built from a CSV file and saved and loaded back"""
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(CSV)
+        try:
+            geocoder = LocalGeocoder.from_csv(path)
+            geocoder.save(path)
+            loaded = LocalGeocoder.load(path)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(len(loaded), len(PORTALS))
+        for address in ("calle miguel servet 5b, zaragoza", "calle mayor 2, torrejon de ardoz", "plaza mayor"):
+            self.assertEqual(loaded.lookup(address), self.geocoder.lookup(address))
+
+    def test_005_remote_fallback(self):
+        """Test that geocode answers from the local index, and queries the service for the misses"""
+        client = FakeClient('callback({"address": "ALCALA", "muni": "Madrid"})', local_geocoder=self.geocoder)
+        self.assertEqual(geocode("calle mayor 1, madrid", client=client)["id"], "280790001064")
+        self.assertEqual(client.calls, [])
+        self.assertEqual(geocode("calle alcala 1, madrid", client=client)["address"], "ALCALA")
+        self.assertEqual(len(client.calls), 1)
+        self.assertIsNone(Client().local_geocoder)
+
+    def test_006_reverse_lookup(self):
+        """Test that the nearest portal within the maximum distance is returned"""
+        result = self.geocoder.reverse_lookup(41.64681, -0.87162)
+        self.assertEqual((result["address"], result["portalNumber"], result["state"]), ("MIGUEL SERVET", 3, 1))
+        self.assertEqual((result["lat"], result["lng"], result["postalCode"]), (41.6468, -0.8716, "50002"))
+        self.assertLess(result["distance"], 3)
+        self.assertEqual(self.geocoder.reverse_lookup(40.4581, -3.4791)["muni"], "Torrejón de Ardoz")
+        self.assertEqual(self.geocoder.reverse_lookup(40.43, -3.70), {})
+        self.assertEqual(self.geocoder.reverse_lookup(40.43, -3.70, max_distance_m=None)["address"], "DOS DE MAYO")
+        self.assertEqual(self.geocoder.reverse_lookup(36.0, -6.0, max_distance_m=None)["id"], "280790001063")
+        self.assertEqual(LocalGeocoder().reverse_lookup(40.4, -3.7), {})
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_007_reverse_lookup_many(self):
+        """Test that the vectorized reverse lookup matches the single point one, also memory-mapping the index"""
+        rng = random.Random(1)
+        points = [(rng.uniform(40.40, 40.47), rng.uniform(-3.72, -3.47)) for _ in range(500)]
+        points += [(41.6466 + rng.gauss(0, 0.001), -0.8714 + rng.gauss(0, 0.001)) for _ in range(500)]
+        latitudes, longitudes = zip(*points)
+
+        fd, path = tempfile.mkstemp(suffix=".idx")
+        os.close(fd)
+        try:
+            self.geocoder.save(path)
+            mapped = LocalGeocoder.load(path, mmap=True)
+            for max_distance_m in (100, 2000, None):
+                results = mapped.reverse_lookup_many(latitudes, longitudes, max_distance_m=max_distance_m)
+                for i, (latitude, longitude) in enumerate(points):
+                    expected = self.geocoder.reverse_lookup(latitude, longitude, max_distance_m=max_distance_m)
+                    self.assertEqual(results["id"][i], expected.get("id"))
+                    self.assertEqual(results["portalNumber"][i], expected.get("portalNumber", -1))
+                    if expected:
+                        self.assertAlmostEqual(results["distance"][i], expected["distance"])
+            del mapped, results
+        finally:
+            os.remove(path)
+
+    def test_008_reverse_geocode_fallback(self):
+        """Test that reverse_geocode answers from the local index, and queries the service far from its portals"""
+        client = FakeClient('{"address": "ALCALA", "muni": "Madrid"}', local_geocoder=self.geocoder)
+        self.assertEqual(reverse_geocode(40.41651, -3.70501, client=client)["portalNumber"], 1)
+        self.assertEqual(reverse_geocode(40.41651, -3.70501, client=client, typed=True).address, "MAYOR")
+        self.assertEqual(client.calls, [])
+        self.assertEqual(reverse_geocode(40.43, -3.70, client=client)["address"], "ALCALA")
+        self.assertEqual(reverse_geocode(40.41651, -3.70501, cadastral=True, client=client)["address"], "ALCALA")
+        self.assertEqual(len(client.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""Tests for `local_router` module."""
+
+
+import os
+import random
+import tempfile
+import unittest
+
+from pycartociudad import Client, LocalRouter, route_between_two_points, route_matrix
+from pycartociudad.polyline import encode_polyline
+from tests.utils import FakeClient
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# square of streets A (40.400, -3.700), B (40.401, -3.700), C (40.401, -3.699), D (40.400, -3.699), with a one-way
+# street from A to D and a motorway from A to C:
+# (name, from_lat, from_lon, to_lat, to_lon, length, speed, oneway, foot)
+SEGMENTS = [
+    ("CALLE MAYOR", 40.400, -3.700, 40.401, -3.700, 120, 50, 0, 1),
+    ("CALLE ARENAL", 40.401, -3.700, 40.401, -3.699, "", 50, 0, 1),
+    ("CALLE POSTAS", 40.400, -3.700, 40.400, -3.699, "", 50, 1, 1),
+    ("CALLE SAL", 40.400, -3.699, 40.401, -3.699, "", 50, 0, 1),
+    ("AUTOVIA M-30", 40.400, -3.700, 40.401, -3.699, "", 100, 1, 0),
+]
+
+# meters of the east-west and north-south segments
+EAST, NORTH = 84.77, 111.32
+
+
+def street_grid(size, seed):
+    """Segments of a grid of streets with random speeds and one-way streets, and a few missing blocks"""
+    rng = random.Random(seed)
+    segments = []
+    for i in range(size):
+        for j in range(size):
+            for di, dj, name in ((1, 0, f"CALLE {j}"), (0, 1, f"AVENIDA {i}")):
+                if i + di < size and j + dj < size and rng.random() > 0.1:
+                    speed = rng.choice([0, 30, 50, 90])
+                    segments.append((name, 40.4 + i / 1000, -3.7 + j / 1000, 40.4 + (i + di) / 1000,
+                                     -3.7 + (j + dj) / 1000, "", speed, rng.choice([0, 0, 1, -1]), int(speed < 90)))
+    return segments
+
+
+class TestLocalRouter(unittest.TestCase):
+    """Tests for `local_router` module."""
+
+    def setUp(self):
+        """Build the router of the synthetic streets"""
+        self.router = LocalRouter(SEGMENTS)
+
+    def test_001_walk_and_car(self):
+        """Test that the walking routes ignore the one-way streets and the cars the pedestrian ones"""
+        walk = self.router.route(40.40001, -3.70001, 40.401, -3.699)
+        self.assertAlmostEqual(walk["distance"], EAST + NORTH, delta=0.1)
+        self.assertAlmostEqual(walk["time"], (EAST + NORTH) * 720, delta=100)
+        self.assertEqual(walk["instructionsData"]["instruction"][0]["description"], "Continúe por CALLE POSTAS")
+        self.assertEqual([item["description"] for item in walk["instructionsData"]["instruction"][1:]],
+                         ["Gire a la izquierda por CALLE SAL", "Objetivo logrado"])
+        self.assertEqual((walk["found"], walk["from"], walk["to"]), ("true", "40.40001,-3.70001", "40.401,-3.699"))
+        self.assertEqual(walk["geom"], encode_polyline([(40.4, -3.7), (40.4, -3.699), (40.401, -3.699)]))
+        self.assertEqual(walk["bbox"], [-3.7, 40.4, -3.699, 40.401])
+
+        car = self.router.route(40.400, -3.700, 40.401, -3.699, vehicle=True)
+        self.assertEqual([item["description"] for item in car["instructionsData"]["instruction"]],
+                         ["Continúe por AUTOVIA M-30", "Objetivo logrado"])
+        back = self.router.route(40.401, -3.699, 40.400, -3.700, vehicle=True)
+        self.assertAlmostEqual(back["distance"], EAST + 120, delta=0.1)
+        self.assertAlmostEqual(back["time"], (EAST + 120) * 72, delta=10)
+        self.assertEqual(self.router.route(40.401, -3.699, 40.400, -3.700)["distance"], walk["distance"])
+
+    def test_002_algorithms(self):
+        """Test that A*, bidirectional Dijkstra and contraction hierarchies find routes as short"""
+        router = LocalRouter(street_grid(15, seed=1))
+        rng = random.Random(2)
+        points = [(40.4 + rng.uniform(0, 0.014), -3.7 + rng.uniform(0, 0.014)) for _ in range(60)]
+        astar = [router.route(*origin, *destination, vehicle=vehicle)
+                 for origin, destination, vehicle in zip(points, points[::-1], [True, False] * 30)]
+        dijkstra = [router.route(*origin, *destination, vehicle=vehicle, algorithm="dijkstra")
+                    for origin, destination, vehicle in zip(points, points[::-1], [True, False] * 30)]
+        router.contract()
+        ch = [router.route(*origin, *destination, vehicle=vehicle)
+              for origin, destination, vehicle in zip(points, points[::-1], [True, False] * 30)]
+        self.assertGreater(sum(bool(route) for route in astar), 30)
+        for expected, *routes in zip(astar, dijkstra, ch):
+            for route in routes:
+                self.assertEqual(bool(route), bool(expected))
+                if expected:
+                    self.assertAlmostEqual(route["time"], expected["time"], places=3)
+                    self.assertAlmostEqual(route["distance"],
+                                           sum(item["distance"] for item in route["instructionsData"]["instruction"]))
+
+    def test_003_save_and_load(self):
+        """Test that the contracted graph is saved and loaded back, and the points outside the graph"""
+        self.router.contract()
+        fd, path = tempfile.mkstemp(suffix=".graph")
+        os.close(fd)
+        try:
+            self.router.save(path)
+            loaded = LocalRouter.load(path)
+        finally:
+            os.remove(path)
+
+        self.assertEqual(len(loaded), len(SEGMENTS))
+        for vehicle in (False, True):
+            self.assertEqual(loaded.route(40.401, -3.699, 40.400, -3.700, vehicle=vehicle),
+                             self.router.route(40.401, -3.699, 40.400, -3.700, vehicle=vehicle))
+        self.assertEqual(loaded.route(40.401, -3.699, 40.5, -3.7), {})
+        self.assertEqual(LocalRouter().route(40.401, -3.699, 40.400, -3.700), {})
+        with self.assertRaises(ValueError):
+            loaded.route(40.401, -3.699, 40.400, -3.700, algorithm="bfs")
+        with self.assertRaises(ValueError):
+            LocalRouter(SEGMENTS).route(40.401, -3.699, 40.400, -3.700, algorithm="ch")
+
+    def test_004_remote_fallback(self):
+        """Test that the routes are computed with the local graph, and queried for the points outside it"""
+        body = '{"found": "true", "distance": "10", "time": "20", "instructionsData": {"instruction": []}}'
+        client = FakeClient(body, local_router=self.router)
+        route = route_between_two_points(40.400, -3.700, 40.401, -3.699, client=client, typed=True)
+        self.assertAlmostEqual(route.distance, EAST + NORTH, delta=0.1)
+        self.assertEqual(client.calls, [])
+        self.assertEqual(route_between_two_points(40.400, -3.700, 40.5, -3.7, client=client)["distance"], 10.0)
+        self.assertEqual(len(client.calls), 1)
+        self.assertIsNone(Client().local_router)
+
+    @unittest.skipIf(np is None, "numpy is not installed")
+    def test_005_arrays(self):
+        """Test the routes with arrays and the local route matrices"""
+        client = FakeClient('{"found": "false"}', local_router=self.router)
+        route = route_between_two_points(40.400, -3.700, 40.401, -3.699, client=client, arrays=True)
+        np.testing.assert_allclose(route["coordinates"], [[40.4, -3.7], [40.4, -3.699], [40.401, -3.699]])
+        np.testing.assert_allclose(route["instruction_distances"], [EAST, NORTH, 0], atol=0.1)
+
+        distances, times = route_matrix([(40.400, -3.700), (40.401, -3.699)], [(40.401, -3.699)], vehicle=True,
+                                        client=client)
+        self.assertAlmostEqual(distances[0, 0], 139.9, delta=0.1)
+        self.assertEqual(times[1, 0], 0)
+        self.assertEqual(client.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
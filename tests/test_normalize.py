@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""Tests for `normalize` module."""
+
+
+import json
+import unittest
+
+from pycartociudad import QuantizedLRUCache, geocode, geocode_many
+from pycartociudad.normalize import normalize_address
+from tests.utils import FakeClient
+
+GEOCODER_JSONP = 'callback({"address": "MIGUEL SERVET", "muni": "Zaragoza", "portalNumber": 5})'
+
+
+class TestNormalize(unittest.TestCase):
+    """Tests for `normalize` module."""
+
+    def test_001_spellings(self):
+        """Test that the usual spellings of the same address are normalized to the same string"""
+        spellings = ["C/ Miguel Servet 5, Zaragoza", "calle miguel servet, 5 zaragoza", "CALLE MIGUEL SERVET Nº 5",
+                     "Cl. Miguel Servet, núm. 5 - Zaragoza", "c/miguel servet 05 zaragoza"]
+        self.assertEqual({normalize_address(spelling).replace(" zaragoza", "") for spelling in spellings},
+                         {"calle miguel servet 5"})
+
+    def test_002_abbreviations_and_accents(self):
+        """Test the expansion of the street types and the folding of the accents"""
+        self.assertEqual(normalize_address("Avda. de la Constitución, 12-B, Sevilla"),
+                         "avenida de la constitucion 12b sevilla")
+        self.assertEqual(normalize_address("Pza. Mayor, s/n, Madrid"), "plaza mayor sn madrid")
+        self.assertEqual(normalize_address("Pº de la Castellana 1º"), "paseo de la castellana 1")
+        self.assertEqual(normalize_address("Ctra. Peñíscola"), "carretera peniscola")
+
+    def test_003_unchanged(self):
+        """Test that the numbers and single letters that are part of the street name are kept"""
+        self.assertEqual(normalize_address("Calle 5 de Octubre 3"), "calle 5 de octubre 3")
+        self.assertEqual(normalize_address("Calle A 4"), "calle a 4")
+        self.assertEqual(normalize_address(None), "")
+        self.assertEqual(normalize_address(" , "), "")
+
+    def test_004_cache_and_dedupe(self):
+        """Test that the spellings of the same address share their cache entry and their batch request"""
+        client = FakeClient(GEOCODER_JSONP, cache=QuantizedLRUCache(endpoints=["geocode"]))
+        geocode("C/ Miguel Servet 5, Zaragoza", client=client)
+        self.assertEqual(geocode("calle miguel servet, 5 zaragoza", client=client)["portalNumber"], 5)
+        self.assertEqual(len(client.calls), 1)
+        self.assertIn("C/%20Miguel%20Servet%205", client.calls[0][0])
+
+        client = FakeClient(GEOCODER_JSONP)
+        results = list(geocode_many(["Pza. Mayor 1", "plaza mayor, 1", "Plaza Mayor 2"], client=client))
+        self.assertEqual([address for address, _ in results], ["Pza. Mayor 1", "plaza mayor, 1", "Plaza Mayor 2"])
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(json.dumps(results[0][1]), json.dumps(results[1][1]))
+
+    def test_005_portal_letters(self):
+        """Test that the portal letters are joined to the number, also those that are abbreviations (C, P)"""
+        for spelling in ("Calle Mayor 5 C, Madrid", "Calle Mayor 5-C, Madrid", "Calle Mayor 5C, Madrid",
+                         "C/ Mayor nº 5 c Madrid"):
+            self.assertEqual(normalize_address(spelling), "calle mayor 5c madrid")
+        self.assertEqual(normalize_address("Calle Mayor 5 B, Madrid"), "calle mayor 5b madrid")
+        self.assertEqual(normalize_address("Calle Mayor 5 P, Madrid"), "calle mayor 5p madrid")
+        self.assertEqual(normalize_address("C Mayor 5"), "calle mayor 5")
+
+    def test_006_leading_abbreviations(self):
+        """Test that the abbreviations with other meanings are only expanded as the leading street type"""
+        self.assertEqual(normalize_address("Pl. Mayor 1, Madrid"), "plaza mayor 1 madrid")
+        self.assertEqual(normalize_address("C/ Mayor 3 2 pl"), "calle mayor 3 2 pl")
+        self.assertNotEqual(normalize_address("C/ Mayor 3, 2 pl"), normalize_address("C/ Mayor 3, 2 plaza"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""Tests for `polyline` module."""
+
+
+import json
+import unittest
+
+from pycartociudad import route_between_two_points
+from pycartociudad.polyline import decode_polyline, encode_polyline, instruction_distances
+from tests.utils import FakeClient
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+ROUTE = {
+    "found": "true", "from": "40.4,-3.7", "to": "40.41,-3.71", "distance": "812.5", "time": "600000",
+    "geom": "_p~iF~ps|U_ulLnnqC_mqNvxq`@",
+    "instructionsData": {"instruction": [
+        {"description": "Continúe por CALLE MAYOR", "distance": "120 m"},
+        {"description": "Gire a la derecha", "distance": "1.2 km"},
+        {"description": "Objetivo logrado", "distance": "0 m"},
+    ]},
+}
+
+
+def decode_polyline_loop(encoded, precision=5):
+    """Reference decoder of the polyline algorithm, one character at a time"""
+    deltas, value, shift = [], 0, 0
+    for char in encoded:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            deltas.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    lat, lon, coordinates = 0, 0, []
+    for delta_lat, delta_lon in zip(deltas[::2], deltas[1::2]):
+        lat, lon = lat + delta_lat, lon + delta_lon
+        coordinates.append((lat / 10 ** precision, lon / 10 ** precision))
+    return coordinates
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestPolyline(unittest.TestCase):
+    """Tests for `polyline` module."""
+
+    def test_001_decode_polyline(self):
+        """Test the decoding of the reference polyline of the algorithm"""
+        coordinates = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        self.assertEqual(coordinates.shape, (3, 2))
+        self.assertEqual(coordinates.dtype, np.float64)
+        np.testing.assert_allclose(coordinates, [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]])
+        self.assertEqual(decode_polyline("").shape, (0, 2))
+        with self.assertRaises(ValueError):
+            decode_polyline("_p~iF~ps|U_")
+
+    def test_002_decode_long_polyline(self):
+        """Test that a dense route matches the decoding one character at a time"""
+        rng = np.random.default_rng(0)
+        points = np.round(np.cumsum(rng.normal(0, 0.01, (5000, 2)), axis=0) + [40.4, -3.7], 5)
+        encoded, previous = [], np.zeros(2, dtype=np.int64)
+        for point in np.round(points * 1e5).astype(np.int64):
+            for delta in point - previous:
+                value = ~(int(delta) << 1) if delta < 0 else int(delta) << 1
+                while value >= 0x20:
+                    encoded.append(chr((0x20 | (value & 0x1f)) + 63))
+                    value >>= 5
+                encoded.append(chr(value + 63))
+            previous = point
+        encoded = "".join(encoded)
+
+        np.testing.assert_allclose(decode_polyline(encoded), points, atol=1e-9)
+        np.testing.assert_allclose(decode_polyline(encoded), decode_polyline_loop(encoded), atol=1e-9)
+
+    def test_003_instruction_distances(self):
+        """Test that only the distances with exactly one value in meters are parsed"""
+        meters = instruction_distances(["120 m", "1.2 km", "3 m y 4 m", "", "7 m"])
+        np.testing.assert_array_equal(meters, [120, np.nan, np.nan, np.nan, 7])
+        self.assertEqual(instruction_distances([]).shape, (0,))
+
+    def test_004_route_arrays(self):
+        """Test the array output of the routes, the default one and the lazy coordinates of the typed results"""
+        client = FakeClient(json.dumps(ROUTE))
+        route = route_between_two_points(40.4, -3.7, 40.41, -3.71, client=client, arrays=True)
+        np.testing.assert_allclose(route["coordinates"], [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]])
+        np.testing.assert_array_equal(route["instruction_distances"], [120, np.nan, 0])
+        self.assertEqual(route["distance"], 812.5)
+        self.assertEqual(route["instructionsData"]["instruction"][0]["distance"], "120 m")
+
+        route = route_between_two_points(40.4, -3.7, 40.41, -3.71, client=client)
+        self.assertNotIn("coordinates", route)
+        self.assertEqual([item["distance"] for item in route["instructionsData"]["instruction"]],
+                         [120.0, "1.2 km", 0.0])
+
+        route = route_between_two_points(40.4, -3.7, 40.41, -3.71, client=client, typed=True)
+        self.assertEqual(route.coordinates.shape, (3, 2))
+        self.assertIs(route.coordinates, route.coordinates)
+
+    def test_005_encode_polyline(self):
+        """Test that the encoded polylines are decoded back to the points, rounded to the precision"""
+        self.assertEqual(encode_polyline([(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]),
+                         "_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        self.assertEqual(encode_polyline([]), "")
+        points = np.random.default_rng(1).uniform([-90, -180], [90, 180], (1000, 2))
+        np.testing.assert_allclose(decode_polyline(encode_polyline(points)), points, atol=5e-6)
+        np.testing.assert_allclose(decode_polyline(encode_polyline(points, precision=6), precision=6), points,
+                                   atol=5e-7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+"""Tests for `results` module."""
+
+
+import pickle
+import sys
+import unittest
+
+from pycartociudad import GeocodeResult, LocationInfo, RouteResult, geocode, get_location_info, reverse_geocode
+from pycartociudad import route_between_two_points
+from pycartociudad.results import parse_wkt
+from tests.utils import FakeClient
+
+ADDRESS = {
+    "id": "280790001063", "province": "Madrid", "comunidadAutonoma": "Comunidad de Madrid", "muni": "Madrid",
+    "type": "portal", "address": "MAYOR", "postalCode": "28012", "poblacion": "Madrid",
+    "geom": "POINT (-3.7066353973101624 40.41505683353346)", "tip_via": "PLAZA", "lat": 40.41505683353346,
+    "lng": -3.7066353973101624, "portalNumber": 1, "stateMsg": "Resultado exacto de la búsqueda", "state": 1,
+    "countryCode": "011", "refCatastral": "None",
+}
+
+
+class TestResults(unittest.TestCase):
+    """Tests for `results` module."""
+
+    def test_001_mapping_compatibility(self):
+        """Test that the typed results behave as the dicts they replace"""
+        result = GeocodeResult(ADDRESS)
+        self.assertEqual(result, ADDRESS)
+        self.assertEqual(result.to_dict(), ADDRESS)
+        self.assertEqual(list(result), list(ADDRESS))
+        self.assertEqual(result["address"], "MAYOR")
+        self.assertEqual(result.muni, "Madrid")
+        self.assertIsNone(result.priority)
+        self.assertNotIn("priority", result)
+        with self.assertRaises(KeyError):
+            result["priority"]
+        with self.assertRaises(AttributeError):
+            result.muni = "Zaragoza"
+        self.assertFalse(GeocodeResult({}))
+
+    def test_002_compact(self):
+        """Test that the typed results are smaller than the dicts and share the repeated strings"""
+        first = GeocodeResult(ADDRESS)
+        second = GeocodeResult({**ADDRESS, "province": "".join(["Mad", "rid"])})
+        self.assertFalse(hasattr(first, "__dict__"))
+        self.assertLess(sys.getsizeof(first), sys.getsizeof(ADDRESS))
+        self.assertIs(first.province, second.province)
+
+    def test_003_unknown_fields(self):
+        """Test that unknown fields are kept"""
+        result = GeocodeResult({**ADDRESS, "newField": 3})
+        self.assertEqual(result["newField"], 3)
+        self.assertEqual(result.to_dict(), {**ADDRESS, "newField": 3})
+        self.assertEqual(pickle.loads(pickle.dumps(result)), result)
+
+    def test_004_lazy_geometry(self):
+        """Test that the WKT geometry is parsed on access"""
+        self.assertEqual(GeocodeResult(ADDRESS).coordinates, (-3.7066353973101624, 40.41505683353346))
+        self.assertIsNone(GeocodeResult({}).coordinates)
+        self.assertEqual(parse_wkt("LINESTRING (1 2, 3 4)"), [(1, 2), (3, 4)])
+        self.assertEqual(parse_wkt("POLYGON ((0 0, 1 0, 1 1, 0 0), (0.2 0.2, 0.3 0.2, 0.2 0.2))"),
+                         [[(0, 0), (1, 0), (1, 1), (0, 0)], [(0.2, 0.2), (0.3, 0.2), (0.2, 0.2)]])
+        self.assertIsNone(parse_wkt("POINT EMPTY"))
+
+    def test_005_typed_functions(self):
+        """Test that the functions return typed results on demand"""
+        client = FakeClient(lambda url, params: f"callback({ADDRESS})".replace("'", '"'))
+        self.assertIsInstance(geocode("Plaza mayor 1, Madrid", client=client, typed=True), GeocodeResult)
+        self.assertIsInstance(geocode("Plaza mayor 1, Madrid", client=client), dict)
+
+        client = FakeClient(str(ADDRESS).replace("'", '"'))
+        self.assertEqual(reverse_geocode(40.4, -3.7, client=client, typed=True).coordinates[1], 40.41505683353346)
+
+        client = FakeClient('<root xmlns="http://www.catastro.meh.es/"/>')
+        result = get_location_info(40.4, -3.7, sources=["cadastre"], client=client, typed=True)
+        self.assertIsInstance(result, LocationInfo)
+        self.assertEqual(result, {"cadastral_ref": None})
+
+        client = FakeClient('{"found": "true", "from": "a", "distance": "10", "time": "20", '
+                            '"instructionsData": {"instruction": []}}')
+        route = route_between_two_points(40.4, -3.7, 40.41, -3.71, client=client, typed=True)
+        self.assertIsInstance(route, RouteResult)
+        self.assertEqual((route.origin, route["from"], route.distance), ("a", "a", 10.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@
 
 import unittest
 
-from pycartociudad import reverse_geocode
+from pycartociudad import CartociudadError, reverse_geocode
 
 
 class TestReverseGeocode(unittest.TestCase):
@@ -41,7 +41,7 @@ class TestReverseGeocode(unittest.TestCase):
 
     def test_004_reverse_geocode(self):
         """Test correct args raising exception"""
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(CartociudadError):
             reverse_geocode('a', 'b')
 
     def test_005_reverse_geocode(self):
@@ -50,7 +50,7 @@ class TestReverseGeocode(unittest.TestCase):
 
     def test_006_reverse_geocode(self):
         """Test coords not found raising exception"""
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(CartociudadError):
             reverse_geocode(0, 0)
 
 
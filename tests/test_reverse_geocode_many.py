@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Tests for `reverse_geocode_many` function."""
+
+
+import unittest
+import urllib
+
+from pycartociudad import reverse_geocode_many
+from pycartociudad._spatial import PointGrid
+from tests.utils import FakeClient
+
+
+def echo_point(url, params):
+    """Answers a reverse geocoding request with the queried point"""
+    query = urllib.parse.parse_qs(params)
+    return f'{{"lat": {query["lat"][0]}, "lng": {query["lon"][0]}}}'
+
+
+def trace(size, step_m):
+    """GPS trace of ``size`` points northwards, ``step_m`` meters apart"""
+    return [(40.4 + i * step_m / 111_320, -3.7) for i in range(size)]
+
+
+class TestReverseGeocodeMany(unittest.TestCase):
+    """Tests for `reverse_geocode_many` function."""
+
+    def test_001_spatial_reuse(self):
+        """Test that the points of a dense trace reuse the answers of the nearby points, keeping the input order"""
+        client = FakeClient(echo_point)
+        points = trace(1000, 1)
+        results = list(reverse_geocode_many(points, reuse_radius_m=10, max_workers=4, client=client))
+        self.assertEqual([point for point, _ in results], points)
+        self.assertEqual(len(client.calls), 100)
+        for (latitude, longitude), result in results:
+            self.assertLessEqual(abs(latitude - result["lat"]) * 111_320, 10 + 1e-6)
+
+    def test_002_without_reuse(self):
+        """Test that without a radius only the repeated points share the request"""
+        client = FakeClient(echo_point)
+        points = trace(5, 1) * 2
+        results = list(reverse_geocode_many(points, reuse_radius_m=0, client=client))
+        self.assertEqual(len(client.calls), 5)
+        self.assertEqual([(result["lat"], result["lng"]) for _, result in results], points)
+
+    def test_003_grid(self):
+        """Test that the grid finds the closest indexed point within the radius, also across longitudes"""
+        grid = PointGrid(10)
+        grid.add(40.4, -3.7, "a")
+        grid.add(40.4, -3.7 + 8 / 85_000, "b")
+        self.assertEqual(grid.nearest(40.4, -3.7 + 1 / 85_000), "a")
+        self.assertEqual(grid.nearest(40.4, -3.7 + 6 / 85_000), "b")
+        self.assertIsNone(grid.nearest(40.4 + 11 / 111_320, -3.7))
+        self.assertIsNone(grid.nearest(40.4, -3.7 - 12 / 85_000))
+        self.assertEqual(len(grid), 2)
+        with self.assertRaises(ValueError):
+            PointGrid(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
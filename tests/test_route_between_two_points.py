@@ -5,7 +5,7 @@
 
 import unittest
 
-from pycartociudad import route_between_two_points
+from pycartociudad import CartociudadError, route_between_two_points
 
 
 class TestRouteBetweenTwoPoints(unittest.TestCase):
@@ -47,7 +47,7 @@ class TestRouteBetweenTwoPoints(unittest.TestCase):
 
     def test_004_route_between_two_points(self):
         """Test correct args raising exception"""
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(CartociudadError):
             route_between_two_points('lat1', 'lon1', 'lat2', 'lon2')
 
     def test_005_route_between_two_points(self):
@@ -56,7 +56,7 @@ class TestRouteBetweenTwoPoints(unittest.TestCase):
 
     def test_006_route_between_two_points(self):
         # Test coords not found raising exception
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(CartociudadError):
             route_between_two_points(40.4167, -3.7038, 0, 0)
 
 
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""Tests for `route_matrix` function."""
+
+
+import unittest
+import urllib
+
+from pycartociudad import ServiceError, route_matrix
+from tests.utils import FakeClient
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def route_body(url, params):
+    """Answers a route request with the latitude difference as distance, failing the routes to (0, 0)"""
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    orig = [float(value) for value in query["orig"][0].split(",")]
+    dest = [float(value) for value in query["dest"][0].split(",")]
+    if dest == [0, 0]:
+        return '{"found": "false"}'
+    if dest == [1, 1]:
+        raise ServiceError("unavailable")
+    distance = round(abs(orig[0] - dest[0]) * 1000) + (1 if query["vehicle"][0] == "CAR" else 0)
+    return f'{{"found": "true", "distance": "{distance}", "time": "{distance * 2}", ' \
+           f'"instructionsData": {{"instruction": [{{"distance": "{distance} m"}}]}}}}'
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestRouteMatrix(unittest.TestCase):
+    """Tests for `route_matrix` function."""
+
+    def test_001_matrix(self):
+        """Test the distances and times of every leg"""
+        client = FakeClient(route_body)
+        origins = [(40.0, -3.0), (40.1, -3.0)]
+        destinations = [(40.2, -3.0), (40.0, -3.0), (0, 0)]
+        distances, times = route_matrix(origins, destinations, client=client)
+        self.assertEqual(distances.dtype, np.float64)
+        np.testing.assert_array_equal(distances, [[200, 0, np.nan], [100, 100, np.nan]])
+        np.testing.assert_array_equal(times, [[400, 0, np.nan], [200, 200, np.nan]])
+        # the leg between the same point is not requested
+        self.assertEqual(len(client.calls), 5)
+
+    def test_002_symmetric_walking(self):
+        """Test that symmetric pairs are requested once"""
+        client = FakeClient(route_body)
+        points = [(40.0, -3.0), (40.1, -3.0), (40.3, -3.0)]
+        distances, _ = route_matrix(points, points, symmetric=True, client=client)
+        np.testing.assert_array_equal(distances, distances.T)
+        self.assertEqual(len(client.calls), 3)
+
+    def test_003_vehicle(self):
+        """Test vehicle routes, which are not symmetric"""
+        client = FakeClient(route_body)
+        distances, _ = route_matrix([(40.0, -3.0)], [(40.1, -3.0)], vehicle=True, client=client)
+        self.assertEqual(distances[0, 0], 101)
+        with self.assertRaises(ValueError):
+            route_matrix([(40.0, -3.0)], [(40.1, -3.0)], vehicle=True, symmetric=True, client=client)
+
+    def test_004_errors(self):
+        """Test that the exceptions of the failed legs are returned, but not the routes not found"""
+        client = FakeClient(route_body)
+        distances, times, errors = route_matrix([(40.0, -3.0)], [(40.1, -3.0), (0, 0), (1, 1)], client=client,
+                                                return_errors=True)
+        np.testing.assert_array_equal(distances, [[100, np.nan, np.nan]])
+        self.assertEqual(list(errors), [(0, 2)])
+        self.assertIsInstance(errors[0, 2], ServiceError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Tests for `singleflight` module."""
+
+
+import asyncio
+import threading
+import time
+import unittest
+
+from pycartociudad import aio, geocode, reverse_geocode
+from pycartociudad.singleflight import SingleFlight
+from tests.utils import FakeAsyncClient, FakeClient
+
+
+def slow_address(url, params):
+    time.sleep(0.1)
+    return '{"address": "MAYOR"}'
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Tests for `singleflight` module."""
+
+    def test_001_concurrent_calls_are_coalesced(self):
+        """Test that concurrent identical calls share a single request"""
+        client = FakeClient(slow_address, coalesce=True)
+        results = []
+
+        def lookup():
+            results.append(reverse_geocode(40.4, -3.7, client=client))
+
+        threads = [threading.Thread(target=lookup) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual([result["address"] for result in results], ["MAYOR"] * 20)
+        self.assertEqual(client.flights.stats(), {"calls": 20, "shared": 19})
+        self.assertEqual(len(set(map(id, results))), 20)
+
+        # once finished, the next call is requested again
+        reverse_geocode(40.4, -3.7, client=client)
+        self.assertEqual(len(client.calls), 2)
+
+    def test_002_keys_are_normalized(self):
+        """Test that the queries are coalesced on their normalized value, and different queries are not"""
+        client = FakeClient(lambda url, params: f"callback({slow_address(url, params)})", coalesce=True)
+        addresses = ["Plaza Mayor 1, Madrid", "plaza  mayor 1, madrid", "Calle Mayor 1, Madrid"]
+        threads = [threading.Thread(target=geocode, args=(address,), kwargs={"client": client})
+                   for address in addresses]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(client.calls), 2)
+
+    def test_003_errors_are_shared(self):
+        """Test that the exception of the shared call is raised to every caller"""
+        flights = SingleFlight()
+        errors = []
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError("upstream error")
+
+        def call():
+            try:
+                flights.do("geocode", "x", fail)
+            except ValueError as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(len(set(map(id, errors))), 1)
+
+    def test_004_async_calls_are_coalesced(self):
+        """Test that concurrent identical coroutines share a single request"""
+        client = FakeAsyncClient('{"address": "MAYOR"}', delay=0.05, coalesce=True)
+
+        async def many():
+            return await asyncio.gather(*[aio.reverse_geocode(40.4, -3.7, client=client) for _ in range(50)])
+
+        results = asyncio.run(many())
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(len(results), 50)
+        results[0]["address"] = "MENOR"
+        self.assertEqual([result["address"] for result in results[1:]], ["MAYOR"] * 49)
+
+    def test_005_async_cancellation(self):
+        """Test that a cancelled caller doesn't cancel the request shared with the others"""
+        client = FakeAsyncClient('callback({"address": "MAYOR"})', delay=0.05, coalesce=True)
+
+        async def run():
+            first = asyncio.ensure_future(aio.geocode("Plaza Mayor 1", client=client))
+            second = asyncio.ensure_future(aio.geocode("Plaza Mayor 1", client=client))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run())["address"], "MAYOR")
+        self.assertEqual(len(client.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
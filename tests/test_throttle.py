@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""Tests for `throttle` module."""
+
+
+import asyncio
+import threading
+import time
+import unittest
+
+from pycartociudad import Cassette, Client, ReplayMissError, ReplayTransport, aio, reverse_geocode
+from pycartociudad.get_location_info import get_cadastral_reference
+from pycartociudad.throttle import AIMDLimiter, Throttle, TokenBucket
+from tests.utils import FakeAsyncClient, FakeSession
+
+
+class TestThrottle(unittest.TestCase):
+    """Tests for `throttle` module."""
+
+    def test_001_token_bucket(self):
+        """Test that the token bucket paces the requests after the burst"""
+        bucket = TokenBucket(rate=100, burst=5)
+        delays = [bucket.reserve() for _ in range(10)]
+        self.assertEqual(delays[:5], [0] * 5)
+        self.assertAlmostEqual(delays[9], 0.05, places=2)
+
+    def test_002_additive_increase(self):
+        """Test that the limit grows by one per round of successful requests"""
+        limiter = AIMDLimiter(initial_limit=4, max_limit=6)
+        for _ in range(4):
+            limiter.release(limiter.acquire(), success=True, latency=0.1)
+        self.assertEqual(int(limiter.limit), 4)
+        for _ in range(20):
+            limiter.release(limiter.acquire(), success=True, latency=0.1)
+        self.assertEqual(int(limiter.limit), 6)
+
+    def test_003_multiplicative_decrease_once_per_burst(self):
+        """Test that a burst of errors of requests in flight backs off once"""
+        limiter = AIMDLimiter(initial_limit=8)
+        tokens = [limiter.acquire() for _ in range(8)]
+        self.assertIsNone(limiter.try_acquire())
+        for token in tokens:
+            limiter.release(token, success=False)
+        self.assertEqual(limiter.limit, 4)
+        limiter.release(limiter.acquire(), success=False)
+        self.assertEqual(limiter.limit, 2)
+
+    def test_004_latency_spike(self):
+        """Test that a latency spike backs off"""
+        limiter = AIMDLimiter(initial_limit=8, latency_factor=3)
+        for _ in range(5):
+            limiter.release(limiter.acquire(), success=True, latency=0.1)
+        limit = limiter.limit
+        limiter.release(limiter.acquire(), success=True, latency=1.0)
+        self.assertEqual(limiter.limit, limit / 2)
+
+    def test_005_client_backs_off_on_overload(self):
+        """Test that every request path shares the per-host limits"""
+        def body(url, params):
+            if "catastro" in url:
+                return 503, "busy"
+            return '{"address": "X"}'
+
+        throttle = Throttle(initial_concurrency=4)
+        client = Client(session=FakeSession(body), throttle=throttle, retries=0)
+        with self.assertRaises(Exception):
+            get_cadastral_reference(40.0, -3.0, client=client)
+        for _ in range(4):
+            reverse_geocode(40.0, -3.0, client=client)
+        stats = throttle.stats()
+        self.assertEqual(stats["ovc.catastro.meh.es"]["concurrency_limit"], 2)
+        self.assertEqual(stats["www.cartociudad.es"]["concurrency_limit"], 4)
+        self.assertEqual(stats["www.cartociudad.es"]["in_flight"], 0)
+
+    def test_006_concurrency_is_bounded(self):
+        """Test that the requests in flight to a host never exceed its limit"""
+        lock = threading.Lock()
+        state = {"current": 0, "peak": 0}
+
+        def body(url, params):
+            with lock:
+                state["current"] += 1
+                state["peak"] = max(state["peak"], state["current"])
+            time.sleep(0.01)
+            with lock:
+                state["current"] -= 1
+            return '{"address": "X"}'
+
+        client = Client(session=FakeSession(body), throttle=Throttle(initial_concurrency=2, max_concurrency=2))
+        threads = [threading.Thread(target=reverse_geocode, args=(40.0, -3.0), kwargs={"client": client})
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(state["peak"], 2)
+
+    def test_007_retry_after(self):
+        """Test that a Retry-After answer pauses the host"""
+        throttle = Throttle()
+        throttle.release(throttle.acquire("www.cartociudad.es"), 429, retry_after="0.1")
+        start = time.monotonic()
+        throttle.acquire("www.cartociudad.es")
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
+
+    def test_008_cancelled_requests_free_their_slot(self):
+        """Test that the requests cancelled in flight by the timeouts give back their slot without backing off"""
+        throttle = Throttle(initial_concurrency=4)
+        client = FakeAsyncClient('{"address": "MAYOR"}', delay=1, throttle=throttle)
+        for _ in range(3):
+            result = asyncio.run(aio.get_location_info(40.4472, -3.7076, sources=["geocoding"], client=client,
+                                                       timeout=0.05))
+            self.assertIsInstance(result["errors"]["geocoding"], TimeoutError)
+        self.assertEqual(throttle.stats()["www.cartociudad.es"], {"concurrency_limit": 4, "in_flight": 0})
+
+        client.delay = 0
+        result = asyncio.run(aio.reverse_geocode(40.4472, -3.7076, client=client))
+        self.assertEqual(result["address"], "MAYOR")
+
+    def test_009_transport_errors_free_their_slot(self):
+        """Test that the requests failing with any error, not only the requests ones, give back their slot"""
+        throttle = Throttle(initial_concurrency=4)
+        client = Client(transport=ReplayTransport(Cassette("missing.json")), throttle=throttle, retries=0)
+        for _ in range(3):
+            with self.assertRaises(ReplayMissError):
+                reverse_geocode(40.4472, -3.7076, client=client)
+        self.assertEqual(throttle.stats()["www.cartociudad.es"]["in_flight"], 0)
+
+    def test_010_latency_shift(self):
+        """Test that a lasting rise of the latency becomes the usual one and the limit recovers"""
+        limiter = AIMDLimiter(initial_limit=12)
+        for _ in range(50):
+            limiter.release(limiter.acquire(), success=True, latency=0.1)
+        for _ in range(2000):
+            limiter.release(limiter.acquire(), success=True, latency=0.5)
+        self.assertAlmostEqual(limiter.latency, 0.5, places=2)
+        self.assertGreater(limiter.limit, 32)
+
+    def test_011_async_waiters(self):
+        """Test that the coroutines waiting for a slot are woken by the release of another thread"""
+        limiter = AIMDLimiter(initial_limit=1)
+        token = limiter.acquire()
+
+        async def wait_slot():
+            task = asyncio.ensure_future(limiter.acquire_async())
+            await asyncio.sleep(0.01)
+            self.assertFalse(task.done())
+            self.assertEqual(len(limiter._waiters), 1)
+            threading.Thread(target=limiter.release, args=(token,), kwargs={"success": None}).start()
+            return await asyncio.wait_for(task, 1)
+
+        self.assertEqual(asyncio.run(wait_slot()), token)
+        self.assertEqual(limiter.in_flight, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
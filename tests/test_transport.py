@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Tests for `transport` module."""
+
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from pycartociudad import (
+    Cassette, Client, RecordingTransport, ReplayMissError, ReplayTransport, RequestsTransport, ServiceError,
+    get_location_info, reverse_geocode
+)
+from pycartociudad import aio
+from pycartociudad.aio import (
+    AiohttpTransport, AsyncClient, AsyncRecordingTransport, AsyncReplayTransport, AsyncTransport, Response
+)
+from pycartociudad.transport import Transport, request_key
+from tests.utils import FakeSession
+
+REVERSE_JSON = '{"address": "PLAZA DE ESPAÑA", "muni": "Madrid", "tip_via": "PLAZA", "portalNumber": 3}'
+CADASTRE_XML = ('<consulta_coordenadas xmlns="http://www.catastro.meh.es/"><coordenadas><coord><pc>'
+                '<pc1>0079609</pc1><pc2>VK4707G</pc2></pc></coord></coordenadas></consulta_coordenadas>')
+CENSUS_XML = '<FeatureInfoResponse><Fields CUSEC="2807906001"/><Fields CUDIS="2807906"/></FeatureInfoResponse>'
+
+
+def service_body(url, params):
+    """Answers the reverse geocoding, cadastre and census requests"""
+    if "catastro" in url:
+        return CADASTRE_XML
+    if "ine.es" in url:
+        return CENSUS_XML
+    return REVERSE_JSON
+
+
+class MemoryTransport(AsyncTransport):
+    """Async transport answering from memory"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def send(self, url, params=None, timeout=None):
+        self.calls.append(url)
+        return Response(200, service_body(url, params).encode("utf-8"), url, headers={"Content-Type": "text/plain"})
+
+
+class TestTransport(unittest.TestCase):
+    """Tests for `transport` module."""
+
+    def setUp(self):
+        """Create a temporary cassette path"""
+        fd, self.path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        """Remove the temporary cassette"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_001_request_key(self):
+        """Test that the recorded requests are matched regardless of the order and placement of the parameters"""
+        self.assertEqual(request_key("http://a.es/path?b=2", {"a": 1.5}), "http://a.es/path?a=1.5&b=2")
+        self.assertEqual(request_key("http://a.es/path", "b=2&a=1.5"), "http://a.es/path?a=1.5&b=2")
+        self.assertEqual(request_key("http://a.es/path?q=calle%20mayor"), "http://a.es/path?q=calle+mayor")
+
+    def test_002_record_and_replay(self):
+        """Test that the recorded answers are replayed without network, and unknown requests fail"""
+        session = FakeSession(service_body)
+        client = Client(transport=RecordingTransport(self.path, RequestsTransport(session)))
+        recorded = get_location_info(40.4, -3.7, client=client)
+        self.assertEqual(len(session.calls), 3)
+        self.assertEqual(len(Cassette(self.path)), 3)
+
+        client = Client(transport=ReplayTransport(self.path))
+        self.assertEqual(get_location_info(40.4, -3.7, client=client), recorded)
+        self.assertEqual(recorded["address"], "PLAZA DE ESPAÑA")
+        self.assertEqual(len(session.calls), 3)
+        with self.assertRaises(ReplayMissError):
+            reverse_geocode(41.0, -3.7, client=client)
+
+    def test_003_replay_statuses(self):
+        """Test that the recorded error statuses are replayed, and retried by the client"""
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('{"url": "http://www.cartociudad.es/geocoder/api/geocoder/reverseGeocode?lat=40.4&lon=-3.7", '
+                    '"status": 503, "headers": {"Content-Type": "text/html"}, "body": "unavailable"}\n')
+        transport = ReplayTransport(self.path)
+        sent = []
+
+        class CountingTransport(Transport):
+            def send(self, url, params=None, timeout=None):
+                sent.append(url)
+                return transport.send(url, params, timeout)
+
+        client = Client(transport=CountingTransport(), retries=1, backoff=0)
+        with self.assertRaises(ServiceError):
+            reverse_geocode(40.4, -3.7, client=client)
+        self.assertEqual(len(sent), 2)
+
+    def test_004_async_record_and_replay(self):
+        """Test the asyncio transports with a custom in-memory transport"""
+        memory = MemoryTransport()
+
+        async def record():
+            client = AsyncClient(transport=AsyncRecordingTransport(self.path, memory))
+            return await aio.get_location_info(40.4, -3.7, client=client)
+
+        async def replay():
+            client = AsyncClient(transport=AsyncReplayTransport(self.path))
+            return await aio.get_location_info(40.4, -3.7, client=client)
+
+        recorded = asyncio.run(record())
+        self.assertEqual(len(memory.calls), 3)
+        self.assertEqual(asyncio.run(replay()), recorded)
+        self.assertEqual(recorded["cadastral_ref"], "0079609VK4707G")
+        self.assertEqual(len(memory.calls), 3)
+
+    def test_005_record_through_the_client_session(self):
+        """Test that a recording transport without inner transport sends the requests with the client session"""
+        session = FakeSession(service_body)
+        client = Client(session=session, transport=RecordingTransport(self.path), compression=False)
+        reverse_geocode(40.4, -3.7, client=client)
+        self.assertEqual(len(session.calls), 1)
+        self.assertEqual(len(Cassette(self.path)), 1)
+        self.assertIs(client.transport.transport.session, session)
+        self.assertEqual(session.headers["Accept-Encoding"], "identity")
+
+        transport = AsyncRecordingTransport(self.path)
+        AsyncClient(transport=transport)
+        self.assertIsInstance(transport.transport, AiohttpTransport)
+
+
+if __name__ == '__main__':
+    unittest.main()
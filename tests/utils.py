@@ -0,0 +1,93 @@
+"""Offline test helpers shared by the test modules."""
+
+import asyncio
+import threading
+
+import requests
+
+from pycartociudad import Client
+from pycartociudad.aio import AsyncClient, Response
+
+
+class FakeResponse:
+    """Minimal stand-in of ``requests.Response``"""
+
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeClient(Client):
+    """Client that answers every request without network and records the requested urls.
+
+    ``body`` is either the canned response text or a function receiving (url, params) and returning it.
+    """
+
+    def __init__(self, body, **kwargs):
+        super().__init__(**kwargs)
+        self.body = body
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        with self._lock:
+            self.calls.append((url, params))
+        text = self.body(url, params) if callable(self.body) else self.body
+        return FakeResponse(text)
+
+
+class FakeAsyncClient(AsyncClient):
+    """Async client that answers every request without network and records the requested urls.
+
+    ``body`` is either the canned response text or a function receiving (url, params) and returning it, or a
+    (status, text) tuple.
+    """
+
+    def __init__(self, body, delay=0, **kwargs):
+        super().__init__(**kwargs)
+        self.body = body
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def _request(self, url, params, timeout):
+        self.calls.append((url, params))
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            answer = self.body(url, params) if callable(self.body) else self.body
+            status_code, text = answer if isinstance(answer, tuple) else (200, answer)
+            return Response(status_code, text.encode("utf-8"), url)
+        finally:
+            self.in_flight -= 1
+
+
+class FakeSession(requests.Session):
+    """Session answering every request without network, so the real ``Client`` logic is exercised.
+
+    ``body`` is a function receiving (url, params) and returning the response text, or a (status, text) tuple.
+    """
+
+    def __init__(self, body):
+        super().__init__()
+        self.body = body
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, params=None, timeout=None, **kwargs):
+        with self._lock:
+            self.calls.append((url, params))
+        answer = self.body(url, params)
+        status_code, text = answer if isinstance(answer, tuple) else (200, answer)
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = text.encode("utf-8")
+        response.encoding = "utf-8"
+        response.url = url
+        return response